@@ -0,0 +1,378 @@
+"""
+Backend truy vấn cube cho dashboard: filter và GROUP BY được đẩy xuống nơi
+lưu cube, chỉ kết quả đã tổng hợp quay về process Streamlit.
+
+Mọi backend trả lời cùng các truy vấn trên cube của analytics.cube:
+  query(cube, by, filters, period)      -> SUM(measure) GROUP BY by (by=(): Series tổng)
+  cells(cube, columns, filters, period) -> các dòng đã lọc (sketch HLL của cube engagement)
+  distinct(cube, column)                -> giá trị khác nhau của một cột
+filters: {chiều: danh sách giá trị}; period: (ngày đầu, ngày cuối) áp lên cột
+ngày của cube (DATE_COLUMNS), cube không có cột ngày bỏ qua period.
+
+  local:    cube trong bộ nhớ (dựng từ CSV hoặc Parquet nguồn, analytics.cube.get_cubes)
+  arrow:    quét file data/cubes/*.parquet bằng pyarrow.dataset, predicate được
+            đẩy xuống row group, chỉ đọc các cột cần
+  bigquery: cube đã publish lên một dataset BigQuery (publish_cubes), mỗi truy
+            vấn là một câu SQL có tham số; FakeBigQueryClient (DuckDB) thay cho
+            client thật để chạy offline
+
+Dashboard chọn backend bằng ZOMBIE_BACKEND (local / arrow / bigquery / fake) và
+ZOMBIE_BQ_DATASET (project.dataset).
+
+    python analytics/backends.py --backend arrow --tiers "Tier 1" --cube daily --by date
+    python analytics/backends.py --publish --dataset my-project.zombie_cubes
+"""
+import os
+import re
+import sys
+import argparse
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir
+from analytics.cube import CUBE_KEYS, DIMENSIONS, get_cubes, cube_files, row_index
+from analytics.profiling import profiled
+
+BACKEND_ENV = "ZOMBIE_BACKEND"
+DATASET_ENV = "ZOMBIE_BQ_DATASET"
+BACKENDS = ['local', 'arrow', 'bigquery', 'fake']
+TABLE_PREFIX = "cube_"
+# Cột ngày mà period lọc theo, theo cube
+DATE_COLUMNS = {
+    'daily': 'date',
+    'engagement': 'date',
+    'wallet': 'date',
+    'packs': 'date',
+    'placements': 'date',
+    'retention': 'cohort_date',
+    'cohort_users': 'install_date',
+    'cohort_revenue': 'install_date',
+}
+NON_ADDITIVE = {'registers'}  # Sketch HLL: gộp bằng max, không SUM
+
+
+def _day(value):
+    return None if value is None else pd.Timestamp(value).normalize()
+
+
+class CubeBackend(ABC):
+    """Phần chung: danh sách measure, chuẩn hóa kết quả; lớp con cài columns / distinct / _query / _cells."""
+
+    name = None
+
+    @abstractmethod
+    def columns(self, cube_name):
+        """Tên các cột của cube."""
+
+    @abstractmethod
+    def distinct(self, cube_name, column):
+        """Giá trị khác nhau (khác null, đã sắp) của một cột."""
+
+    @abstractmethod
+    def _query(self, cube_name, by, measures, filters, period):
+        """DataFrame các cột by + measures: SUM theo by, hoặc các dòng đã lọc khi by rỗng."""
+
+    @abstractmethod
+    def _cells(self, cube_name, columns, filters, period):
+        """DataFrame các cột `columns` của các dòng đã lọc."""
+
+    def measures(self, cube_name):
+        return [c for c in self.columns(cube_name)
+                if c not in DIMENSIONS and c not in CUBE_KEYS[cube_name] and c not in NON_ADDITIVE]
+
+    @profiled('backend.query')
+    def query(self, cube_name, by=(), filters=None, period=None):
+        """SUM các measure theo `by` sau khi lọc; kết quả giống analytics.cube.rollup."""
+        by, measures = list(by), self.measures(cube_name)
+        frame = self._query(cube_name, by, measures, filters or {}, self._period(cube_name, period))
+        if not by:
+            return frame[measures].sum()
+        for column in set(by) & set(DATE_COLUMNS.values()):
+            frame[column] = pd.to_datetime(frame[column])
+        return frame.set_index(by)[measures].sort_index()
+
+    @profiled('backend.cells')
+    def cells(self, cube_name, columns, filters=None, period=None):
+        """Các dòng (chỉ cột `columns`) của cube sau khi lọc."""
+        return self._cells(cube_name, list(columns), filters or {}, self._period(cube_name, period))
+
+    def _period(self, cube_name, period):
+        if period is None or cube_name not in DATE_COLUMNS:
+            return None
+        return DATE_COLUMNS[cube_name], _day(period[0]), _day(period[1])
+
+
+class LocalBackend(CubeBackend):
+    """Cube pandas trong bộ nhớ; lọc tier bằng bảng tier -> vị trí dòng dựng sẵn."""
+
+    name = 'local'
+
+    def __init__(self, cubes):
+        self.cubes = cubes
+        self._tier_rows = {name: row_index(cube, 'tier') for name, cube in cubes.items()}
+
+    @classmethod
+    def from_data_dir(cls, data_dir):
+        return cls(get_cubes(data_dir))
+
+    def columns(self, cube_name):
+        return list(self.cubes[cube_name].columns)
+
+    def distinct(self, cube_name, column):
+        values = self.cubes[cube_name][column]
+        return list(values.cat.categories) if hasattr(values, 'cat') else sorted(values.dropna().unique())
+
+    @profiled('backend.tier_filter')
+    def rows(self, cube_name, filters, period):
+        cube = self.cubes[cube_name]
+        if 'tier' in filters:
+            empty = np.empty(0, dtype=np.intp)
+            rows = np.sort(np.concatenate([empty] + [self._tier_rows[cube_name].get(t, empty)
+                                                     for t in filters['tier']]))
+        else:
+            rows = np.arange(len(cube))
+        mask = np.ones(len(rows), dtype=bool)
+        for dim, values in filters.items():
+            if dim != 'tier':
+                mask &= cube[dim].take(rows).isin(list(values)).to_numpy()
+        if period is not None:
+            column, start, end = period
+            dates = cube[column].take(rows)
+            if start is not None:
+                mask &= (dates >= start).to_numpy()
+            if end is not None:
+                mask &= (dates <= end).to_numpy()
+        return rows[mask]
+
+    def _query(self, cube_name, by, measures, filters, period):
+        selected = self.cubes[cube_name].take(self.rows(cube_name, filters, period))
+        if not by:
+            return selected[measures]
+        return selected.groupby(by, observed=True)[measures].sum().reset_index()
+
+    def _cells(self, cube_name, columns, filters, period):
+        return self.cubes[cube_name].take(self.rows(cube_name, filters, period))[columns]
+
+
+class ArrowBackend(CubeBackend):
+    """Quét cube Parquet (data/cubes/) bằng pyarrow.dataset: predicate + chọn cột đẩy xuống lúc đọc."""
+
+    name = 'arrow'
+
+    def __init__(self, paths):
+        self.datasets = {name: ds.dataset(path, format='parquet') for name, path in paths.items()}
+
+    @classmethod
+    def from_data_dir(cls, data_dir):
+        return cls(cube_files(data_dir))
+
+    def columns(self, cube_name):
+        return self.datasets[cube_name].schema.names
+
+    def distinct(self, cube_name, column):
+        values = self.datasets[cube_name].to_table(columns=[column]).column(column)
+        return sorted(pc.unique(values.combine_chunks()).to_pylist()) if len(values) else []
+
+    def _filter(self, cube_name, filters, period):
+        schema = self.datasets[cube_name].schema
+        expression = None
+        for dim, values in filters.items():
+            field = ds.field(dim)
+            if pa.types.is_null(schema.field(dim).type):  # Cube rỗng: cột toàn null
+                field = field.cast(pa.string())
+            part = field.isin(pa.array([str(v) for v in values], pa.string()))
+            expression = part if expression is None else expression & part
+        if period is not None:
+            column, start, end = period
+            for bound, compare in ((start, '__ge__'), (end, '__le__')):
+                if bound is not None:
+                    part = getattr(ds.field(column), compare)(pa.scalar(bound, type=schema.field(column).type))
+                    expression = part if expression is None else expression & part
+        return expression
+
+    def _query(self, cube_name, by, measures, filters, period):
+        table = self.datasets[cube_name].to_table(columns=by + measures,
+                                                  filter=self._filter(cube_name, filters, period))
+        if by:
+            table = table.group_by(by).aggregate([(m, 'sum') for m in measures])
+            table = table.rename_columns([c[:-len('_sum')] if c.endswith('_sum') else c
+                                          for c in table.column_names])
+        return table.to_pandas()
+
+    def _cells(self, cube_name, columns, filters, period):
+        return self.datasets[cube_name].to_table(columns=columns,
+                                                 filter=self._filter(cube_name, filters, period)).to_pandas()
+
+
+class BigQueryBackend(CubeBackend):
+    """Cube trong BigQuery (bảng <dataset>.cube_<tên>); filter / GROUP BY chạy trên warehouse."""
+
+    name = 'bigquery'
+
+    def __init__(self, client, dataset, prefix=TABLE_PREFIX):
+        self.client = client
+        self.dataset = dataset
+        self.prefix = prefix
+        self._columns = {}
+
+    def table(self, cube_name):
+        return f"`{self.dataset}.{self.prefix}{cube_name}`"
+
+    def _run(self, sql, params=()):
+        from google.cloud import bigquery
+        config = bigquery.QueryJobConfig(query_parameters=list(params))
+        return self.client.query(sql, job_config=config).result().to_dataframe()
+
+    def columns(self, cube_name):
+        if cube_name not in self._columns:
+            self._columns[cube_name] = list(self._run(f"SELECT * FROM {self.table(cube_name)} LIMIT 0").columns)
+        return self._columns[cube_name]
+
+    def distinct(self, cube_name, column):
+        frame = self._run(f"SELECT DISTINCT {column} FROM {self.table(cube_name)} "
+                          f"WHERE {column} IS NOT NULL ORDER BY {column}")
+        return frame[column].tolist()
+
+    def _where(self, filters, period):
+        from google.cloud import bigquery
+        clauses, params = [], []
+        for i, (dim, values) in enumerate(filters.items()):
+            clauses.append(f"{dim} IN UNNEST(@f{i})")
+            params.append(bigquery.ArrayQueryParameter(f"f{i}", 'STRING', [str(v) for v in values]))
+        if period is not None:
+            column, start, end = period
+            for name, bound, op in (('start', start, '>='), ('end', end, '<=')):
+                if bound is not None:
+                    clauses.append(f"{column} {op} @{name}")
+                    params.append(bigquery.ScalarQueryParameter(name, 'DATE', bound.date()))
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def _query(self, cube_name, by, measures, filters, period):
+        where, params = self._where(filters, period)
+        sums = ', '.join(f"SUM({m}) AS {m}" for m in measures)
+        group = f" GROUP BY {', '.join(by)}" if by else ""
+        return self._run(f"SELECT {', '.join(by + [sums])} FROM {self.table(cube_name)}{where}{group}", params)
+
+    def _cells(self, cube_name, columns, filters, period):
+        where, params = self._where(filters, period)
+        return self._run(f"SELECT {', '.join(columns)} FROM {self.table(cube_name)}{where}", params)
+
+
+def publish_cubes(client, dataset, cubes, prefix=TABLE_PREFIX):
+    """Ghi đè các cube thành bảng <dataset>.<prefix><cube>; cột ngày thành DATE."""
+    from google.cloud import bigquery
+    for name, cube in cubes.items():
+        frame = cube.copy()
+        for dim in DIMENSIONS:
+            frame[dim] = frame[dim].astype(str)
+        dates = sorted(set(DATE_COLUMNS.values()) & set(frame.columns))
+        for column in dates:
+            frame[column] = pd.to_datetime(frame[column]).dt.date
+        # Khai báo kiểu DATE: cube rỗng không đoán được kiểu từ dữ liệu
+        config = bigquery.LoadJobConfig(write_disposition='WRITE_TRUNCATE',
+                                        schema=[bigquery.SchemaField(column, 'DATE') for column in dates])
+        client.load_table_from_dataframe(frame, f"{dataset}.{prefix}{name}", job_config=config).result()
+
+
+# LOCAL FAKE
+
+class _FakeJob:
+    def __init__(self, frame=None):
+        self.frame = frame
+
+    def result(self):
+        return self
+
+    def to_dataframe(self):
+        return self.frame
+
+
+class FakeBigQueryClient:
+    """Client giả dùng DuckDB: các hàm query / load_table_from_dataframe mà backend dùng, cú pháp SQL BigQuery."""
+
+    _TABLE = re.compile(r'`[\w-]+\.[\w-]+\.(\w+)`|`[\w-]+\.(\w+)`')
+    _UNNEST = re.compile(r'IN\s+UNNEST\(@(\w+)\)', re.IGNORECASE)
+
+    def __init__(self, database=':memory:'):
+        import duckdb
+        self.connection = duckdb.connect(database)
+
+    def load_table_from_dataframe(self, frame, table_id, job_config=None):
+        table = table_id.split('.')[-1]
+        self.connection.register('_frame', frame)
+        self.connection.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM _frame")
+        self.connection.unregister('_frame')
+        for field in (job_config.schema or []) if job_config else []:
+            self.connection.execute(f"ALTER TABLE {table} ALTER {field.name} TYPE {field.field_type} "
+                                    f"USING CAST({field.name} AS {field.field_type})")
+        return _FakeJob()
+
+    def query(self, sql, job_config=None):
+        sql = self._TABLE.sub(lambda m: m.group(1) or m.group(2), sql)
+        sql = self._UNNEST.sub(r'IN (SELECT UNNEST($\1))', sql)
+        sql = re.sub(r'@(\w+)', r'$\1', sql)
+        params = {p.name: p.values if hasattr(p, 'values') else p.value
+                  for p in (job_config.query_parameters if job_config else [])}
+        return _FakeJob(self.connection.execute(sql, params).df())
+
+
+def open_backend(kind, data_dir=None, dataset=None):
+    """Backend theo tên (BACKENDS); None nếu backend cục bộ mà không có data_dir."""
+    if kind in ('local', 'arrow', 'fake') and data_dir is None:
+        return None
+    if kind == 'local':
+        return LocalBackend.from_data_dir(data_dir)
+    if kind == 'arrow':
+        return ArrowBackend.from_data_dir(data_dir)
+    if kind == 'fake':
+        client, dataset = FakeBigQueryClient(), dataset or 'local.zombie_cubes'
+        publish_cubes(client, dataset, get_cubes(data_dir))
+        return BigQueryBackend(client, dataset)
+    if kind == 'bigquery':
+        if not dataset:
+            raise ValueError(f"BigQuery backend needs a dataset ({DATASET_ENV}=project.dataset)")
+        from google.cloud import bigquery
+        return BigQueryBackend(bigquery.Client(project=dataset.split('.')[0]), dataset)
+    raise ValueError(f"Unknown backend {kind!r}, expected one of {BACKENDS}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - truy vấn cube qua backend (pushdown)")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--backend', choices=BACKENDS, default=os.environ.get(BACKEND_ENV, 'local'))
+    parser.add_argument('--dataset', default=os.environ.get(DATASET_ENV), help="project.dataset của BigQuery")
+    parser.add_argument('--publish', action='store_true', help="Publish cube của --data-dir lên --dataset rồi thoát")
+    parser.add_argument('--cube', choices=list(CUBE_KEYS), default='daily')
+    parser.add_argument('--by', nargs='*', default=['date'])
+    parser.add_argument('--tiers', nargs='*', default=None)
+    parser.add_argument('--start', default=None, help="YYYY-MM-DD")
+    parser.add_argument('--end', default=None, help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None and (args.publish or args.backend != 'bigquery'):
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+    if args.publish:
+        if not args.dataset:
+            parser.error("--publish cần --dataset project.dataset")
+        from google.cloud import bigquery
+        publish_cubes(bigquery.Client(project=args.dataset.split('.')[0]), args.dataset, get_cubes(data_dir))
+        print(f"-> Đã publish {len(CUBE_KEYS)} cubes lên {args.dataset}")
+        return
+    backend = open_backend(args.backend, data_dir, args.dataset)
+    filters = {'tier': args.tiers} if args.tiers else None
+    period = (args.start, args.end) if args.start or args.end else None
+    print(backend.query(args.cube, args.by, filters, period).to_string())
+
+
+if __name__ == "__main__":
+    main()
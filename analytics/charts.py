@@ -0,0 +1,105 @@
+"""
+Thu gọn dữ liệu trước khi vẽ: số điểm / cột / nhóm gửi xuống trình duyệt có
+giới hạn, không phụ thuộc lượng dữ liệu.
+
+  downsample        chuỗi thời gian -> tối đa POINT_BUDGET điểm bằng LTTB
+                    (Largest-Triangle-Three-Buckets, giữ hình dạng, đỉnh / đáy)
+  top_categories    chỉ giữ các hạng mục lớn nhất, phần còn lại gộp vào OTHER
+  bin_rows          gộp các dòng liền nhau (cộng được) thành khoảng, vd "Lvl 1-5"
+  coarsen_cohorts   gộp cohort liền nhau của ma trận retention
+
+Các hàm trả lại nguyên input khi đã nằm trong giới hạn.
+"""
+import numpy as np
+import pandas as pd
+
+POINT_BUDGET = 1000
+WEBGL_POINTS = 500
+MAX_CATEGORIES = 10
+MAX_BARS = 60
+MAX_COHORT_ROWS = 90
+OTHER = 'Other'
+
+
+def lttb(x, y, n_out):
+    """Chỉ số (tăng dần) của n_out điểm giữ lại theo LTTB; luôn giữ điểm đầu và cuối."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # n_out - 2 bucket chia đều các điểm 1..n-2
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Đỉnh thứ ba: trung bình bucket kế tiếp (bucket cuối -> điểm cuối)
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        cx, cy = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _positions(index):
+    """Trục x dạng số cho LTTB: thời gian -> epoch, số giữ nguyên, còn lại -> thứ tự."""
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(np.float64)
+    values = np.asarray(index)
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(np.float64)
+    return np.arange(len(values), dtype=np.float64)
+
+
+def downsample(series, max_points=POINT_BUDGET):
+    """Series (index là trục x, đã sắp xếp) rút còn tối đa max_points điểm bằng LTTB."""
+    if len(series) <= max_points:
+        return series
+    # NaN chỉ được lấp để chọn điểm; giá trị trả về vẫn là giá trị gốc
+    values = series.astype(np.float64).interpolate(limit_direction='both').fillna(0)
+    return series.iloc[lttb(_positions(series.index), values.to_numpy(), max_points)]
+
+
+def top_categories(series, max_categories=MAX_CATEGORIES, other=OTHER):
+    """Series cộng được (doanh thu, số user...): max_categories - 1 hạng mục lớn nhất + một dòng `other`."""
+    if len(series) <= max_categories:
+        return series
+    top = series.nlargest(max_categories - 1)
+    kept = series[series.index.isin(top.index)]
+    rest = pd.Series([series.drop(top.index).sum()], index=pd.Index([other], name=series.index.name))
+    return pd.concat([kept.set_axis(kept.index.astype(object)), rest]).rename(series.name)
+
+
+def bin_rows(frame, max_rows=MAX_BARS, label='{first}-{last}'):
+    """Gộp (cộng) các dòng liền nhau thành tối đa max_rows khoảng; index mới là nhãn khoảng."""
+    n = len(frame)
+    if n <= max_rows:
+        return frame
+    size = -(-n // max_rows)
+    groups = np.arange(n) // size
+    binned = frame.groupby(groups).sum()
+    first = frame.index[::size]
+    last = frame.index[np.minimum(np.arange(size - 1, n + size - 1, size), n - 1)]
+    binned.index = [label.format(first=f, last=l) if f != l else str(f) for f, l in zip(first, last)]
+    return binned
+
+
+def coarsen_cohorts(users, max_rows=MAX_COHORT_ROWS):
+    """(users, rates, số cohort mỗi dòng) của ma trận retention cohort x Dn (NaN = chưa tới ngày).
+
+    Mỗi dòng gộp `size` cohort liền nhau, index là ngày của cohort đầu; ô Dn
+    chỉ tính các cohort đã tới ngày n (tử và mẫu cùng tập cohort).
+    """
+    n = len(users)
+    if n <= max_rows:
+        return users, users.div(users[0], axis=0), 1
+    size = -(-n // max_rows)
+    groups = np.arange(n) // size
+    merged = users.groupby(groups).sum(min_count=1)
+    base = users.notna().mul(users[0], axis=0).groupby(groups).sum()
+    rates = merged / base.where(base > 0)
+    merged.index = rates.index = users.index[::size]
+    return merged, rates, size
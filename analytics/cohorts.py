@@ -0,0 +1,258 @@
+"""
+Cohort LTV / ROAS: ma trận doanh thu install cohort x ngày kể từ install.
+
+User được gom theo segment (tổ hợp tier x source x campaign_id x country x os)
+và cohort (ngày install). Ma trận giữ dạng dense:
+  users[segment, cohort], spend[segment, cohort]   (số install, tổng CPI)
+  revenue[kind][segment, cohort, day]               (kind: 'iap' / 'ads')
+Thêm doanh thu là một lần bincount (scatter-add) trên ô segment x cohort x day;
+add_users / add_revenue có thể gọi lại khi có dữ liệu mới, các trục tự mở
+rộng. Truy vấn theo breakdown bất kỳ chỉ cộng các segment cùng nhóm.
+
+    python analytics/cohorts.py --data-dir data --by source campaign_id
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir, load_tables
+
+BREAKDOWNS = ['tier', 'source', 'campaign_id', 'country', 'os']
+REVENUE_KINDS = ('iap', 'ads')
+LTV_DAYS = 30
+ROAS_DAYS = (0, 7, 30)
+
+
+def _day(values):
+    return pd.to_datetime(pd.Series(values)).dt.normalize().to_numpy().astype('datetime64[D]')
+
+
+class CohortMatrix:
+    """Ma trận doanh thu cohort, cập nhật tăng dần."""
+
+    def __init__(self):
+        self.segments = pd.DataFrame({dim: pd.Series(dtype=object) for dim in BREAKDOWNS})
+        self.cohorts = np.empty(0, dtype='datetime64[D]')
+        self.users = np.zeros((0, 0), dtype=np.int64)
+        self.spend = np.zeros((0, 0))
+        self.revenue = {kind: np.zeros((0, 0, 1)) for kind in REVENUE_KINDS}
+        self.as_of = None  # Ngày mới nhất có doanh thu (cohort chưa đủ tuổi -> NaN)
+        self._user_ids = pd.Index([])
+        self._user_segment = np.empty(0, dtype=np.int64)
+        self._user_cohort = np.empty(0, dtype=np.int64)
+
+    # BUILD
+
+    def _grow(self, n_segments, n_cohorts, n_days):
+        """Mở rộng các mảng (giữ nguyên dữ liệu cũ)."""
+        s, c, d = self.revenue[REVENUE_KINDS[0]].shape
+        pad2 = ((0, n_segments - s), (0, n_cohorts - c))
+        if (n_segments, n_cohorts) != (s, c):
+            self.users = np.pad(self.users, pad2)
+            self.spend = np.pad(self.spend, pad2)
+        if (n_segments, n_cohorts, n_days) != (s, c, d):
+            for kind in REVENUE_KINDS:
+                self.revenue[kind] = np.pad(self.revenue[kind], pad2 + ((0, n_days - d),))
+
+    def _locate(self, frame):
+        """(segment, cohort) của từng dòng có các cột BREAKDOWNS + install_date; thêm segment / cohort mới."""
+        keys = pd.MultiIndex.from_frame(frame[BREAKDOWNS].astype(object).fillna('Unknown').astype(str))
+        known = pd.MultiIndex.from_frame(self.segments) if len(self.segments) else None
+        segment = known.get_indexer(keys) if known is not None else np.full(len(keys), -1)
+        if (segment < 0).any():
+            new = keys[segment < 0].unique()
+            self.segments = pd.concat([self.segments, new.to_frame(index=False)], ignore_index=True)
+            segment = pd.MultiIndex.from_frame(self.segments).get_indexer(keys)
+
+        dates = _day(frame['install_date'])
+        new_dates = np.setdiff1d(dates, self.cohorts)
+        self.cohorts = np.concatenate([self.cohorts, new_dates])
+        cohort = pd.Index(self.cohorts).get_indexer(dates)
+        self._grow(len(self.segments), len(self.cohorts), self.revenue[REVENUE_KINDS[0]].shape[2])
+        return segment, cohort
+
+    def add_users(self, ua):
+        """Thêm install mới (ua: user_id, install_date, BREAKDOWNS, cpi); user đã có bị bỏ qua."""
+        ua = ua.drop_duplicates('user_id')
+        ua = ua[self._user_ids.get_indexer(ua['user_id']) < 0]
+        segment, cohort = self._locate(ua)
+        cell = segment * len(self.cohorts) + cohort
+        size = self.users.size
+        self.users += np.bincount(cell, minlength=size).reshape(self.users.shape)
+        cpi = ua['cpi'].to_numpy(dtype=float)
+        self.spend += np.bincount(cell, weights=cpi, minlength=size).reshape(self.spend.shape)
+        self._user_ids = self._user_ids.append(pd.Index(ua['user_id']))
+        self._user_segment = np.concatenate([self._user_segment, segment])
+        self._user_cohort = np.concatenate([self._user_cohort, cohort])
+        return self
+
+    def _scatter(self, kind, segment, cohort, day, amount):
+        keep = day >= 0
+        segment, cohort, day, amount = segment[keep], cohort[keep], day[keep], amount[keep]
+        if len(day):
+            self._grow(len(self.segments), len(self.cohorts),
+                       max(self.revenue[kind].shape[2], int(day.max()) + 1))
+        shape = self.revenue[kind].shape
+        cell = (segment * shape[1] + cohort) * shape[2] + day
+        self.revenue[kind] += np.bincount(cell, weights=amount, minlength=int(np.prod(shape))).reshape(shape)
+
+    def add_revenue(self, kind, user_id, timestamp, amount):
+        """Cộng doanh thu (kind: 'iap' / 'ads') vào ô của user; user chưa add_users bị bỏ qua."""
+        user = self._user_ids.get_indexer(pd.Series(user_id))
+        known = user >= 0
+        user = user[known]
+        dates = _day(pd.Series(timestamp)[known])
+        cohort = self._user_cohort[user]
+        day = (dates - self.cohorts[cohort]).astype(np.int64)
+        self._scatter(kind, self._user_segment[user], cohort, day, np.asarray(amount, dtype=float)[known])
+        if len(dates):
+            self.as_of = max(self.as_of, dates.max()) if self.as_of is not None else dates.max()
+        return self
+
+    @classmethod
+    def from_tables(cls, ua, iap=None, ads=None):
+        """Dựng từ các bảng đã chuẩn hóa (analytics.sources.load_tables)."""
+        matrix = cls().add_users(ua)
+        if iap is not None:
+            matrix.add_revenue('iap', iap['user_id'], iap['timestamp'], iap['price'])
+        if ads is not None:
+            matrix.add_revenue('ads', ads['user_id'], ads['timestamp'], ads['revenue'])
+        return matrix
+
+    @classmethod
+    def from_cubes(cls, cubes):
+        """Dựng từ cube cohort_users / cohort_revenue (analytics.cube), không cần dữ liệu thô."""
+        matrix = cls()
+        users = cubes['cohort_users']
+        segment, cohort = matrix._locate(users)
+        cell = segment * len(matrix.cohorts) + cohort
+        size = matrix.users.size
+        installs = np.bincount(cell, weights=users['users'], minlength=size)
+        matrix.users += installs.reshape(matrix.users.shape).astype(np.int64)
+        matrix.spend += np.bincount(cell, weights=users['cpi'], minlength=size).reshape(matrix.spend.shape)
+
+        revenue = cubes['cohort_revenue']
+        segment, cohort = matrix._locate(revenue)
+        day = revenue['day_diff'].to_numpy(dtype=np.int64)
+        for kind, column in (('iap', 'iap_revenue'), ('ads', 'ad_revenue')):
+            matrix._scatter(kind, segment, cohort, day, revenue[column].to_numpy(dtype=float))
+        if len(revenue):
+            matrix.as_of = (_day(revenue['install_date']) + day).max()
+        return matrix
+
+    # QUERY
+
+    def _groups(self, by, filters):
+        """(vị trí segment được chọn, mã nhóm của từng segment, nhãn nhóm)."""
+        mask = np.ones(len(self.segments), dtype=bool)
+        for dim, values in (filters or {}).items():
+            mask &= self.segments[dim].isin([str(v) for v in values]).to_numpy()
+        selected = np.flatnonzero(mask)
+        if not by:
+            return selected, np.zeros(len(selected), dtype=np.int64), pd.Index(['All'], name='group')
+        grouped = self.segments.iloc[selected].groupby(list(by), sort=True)
+        labels = grouped.size().index
+        return selected, grouped.ngroup().to_numpy(), labels
+
+    def _sum(self, array, selected, codes, n_groups):
+        out = np.zeros((n_groups,) + array.shape[1:], dtype=array.dtype)
+        np.add.at(out, codes, array[selected])
+        return out
+
+    def matrix(self, by=(), filters=None, kinds=REVENUE_KINDS):
+        """(nhãn nhóm, users[G, C], spend[G, C], revenue[G, C, D]) theo breakdown."""
+        selected, codes, labels = self._groups(by, filters)
+        users = self._sum(self.users, selected, codes, len(labels))
+        spend = self._sum(self.spend, selected, codes, len(labels))
+        revenue = sum(self._sum(self.revenue[kind], selected, codes, len(labels)) for kind in kinds)
+        return labels, users, spend, revenue
+
+    def _days(self, revenue, max_day):
+        """Cắt / mở rộng trục ngày về 0..max_day."""
+        d = revenue.shape[-1]
+        if d > max_day + 1:
+            return revenue[..., :max_day + 1]
+        return np.pad(revenue, [(0, 0)] * (revenue.ndim - 1) + [(0, max_day + 1 - d)])
+
+    def _age(self):
+        """Số ngày mỗi cohort đã có (NaN-mask cho ô chưa tới)."""
+        if self.as_of is None:
+            return np.full(len(self.cohorts), -1)
+        return (self.as_of - self.cohorts).astype(np.int64)
+
+    def cohort_ltv(self, by=(), filters=None, max_day=LTV_DAYS, kinds=REVENUE_KINDS):
+        """LTV cộng dồn theo (nhóm, ngày install) x ngày 0..max_day; ô cohort chưa đủ tuổi = NaN."""
+        labels, users, _, revenue = self.matrix(by, filters, kinds)
+        ltv = np.cumsum(self._days(revenue, max_day), axis=2) / np.where(users > 0, users, np.nan)[:, :, None]
+        ltv[:, self._age()[:, None] < np.arange(max_day + 1)[None, :]] = np.nan
+        order = np.argsort(self.cohorts)
+        frame = pd.DataFrame(ltv[:, order].reshape(-1, max_day + 1), columns=pd.RangeIndex(max_day + 1, name='day'))
+        index = pd.MultiIndex.from_product([labels, pd.DatetimeIndex(self.cohorts[order], name='install_date')])
+        frame.index = index
+        return frame[users[:, order].reshape(-1) > 0]
+
+    def ltv_curve(self, by=(), filters=None, max_day=LTV_DAYS, kinds=REVENUE_KINDS, mature_only=False):
+        """LTV cộng dồn của mỗi nhóm (mọi cohort) theo ngày 0..max_day.
+
+        mature_only=False: chia cho toàn bộ user của nhóm (như dashboard);
+        True: ngày d chỉ tính các cohort đã đủ d ngày.
+        """
+        labels, users, _, revenue = self.matrix(by, filters, kinds)
+        cumulative = np.cumsum(self._days(revenue, max_day), axis=2)
+        if mature_only:
+            mature = self._age()[:, None] >= np.arange(max_day + 1)[None, :]
+            total = (cumulative * mature[None]).sum(axis=1)
+            users = (users[:, :, None] * mature[None]).sum(axis=1)
+        else:
+            total = cumulative.sum(axis=1)
+            users = users.sum(axis=1)[:, None]
+        ltv = total / np.where(users > 0, users, np.nan)
+        return pd.DataFrame(ltv, index=labels, columns=pd.RangeIndex(max_day + 1, name='day'))
+
+    def roas(self, by=('source',), filters=None, kinds=REVENUE_KINDS, days=ROAS_DAYS):
+        """Bảng UA theo breakdown như sql/07_UA_ROAS.sql, thêm ROAS ngày N (roas_dN, %)."""
+        labels, users, spend, revenue = self.matrix(by, filters, kinds)
+        installs = users.sum(axis=1)
+        total_spend = spend.sum(axis=1)
+        cumulative = np.cumsum(self._days(revenue, max(days)), axis=2).sum(axis=1)
+        total_revenue = revenue.sum(axis=(1, 2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            report = pd.DataFrame({
+                'installs': installs,
+                'total_spend': total_spend.round(2),
+                'total_revenue': total_revenue.round(2),
+                'avg_cpi': (total_spend / installs).round(2),
+                'arpu': (total_revenue / installs).round(2),
+                'roas_percentage': np.where(total_spend > 0, total_revenue / total_spend * 100, np.nan).round(2),
+                **{f"roas_d{d}": np.where(total_spend > 0, cumulative[:, d] / total_spend * 100, np.nan).round(2)
+                   for d in days},
+            }, index=labels)
+        report = report[report['installs'] > 0]
+        return report.sort_values('roas_percentage', ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - cohort LTV / ROAS")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--by', nargs='+', default=['source'], choices=BREAKDOWNS, help="Breakdown (mặc định: source)")
+    parser.add_argument('--iap-only', action='store_true', help="Chỉ tính doanh thu IAP (giống sql/07_UA_ROAS.sql)")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None:
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+    ua, _, iap, ads = load_tables(data_dir)
+    matrix = CohortMatrix.from_tables(ua, iap, None if args.iap_only else ads)
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        print(matrix.roas(args.by).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Rollup cube (OLAP) cho dashboard: tổng hợp sẵn theo tier x source x country x os.
+
+Mỗi user thuộc đúng một tổ hợp chiều (segment), nên các measure đếm theo user
+trong một ngày / một level (DAU, payers, số user dừng ở level) cộng dồn được
+giữa các segment. Dashboard chỉ cần lọc segment và cộng lại, độ trễ phụ thuộc
+số ngày x số segment chứ không phụ thuộc số event.
+
+Các cube (mỗi cube là một DataFrame nhỏ, lưu ở data/cubes/<cube>.parquet):
+  daily:      date -> dau, events, installs, iap_revenue, purchases, payers, ad_revenue, ad_views,
+              sessions, session_seconds, session_levels, session_revenue (theo ngày bắt đầu session, analytics.sessions),
+              gold_source, gold_sink (sổ cái gold, analytics.economy)
+  users:      (chỉ chiều) -> users, cpi, iap_revenue, ad_revenue, payers, purchases, ad_views
+  levels:     level_id -> churned, attempts, wins, fails, winners, attempts_to_first_win, gold_earned,
+              gold_source, gold_sink (theo level đang chơi)
+  cohort_users:   campaign_id, install_date -> users, cpi
+  cohort_revenue: campaign_id, install_date, day_diff -> iap_revenue, ad_revenue
+  packs:      date, pack -> revenue, purchases
+  placements: date, placement -> revenue, views
+  retention:  cohort_date, day -> users (cohort = ngày active đầu tiên, xem analytics.retention)
+  engagement: date -> registers (HyperLogLog sketch của user active, gộp bằng max, xem analytics.engagement)
+  activity:   active_days -> users, sessions, max_level, lapsed (từ bảng feature theo user, analytics.features)
+  wallet:        date, bin -> players (histogram số dư gold cuối ngày, bin theo analytics.economy.balance_bins)
+  wallet_levels: level_id, bin -> players (histogram số dư gold lúc qua level lần đầu)
+
+    python analytics/cube.py --data-dir data
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir, load_tables, source_files, fingerprint
+from analytics.levels import LEVEL_MEASURES, level_counts, outcome_codes
+from analytics.retention import RetentionBitmap
+from analytics.engagement import sketch_cells
+from analytics.features import build_features, load_features
+from analytics.sessions import sessionize, kind_codes
+from analytics.economy import GoldLedger, balance_bins
+from analytics.profiling import span
+
+DIMENSIONS = ['tier', 'source', 'country', 'os']
+CUBE_KEYS = {
+    'daily': ['date'],
+    'users': [],
+    'levels': ['level_id'],
+    'cohort_users': ['campaign_id', 'install_date'],
+    'cohort_revenue': ['campaign_id', 'install_date', 'day_diff'],
+    'packs': ['date', 'pack'],
+    'placements': ['date', 'placement'],
+    'retention': ['cohort_date', 'day'],
+    'engagement': ['date'],
+    'activity': ['active_days'],
+    'wallet': ['date', 'bin'],
+    'wallet_levels': ['level_id', 'bin'],
+}
+CUBES_DIR = "cubes"
+CUBE_VERSION = 13  # Tăng khi đổi cấu trúc cube để cube đã lưu được dựng lại
+FINGERPRINT_KEY = b'source_fingerprint'
+LAPSED_DAYS = 7  # Không active trong LAPSED_DAYS ngày cuối của dữ liệu = lapsed
+
+
+# BUILD
+
+def _rollup(keys, seg, measures):
+    """Cộng measures theo (keys..., segment); keys/measures: {tên: mảng cùng độ dài với seg}."""
+    frame = pd.DataFrame({**keys, '_seg': seg, **measures})
+    return frame.groupby([*keys, '_seg'], sort=True).sum().reset_index()
+
+
+def _count_distinct(keys, seg, user_idx):
+    """Số user khác nhau theo (keys..., segment): bỏ trùng (user, keys) rồi đếm."""
+    frame = pd.DataFrame({**keys, '_seg': seg, '_user': user_idx}).drop_duplicates()
+    return frame.groupby([*keys, '_seg'], sort=True).size()
+
+
+def _merge(frames, on):
+    """Outer join các cube con cùng khóa, measure thiếu = 0."""
+    merged = frames[0]
+    for frame in frames[1:]:
+        merged = merged.merge(frame, on=on, how='outer')
+    counts = {c: np.int64 for frame in frames for c in frame.columns if frame[c].dtype.kind in 'ib'}
+    return merged.fillna(0).astype(counts)
+
+
+def activity_cube(features):
+    """Cube activity từ bảng feature: chỉ user có trong UA, như các cube khác."""
+    users = features[features['install_date'].notna()]
+    last_active = pd.to_datetime(users['last_active'])
+    end = last_active.max()
+    lapsed = (last_active < end - pd.Timedelta(days=LAPSED_DAYS - 1)).to_numpy() if pd.notna(end) else False
+    frame = pd.DataFrame({
+        **{dim: users[dim].astype(str).to_numpy() for dim in DIMENSIONS},
+        'active_days': users['active_days'].to_numpy(dtype=np.int64),
+        'users': np.ones(len(users), dtype=np.int64),
+        'sessions': users['sessions'].to_numpy(dtype=np.int64),
+        'max_level': users['max_level'].to_numpy(dtype=np.int64),
+        'lapsed': np.broadcast_to(lapsed, len(users)).astype(np.int64),
+    })
+    cube = frame.groupby(DIMENSIONS + ['active_days'], sort=True).sum().reset_index()
+    return cube.astype({dim: 'category' for dim in DIMENSIONS})
+
+
+def build_cubes(ua, events, iap, ads, features=None):
+    """Dựng toàn bộ cube từ 4 bảng đã chuẩn hóa (xem analytics.sources).
+
+    features: bảng feature theo user đã cập nhật (analytics.features); None = tính từ 4 bảng.
+    """
+    ua = ua.drop_duplicates('user_id').reset_index(drop=True)
+    users = pd.Index(ua['user_id'])
+    dims = ua[DIMENSIONS].astype(object).fillna('Unknown').astype(str)
+    segments = dims.groupby(DIMENSIONS, sort=True)
+    user_seg = segments.ngroup().to_numpy()
+    install_date = pd.to_datetime(ua['install_date']).dt.normalize().to_numpy()
+
+    def locate(frame):
+        """(frame của các dòng có user trong UA, user index, segment)."""
+        idx = users.get_indexer(frame['user_id'])
+        frame = frame[idx >= 0]
+        idx = idx[idx >= 0]
+        return frame, idx, user_seg[idx]
+
+    ev, ev_user, ev_seg = locate(events)
+    iap, iap_user, iap_seg = locate(iap)
+    ads, ad_user, ad_seg = locate(ads)
+    ev_date = pd.to_datetime(ev['event_date']).dt.normalize().to_numpy()
+    iap_date = pd.to_datetime(iap['timestamp']).dt.normalize().to_numpy()
+    ad_date = pd.to_datetime(ads['timestamp']).dt.normalize().to_numpy()
+    name = ev['event_name'].astype(str).to_numpy()
+    iap_price = iap['price'].to_numpy(dtype=float)
+    ad_revenue = ads['revenue'].to_numpy(dtype=float)
+    # Session dựng lại từ event: thuộc về ngày / segment của event đầu session
+    sessions = sessionize(ev_user, ev['event_timestamp'].to_numpy(dtype=np.int64), kind_codes(name),
+                          ev['price'].to_numpy(dtype=float, na_value=np.nan))
+    session_first = sessions['first'].to_numpy()
+    # Sổ cái gold: dòng tiền và số dư theo ngày (UTC) / level của entry
+    ledger = GoldLedger.from_events(ev)
+    ledger_seg = ev_seg[ledger.row]
+    ledger_day = ev_date[ledger.row]
+    day_ends, level_firsts = ledger.day_ends(ledger_day), ledger.level_firsts()
+    gold_flows = {'gold_source': ledger.source, 'gold_sink': ledger.sink}
+
+    # daily
+    daily = _merge([
+        _count_distinct({'date': ev_date}, ev_seg, ev_user).rename('dau').reset_index(),
+        _rollup({'date': ev_date}, ev_seg, {'events': np.ones(len(ev), dtype=np.int64)}),
+        _rollup({'date': ev_date[session_first]}, ev_seg[session_first],
+                {'sessions': np.ones(len(sessions), dtype=np.int64),
+                 'session_seconds': sessions['duration_s'].to_numpy(),
+                 'session_levels': sessions['levels'].to_numpy(),
+                 'session_revenue': sessions['revenue'].to_numpy()}),
+        _rollup({'date': ledger_day}, ledger_seg, gold_flows),
+        _rollup({'date': install_date}, user_seg, {'installs': np.ones(len(ua), dtype=np.int64)}),
+        _rollup({'date': iap_date}, iap_seg, {'iap_revenue': iap_price,
+                                             'purchases': np.ones(len(iap), dtype=np.int64)}),
+        _count_distinct({'date': iap_date}, iap_seg, iap_user).rename('payers').reset_index(),
+        _rollup({'date': ad_date}, ad_seg, {'ad_revenue': ad_revenue, 'ad_views': np.ones(len(ads), dtype=np.int64)}),
+    ], ['date', '_seg'])
+
+    # users (doanh thu trọn đời theo segment)
+    iap_by_user = np.bincount(iap_user, weights=iap_price, minlength=len(ua))
+    user_cube = _rollup({}, user_seg, {
+        'users': np.ones(len(ua), dtype=np.int64),
+        'cpi': ua['cpi'].to_numpy(dtype=float),
+        'iap_revenue': iap_by_user,
+        'ad_revenue': np.bincount(ad_user, weights=ad_revenue, minlength=len(ua)),
+        'payers': (iap_by_user > 0).astype(np.int64),
+        'purchases': np.bincount(iap_user, minlength=len(ua)),
+        'ad_views': np.bincount(ad_user, minlength=len(ua)),
+    })
+
+    # levels: các measure cộng được của analytics.levels theo segment
+    has_level = ev['level_id'].notna().to_numpy()
+    gold = ev['gold_earned'].to_numpy(dtype=float, na_value=np.nan)[has_level] if 'gold_earned' in ev else None
+    levels = level_counts(ev_user[has_level], ev['level_id'].to_numpy(dtype=float)[has_level].astype(np.int64),
+                          outcome_codes(name[has_level]), gold, user_group=user_seg, n_users=len(ua))
+    levels = levels[levels[LEVEL_MEASURES].to_numpy().any(axis=1)].rename(columns={'group': '_seg'})
+    levels = _merge([levels, _rollup({'level_id': ledger.level}, ledger_seg, gold_flows)], ['level_id', '_seg'])
+
+    # cohort: install theo (campaign, ngày install) và doanh thu theo số ngày kể từ install
+    campaign = ua['campaign_id'].astype(str).to_numpy()
+    cohort_users = _rollup({'campaign_id': campaign, 'install_date': install_date}, user_seg,
+                           {'users': np.ones(len(ua), dtype=np.int64), 'cpi': ua['cpi'].to_numpy(dtype=float)})
+    cohort_revenue = _merge([
+        _rollup({'campaign_id': campaign[iap_user], 'install_date': install_date[iap_user],
+                 'day_diff': (iap_date - install_date[iap_user]) // np.timedelta64(1, 'D')}, iap_seg,
+                {'iap_revenue': iap_price}),
+        _rollup({'campaign_id': campaign[ad_user], 'install_date': install_date[ad_user],
+                 'day_diff': (ad_date - install_date[ad_user]) // np.timedelta64(1, 'D')}, ad_seg,
+                {'ad_revenue': ad_revenue}),
+    ], ['campaign_id', 'install_date', 'day_diff', '_seg'])
+
+    # retention: mỗi block của bitmap là một (ngày cohort, segment)
+    bitmap = RetentionBitmap.from_events(ev_date, ev_user, user_seg)
+    retention = bitmap.cells()
+    retention['_seg'] = bitmap.block_group[retention.pop('block').to_numpy()].astype(np.int64)
+
+    engagement = sketch_cells(ev_date, ev['user_id'].to_numpy(), ev_seg).rename(columns={'group': '_seg'})
+
+    cubes = {
+        'daily': daily,
+        'users': user_cube,
+        'levels': levels,
+        'cohort_users': cohort_users,
+        'cohort_revenue': cohort_revenue,
+        'packs': _rollup({'date': iap_date, 'pack': iap['pack'].astype(str).to_numpy()}, iap_seg,
+                         {'revenue': iap_price, 'purchases': np.ones(len(iap), dtype=np.int64)}),
+        'placements': _rollup({'date': ad_date, 'placement': ads['placement'].astype(str).to_numpy()}, ad_seg,
+                              {'revenue': ad_revenue, 'views': np.ones(len(ads), dtype=np.int64)}),
+        'retention': retention,
+        'engagement': engagement,
+        'wallet': _rollup({'date': ledger_day[day_ends], 'bin': balance_bins(ledger.balance[day_ends])},
+                          ledger_seg[day_ends], {'players': np.ones(len(day_ends), dtype=np.int64)}),
+        'wallet_levels': _rollup({'level_id': ledger.level[level_firsts],
+                                  'bin': balance_bins(ledger.balance[level_firsts])},
+                                 ledger_seg[level_firsts], {'players': np.ones(len(level_firsts), dtype=np.int64)}),
+    }
+    segment_dims = segments.size().index.to_frame(index=False)
+    for cube_name, cube in cubes.items():
+        dims_of_rows = segment_dims.iloc[cube.pop('_seg').to_numpy()].reset_index(drop=True)
+        for dim in DIMENSIONS:
+            cube[dim] = pd.Categorical(dims_of_rows[dim])
+        cubes[cube_name] = cube[DIMENSIONS + [c for c in cube.columns if c not in DIMENSIONS]]
+    cubes['activity'] = activity_cube(build_features(ua, events, iap, ads) if features is None else features)
+    return cubes
+
+
+# PERSISTENCE
+
+def save_cubes(cubes, data_dir, source_fingerprint):
+    """Ghi mỗi cube thành data_dir/cubes/<cube>.parquet, kèm fingerprint của dữ liệu nguồn."""
+    directory = os.path.join(data_dir, CUBES_DIR)
+    os.makedirs(directory, exist_ok=True)
+    for name, cube in cubes.items():
+        table = pa.Table.from_pandas(cube, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, FINGERPRINT_KEY: source_fingerprint})
+        path = os.path.join(directory, f"{name}.parquet")
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+
+def load_cubes(data_dir, source_fingerprint):
+    """Đọc cube đã lưu nếu còn khớp dữ liệu nguồn, ngược lại trả về None."""
+    cubes = {}
+    for name in CUBE_KEYS:
+        path = os.path.join(data_dir, CUBES_DIR, f"{name}.parquet")
+        if not os.path.exists(path):
+            return None
+        table = pq.read_table(path)
+        if (table.schema.metadata or {}).get(FINGERPRINT_KEY) != source_fingerprint.encode('utf-8'):
+            return None
+        cube = table.to_pandas()
+        cubes[name] = cube.astype({dim: 'category' for dim in DIMENSIONS})  # cube rỗng đọc lại thành object
+    return cubes
+
+
+def cube_key(data_dir):
+    """Khóa của cube đã lưu: phiên bản cấu trúc + fingerprint dữ liệu nguồn."""
+    return f"{CUBE_VERSION}:{fingerprint(source_files(data_dir))}"
+
+
+def get_cubes(data_dir, rebuild=False):
+    """Cube của data_dir: đọc bản đã lưu, hoặc dựng lại (và lưu) khi dữ liệu nguồn thay đổi."""
+    key = cube_key(data_dir)
+    with span('cube.load'):
+        cubes = None if rebuild else load_cubes(data_dir, key)
+    if cubes is None:
+        tables = load_tables(data_dir)
+        features = load_features(data_dir)
+        with span('cube.build'):
+            cubes = build_cubes(*tables, features=features)
+        try:
+            with span('cube.save'):
+                save_cubes(cubes, data_dir, key)
+        except OSError:
+            pass  # Thư mục data chỉ đọc: vẫn dùng cube trong bộ nhớ
+    return cubes
+
+
+def cube_files(data_dir):
+    """{cube: file Parquet} còn khớp dữ liệu nguồn, dựng lại và lưu nếu cần (không đọc cube vào bộ nhớ)."""
+    key = cube_key(data_dir)
+    paths = {name: os.path.join(data_dir, CUBES_DIR, f"{name}.parquet") for name in CUBE_KEYS}
+    if not all(os.path.exists(path) and (pq.read_schema(path).metadata or {}).get(FINGERPRINT_KEY) == key.encode()
+               for path in paths.values()):
+        save_cubes(build_cubes(*load_tables(data_dir), features=load_features(data_dir)), data_dir, key)
+    return paths
+
+
+# QUERY
+
+def measures(cube_name, cube):
+    return [c for c in cube.columns if c not in DIMENSIONS and c not in CUBE_KEYS[cube_name]]
+
+
+def row_index(cube, dim):
+    """{giá trị của dim: vị trí các dòng} dựng từ mã categorical, để lọc không cần isin."""
+    codes = cube[dim].cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(cube[dim].cat.categories) + 1))
+    return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(cube[dim].cat.categories)}
+
+
+def rollup(cubes, cube_name, by=(), filters=None, rows=None):
+    """Cộng measure của một cube theo các cột `by` sau khi lọc chiều.
+
+    filters: {dim: danh sách giá trị được giữ}; rows: vị trí dòng đã chọn sẵn
+    (xem row_index), thay cho filters. by=() trả về Series tổng.
+    """
+    cube = cubes[cube_name]
+    if rows is None:
+        mask = np.ones(len(cube), dtype=bool)
+        for dim, values in (filters or {}).items():
+            mask &= cube[dim].isin(list(values)).to_numpy()
+        rows = np.flatnonzero(mask)
+    selected = cube.take(rows)
+    if not by:
+        return selected[measures(cube_name, cube)].sum()
+    return selected.groupby(list(by), observed=True)[measures(cube_name, cube)].sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - dựng rollup cube cho dashboard")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None:
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+    started = time.perf_counter()
+    cubes = get_cubes(data_dir, rebuild=True)
+    print(f"-> Đã dựng {len(cubes)} cubes trong {time.perf_counter() - started:.2f}s "
+          f"({os.path.join(data_dir, CUBES_DIR)})")
+    for name, cube in cubes.items():
+        print(f"   {name}: {len(cube):,} dòng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Sổ cái gold theo user: số dư (ví) của mọi người chơi theo thời gian.
+
+Mỗi entry là một dòng tiền: nguồn (SOURCES: gold_earned của level_complete,
+AD_GOLD_REWARD của ad_reward_claim) cộng vào ví, tiêu (SINKS: vd
+spend_virtual_currency với cột gold_spent nếu dữ liệu có) trừ khỏi ví. Entry
+được sắp theo (user, thời gian) như analytics.sessions; số dư = cumsum trên cả
+mảng trừ tổng tích lũy trước đầu đoạn của user (cumsum phân đoạn). Level của
+entry = level_id nếu có, ngược lại là level đang chơi (level cao nhất đã qua + 1,
+cummax phân đoạn). IAP là gói gem (pack_gem_*), không quy ra gold nên không vào sổ.
+
+Chỉ số lạm phát, không vòng lặp Python theo user / nhóm:
+  theo ngày:  số dư sau entry cuối cùng của ngày (event_date) với người chơi có entry trong ngày
+  theo level: số dư lúc qua level lần đầu
+  -> median, p90, p99 (tích trữ), tổng nguồn / tiêu và tỷ lệ nguồn / tiêu
+
+Cube của dashboard lưu histogram số dư theo bin log (BALANCE_EDGES), cộng được
+giữa các segment; phân vị đọc từ histogram lệch lên tối đa BIN_RATIO - 1. CLI
+tính phân vị chính xác từ sổ cái.
+
+    python analytics/economy.py --data-dir data --by level
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from data_generator.config import AD_GOLD_REWARD
+from analytics.sources import find_data_dir, load_tables
+from analytics.sessions import user_time_order
+
+# event -> cột lượng gold, hoặc lượng cố định
+SOURCES = {'level_complete': 'gold_earned', 'ad_reward_claim': AD_GOLD_REWARD}
+SINKS = {'spend_virtual_currency': 'gold_spent'}
+QUANTILES = {'median': 0.5, 'p90': 0.9, 'p99': 0.99}
+BIN_RATIO = 1.05
+MAX_BALANCE = 10 ** 9
+# Cạnh trên của các bin số dư > 0; bin 0 = số dư <= 0
+BALANCE_EDGES = np.unique(np.ceil(np.geomspace(
+    1, MAX_BALANCE, int(np.ceil(np.log(MAX_BALANCE) / np.log(BIN_RATIO))) + 1)))
+BIN_VALUES = np.concatenate([[0.0], BALANCE_EDGES])
+
+
+def gold_flows(events):
+    """(nguồn, tiêu) gold >= 0 của từng event theo SOURCES / SINKS; cột lượng không có -> 0."""
+    names = pd.Categorical(events['event_name'])
+    flows = []
+    for mapping in (SOURCES, SINKS):
+        amount = np.zeros(len(events))
+        for event, value in mapping.items():
+            if event not in names.categories or (isinstance(value, str) and value not in events):
+                continue
+            mask = names.codes == names.categories.get_loc(event)
+            if isinstance(value, str):
+                column = pd.to_numeric(events[value], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                amount[mask] = np.nan_to_num(column[mask])
+            else:
+                amount[mask] = value
+        flows.append(amount)
+    return tuple(flows)
+
+
+class GoldLedger:
+    """Các entry đã sắp theo (user, thời gian), kèm số dư sau mỗi entry.
+
+    row: vị trí của entry trong input (để lấy segment...); segment: thứ tự user.
+    """
+
+    def __init__(self, row, segment, timestamp, source, sink, balance, level, complete):
+        self.row = row
+        self.segment = segment
+        self.timestamp = timestamp
+        self.source = source
+        self.sink = sink
+        self.balance = balance
+        self.level = level
+        self.complete = complete
+
+    @classmethod
+    def from_flows(cls, users, timestamps, source, sink, levels, complete):
+        """Sổ cái từ các event: chỉ giữ event có dòng tiền hoặc qua level."""
+        source = np.asarray(source, dtype=np.float64)
+        sink = np.asarray(sink, dtype=np.float64)
+        complete = np.asarray(complete, dtype=bool)
+        keep = np.flatnonzero((source > 0) | (sink > 0) | complete)
+        users, timestamps = np.asarray(users)[keep], np.asarray(timestamps, dtype=np.int64)[keep]
+        order = user_time_order(users, timestamps)
+        row, user, timestamp = keep[order], users[order], timestamps[order]
+        n = len(row)
+
+        new = np.ones(n, dtype=bool)
+        np.not_equal(user[1:], user[:-1], out=new[1:])
+        starts = np.flatnonzero(new)
+        counts = np.diff(np.append(starts, n))
+        segment = np.repeat(np.arange(len(starts)), counts)
+
+        # Số dư: cumsum toàn mảng trừ phần tích lũy của các user trước
+        net = source[row] - sink[row]
+        total = np.cumsum(net)
+        balance = total - np.repeat(total[starts] - net[starts], counts)
+
+        # Level đang chơi: cummax phân đoạn của level đã qua (cộng segment * span để không tràn sang user trước)
+        level = np.asarray(levels, dtype=np.float64)[row]
+        has_level = ~np.isnan(level)
+        done = np.where(complete[row] & has_level, level, 0).astype(np.int64)
+        span = int(done.max()) + 1 if n else 1
+        reached = np.maximum.accumulate(done + segment * span) - segment * span if n else done
+        level = np.where(has_level, level, reached + 1).astype(np.int64)
+        return cls(row, segment, timestamp, source[row], sink[row], balance, level, complete[row])
+
+    @classmethod
+    def from_events(cls, events):
+        """Sổ cái từ bảng events đã chuẩn hóa (analytics.sources)."""
+        source, sink = gold_flows(events)
+        return cls.from_flows(events['user_id'].to_numpy(), events['event_timestamp'].to_numpy(dtype=np.int64),
+                              source, sink, events['level_id'].to_numpy(dtype=float, na_value=np.nan),
+                              (events['event_name'] == 'level_complete').to_numpy())
+
+    def __len__(self):
+        return len(self.row)
+
+    def day_ends(self, days):
+        """Vị trí entry cuối cùng (theo thời gian) của mỗi (user, ngày); days: ngày của từng entry.
+
+        event_date do generator gán theo ngày bắt đầu session nên không nhất thiết
+        tăng dần theo thời gian: lấy lần xuất hiện cuối của khóa (user, ngày).
+        """
+        labels, code = np.unique(np.asarray(days), return_inverse=True)
+        key = self.segment.astype(np.int64) * max(len(labels), 1) + code
+        _, last = np.unique(key[::-1], return_index=True)
+        return len(self) - 1 - last
+
+    def level_firsts(self):
+        """Vị trí entry qua level lần đầu của mỗi (user, level)."""
+        done = np.flatnonzero(self.complete)
+        span = int(self.level[done].max()) + 1 if len(done) else 1
+        _, first = np.unique(self.segment[done] * span + self.level[done], return_index=True)
+        return done[first]
+
+
+# PHÂN VỊ
+
+def group_quantiles(groups, values, quantiles=QUANTILES):
+    """{tên: mảng} phân vị chính xác của values theo nhóm 0..g-1; nhóm rỗng = NaN.
+
+    Cùng định nghĩa với histogram_quantiles (giá trị thứ ceil(q * n) của nhóm) để
+    hai cách chỉ lệch nhau do độ rộng bin.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    size = int(groups.max()) + 1 if len(groups) else 0
+    order = np.lexsort((values, groups))
+    values = np.asarray(values, dtype=np.float64)[order]
+    counts = np.bincount(groups, minlength=size)
+    starts = np.cumsum(counts) - counts
+    result = {}
+    for name, q in quantiles.items():
+        rank = np.maximum(np.ceil(q * counts).astype(np.int64), 1)
+        value = values[np.minimum(starts + rank - 1, len(values) - 1)] if len(values) else np.zeros(size)
+        result[name] = np.where(counts > 0, value, np.nan)
+    return result
+
+
+def balance_bins(balance):
+    """Bin (int16) của số dư: 0 nếu <= 0, i nếu BALANCE_EDGES[i-2] < số dư <= BALANCE_EDGES[i-1]."""
+    balance = np.asarray(balance, dtype=np.float64)
+    bins = np.searchsorted(BALANCE_EDGES, np.minimum(balance, MAX_BALANCE), side='left') + 1
+    return np.where(balance > 0, bins, 0).astype(np.int16)
+
+
+def histogram_quantiles(groups, bins, counts, quantiles=QUANTILES):
+    """{tên: mảng} phân vị theo nhóm từ histogram số dư (giá trị = cạnh trên của bin).
+
+    Các dòng (nhóm 0..g-1, bin, số người chơi) phải sắp theo (nhóm, bin).
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    cumulative = np.cumsum(counts)
+    total = np.bincount(groups, weights=counts, minlength=int(groups.max()) + 1 if len(groups) else 0)
+    offset = np.cumsum(total) - total
+    result = {}
+    for name, q in quantiles.items():
+        # Người chơi thứ ceil(q * tổng) của nhóm (ít nhất người đầu tiên)
+        target = offset + np.maximum(np.ceil(q * total), 1)
+        position = np.minimum(np.searchsorted(cumulative, target, side='left'), max(len(counts) - 1, 0))
+        values = BIN_VALUES[np.asarray(bins)[position]] if len(counts) else np.zeros(len(total))
+        result[name] = np.where(total > 0, values, np.nan)
+    return result
+
+
+# BẢNG LẠM PHÁT
+
+def _with_flows(table, flows):
+    """Thêm nguồn / tiêu theo khóa và tỷ lệ nguồn / tiêu (NaN khi không có tiêu); bỏ khóa rỗng."""
+    columns = ['players', 'gold_source', 'gold_sink']
+    table = table.join(flows[['gold_source', 'gold_sink']], how='outer')
+    table[columns] = table[columns].fillna(0)
+    table = table[(table[columns] != 0).any(axis=1)].copy()
+    table['source_sink_ratio'] = table['gold_source'] / table['gold_sink'].where(table['gold_sink'] > 0)
+    return table.astype({'players': np.int64})
+
+
+def inflation_table(keys, balance, flow_keys, source, sink, name):
+    """Bảng lạm phát chính xác: keys / balance là các số dư được lấy mẫu, flow_keys / source / sink là mọi entry."""
+    groups, labels = pd.factorize(pd.Series(keys), sort=True)
+    table = pd.DataFrame({'players': np.bincount(groups, minlength=len(labels)),
+                          **group_quantiles(groups, balance)}, index=pd.Index(labels, name=name))
+    flows = pd.DataFrame({name: flow_keys, 'gold_source': source, 'gold_sink': sink}).groupby(name).sum()
+    return _with_flows(table, flows)
+
+
+def economy_table(cells, flows):
+    """Bảng lạm phát từ cube: cells = số người chơi theo (khóa, bin), flows = gold_source / gold_sink theo khóa."""
+    cells = cells[cells > 0].sort_index()
+    groups, labels = pd.factorize(cells.index.get_level_values(0), sort=True)
+    counts = cells.to_numpy(dtype=np.int64)
+    table = pd.DataFrame({'players': np.bincount(groups, weights=counts, minlength=len(labels)),
+                          **histogram_quantiles(groups, cells.index.get_level_values(1).to_numpy(), counts)},
+                         index=pd.Index(labels, name=cells.index.names[0]))
+    return _with_flows(table, flows)
+
+
+def economy_report(events):
+    """(bảng theo ngày, bảng theo level) chính xác từ bảng events đã chuẩn hóa."""
+    ledger = GoldLedger.from_events(events)
+    day = pd.to_datetime(events['event_date']).to_numpy()[ledger.row]
+    ends = ledger.day_ends(day)
+    firsts = ledger.level_firsts()
+    daily = inflation_table(day[ends], ledger.balance[ends], day, ledger.source, ledger.sink, 'date')
+    levels = inflation_table(ledger.level[firsts], ledger.balance[firsts], ledger.level,
+                             ledger.source, ledger.sink, 'level_id')
+    return daily, levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - sổ cái gold, số dư và lạm phát")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--by', choices=['day', 'level'], nargs='+', default=['day', 'level'])
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None:
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+    _, events, _, _ = load_tables(data_dir)
+    daily, levels = economy_report(events)
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        for by, table in (('day', daily), ('level', levels)):
+            if by in args.by:
+                print(f"=== Gold economy theo {'ngày' if by == 'day' else 'level'} ===")
+                print(table.round(2).to_string())
+                print()
+
+
+if __name__ == "__main__":
+    main()
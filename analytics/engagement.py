@@ -0,0 +1,185 @@
+"""
+Engagement (DAU / WAU / MAU / stickiness) bằng HyperLogLog sketch.
+
+Mỗi (ngày, segment) là một sketch 2^p thanh ghi uint8, kích thước cố định dù
+ngày đó có bao nhiêu user active. Sketch gộp được bằng max từng thanh ghi,
+nên số user khác nhau của một cửa sổ ngày / bộ filter bất kỳ (MAU, WAU cuộn)
+chỉ cần gộp các sketch đã lưu, không đọc lại event. Sai số chuẩn ~1.04 / sqrt(2^p),
+chọn p theo sai số mong muốn (precision_for_error).
+
+exact_table tính cùng bảng bằng đếm chính xác để đối chiếu.
+
+    python analytics/engagement.py --data-dir data --error 0.01
+    python analytics/engagement.py --data-dir data --exact
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir, load_tables
+
+HLL_ERROR = 0.02  # p = 12: 4 KB mỗi sketch, sai số chuẩn ~1.6%
+WAU_DAYS = 7
+HASH_BITS = 64
+
+
+def precision_for_error(error):
+    """Số bit chỉ số p nhỏ nhất có sai số chuẩn 1.04 / sqrt(2^p) <= error (4..18)."""
+    return int(np.clip(np.ceil(np.log2((1.04 / error) ** 2)), 4, 18))
+
+
+def hash_users(user_id):
+    """Hash 64 bit ổn định của user_id (chuỗi hoặc số)."""
+    values = np.asarray(user_id)
+    return pd.util.hash_array(values if values.dtype.kind in 'iu' else values.astype(object))
+
+
+def _bit_length(x):
+    x = x.copy()
+    for shift in (1, 2, 4, 8, 16, 32):
+        x |= x >> np.uint64(shift)
+    return np.bitwise_count(x)
+
+
+def registers(hashes, cell, n_cells, precision):
+    """Thanh ghi HLL [n_cells, 2^p]: thanh ghi = chỉ số từ p bit cao, giá trị = vị trí bit 1 đầu tiên."""
+    m = 1 << precision
+    index = (hashes >> np.uint64(HASH_BITS - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (HASH_BITS - precision)) - 1)
+    rank = (HASH_BITS - precision + 1 - _bit_length(rest)).astype(np.uint8)
+    regs = np.zeros(n_cells * m, dtype=np.uint8)
+    np.maximum.at(regs, np.asarray(cell, dtype=np.int64) * m + index, rank)
+    return regs.reshape(n_cells, m)
+
+
+def estimate(regs):
+    """Ước lượng số phần tử khác nhau của từng sketch (dòng), có hiệu chỉnh linear counting."""
+    regs = np.atleast_2d(regs)
+    m = regs.shape[1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.exp2(-regs.astype(np.float64)).sum(axis=1)
+    zeros = (regs == 0).sum(axis=1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    raw[small] = m * np.log(m / zeros[small])
+    return raw
+
+
+def sketch_cells(dates, user_ids, groups, error=HLL_ERROR):
+    """Sketch theo (ngày, group) ở dạng dài: date, group, registers (bytes)."""
+    precision = precision_for_error(error)
+    date_code, date_values = pd.factorize(pd.to_datetime(pd.Series(dates)).dt.normalize(), sort=True)
+    group_code, group_values = pd.factorize(np.asarray(groups, dtype=np.int64), sort=True)
+    # Ô (ngày, group) có dữ liệu, theo thứ tự ngày rồi group
+    combined = date_code * len(group_values) + group_code
+    present = np.flatnonzero(np.bincount(combined, minlength=len(date_values) * len(group_values)))
+    lookup = np.zeros(len(date_values) * len(group_values), dtype=np.int64)
+    lookup[present] = np.arange(len(present))
+    regs = registers(hash_users(user_ids), lookup[combined], len(present), precision)
+    return pd.DataFrame({
+        'date': date_values[present // max(len(group_values), 1)],
+        'group': group_values[present % max(len(group_values), 1)],
+        'registers': [row.tobytes() for row in regs],
+    })
+
+
+class EngagementSketches:
+    """Sketch theo ngày (đã gộp qua các segment được chọn)."""
+
+    def __init__(self, dates, regs):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.registers = regs
+
+    @classmethod
+    def from_cells(cls, cells, precision=None):
+        """Gộp các dòng (date, registers) của sketch_cells / cube engagement theo ngày."""
+        if not len(cells):
+            return cls([], np.zeros((0, 1 << (precision or precision_for_error(HLL_ERROR))), dtype=np.uint8))
+        cells = cells.sort_values('date', kind='stable')
+        regs = np.frombuffer(b''.join(cells['registers']), dtype=np.uint8).reshape(len(cells), -1)
+        dates = cells['date'].to_numpy().astype('datetime64[D]')
+        starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+        return cls(dates[starts], np.maximum.reduceat(regs, starts, axis=0))
+
+    @property
+    def precision(self):
+        return int(np.log2(self.registers.shape[1]))
+
+    def unique_users(self, start=None, end=None):
+        """Số user khác nhau (ước lượng) trong các ngày [start, end]."""
+        mask = np.ones(len(self.dates), dtype=bool)
+        if start is not None:
+            mask &= self.dates >= np.datetime64(start, 'D')
+        if end is not None:
+            mask &= self.dates <= np.datetime64(end, 'D')
+        return float(estimate(self.registers[mask].max(axis=0, initial=0))[0])
+
+    def table(self, wau_days=WAU_DAYS):
+        """date, dau, wau (cửa sổ wau_days ngày kết thúc ở date), mau (tháng lịch như sql/04), stickiness."""
+        dates = pd.DatetimeIndex(self.dates, name='date')
+        if not len(dates):
+            return pd.DataFrame(columns=['dau', 'wau', 'mau', 'stickiness'], index=dates, dtype=float)
+        calendar = pd.date_range(dates.min(), dates.max(), freq='D')
+        # Ngày không có sketch = thanh ghi 0 để cửa sổ cuộn theo lịch
+        daily = np.zeros((len(calendar), self.registers.shape[1]), dtype=np.uint8)
+        daily[calendar.get_indexer(dates)] = self.registers
+        padded = np.concatenate([np.zeros((wau_days - 1, daily.shape[1]), dtype=np.uint8), daily])
+        wau = np.lib.stride_tricks.sliding_window_view(padded, wau_days, axis=0).max(axis=-1)
+        _, month_of = np.unique(dates.to_period('M').asi8, return_inverse=True)
+        starts = np.flatnonzero(np.r_[True, month_of[1:] != month_of[:-1]])
+        mau = np.maximum.reduceat(self.registers, starts, axis=0)
+        frame = pd.DataFrame({
+            'dau': estimate(self.registers),
+            'wau': estimate(wau[calendar.get_indexer(dates)]),
+            'mau': estimate(mau)[month_of],
+        }, index=dates)
+        frame['stickiness'] = frame['dau'] / frame['mau']
+        return frame
+
+
+def exact_table(dates, user_ids, wau_days=WAU_DAYS):
+    """Cùng bảng với EngagementSketches.table bằng COUNT(DISTINCT) chính xác (để đối chiếu)."""
+    active = pd.DataFrame({'date': pd.to_datetime(pd.Series(dates)).dt.normalize().to_numpy(),
+                           'user_id': np.asarray(user_ids)}).drop_duplicates()
+    frame = pd.DataFrame({'dau': active.groupby('date')['user_id'].nunique().astype(float)})
+    frame.index.name = 'date'
+    window = pd.Timedelta(days=wau_days - 1)
+    frame['wau'] = [float(active.loc[active['date'].between(d - window, d), 'user_id'].nunique())
+                    for d in frame.index]
+    mau = active.groupby(active['date'].dt.to_period('M'))['user_id'].nunique()
+    frame['mau'] = frame.index.to_period('M').map(mau).astype(float)
+    frame['stickiness'] = frame['dau'] / frame['mau']
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - DAU / WAU / MAU / stickiness (HyperLogLog)")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--error', type=float, default=HLL_ERROR, help="Sai số chuẩn mong muốn (mặc định 0.02)")
+    parser.add_argument('--exact', action='store_true', help="Đếm chính xác thay cho sketch")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None:
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+    _, events, _, _ = load_tables(data_dir)
+    # Giống sql/04_engagement_kpi.sql: active = có session_start
+    sessions = events[events['event_name'].astype(str) == 'session_start']
+    if args.exact:
+        table = exact_table(sessions['event_date'], sessions['user_id'])
+    else:
+        cells = sketch_cells(sessions['event_date'], sessions['user_id'], np.zeros(len(sessions)), args.error)
+        table = EngagementSketches.from_cells(cells).table()
+    table[['dau', 'wau', 'mau']] = table[['dau', 'wau', 'mau']].round(0).astype(np.int64)
+    table['stickiness_percent'] = (table.pop('stickiness') * 100).round(2)
+    print(table.sort_index(ascending=False).reset_index().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
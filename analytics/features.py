@@ -0,0 +1,245 @@
+"""
+Bảng feature theo user, lưu ở data/features/users.parquet và cập nhật tăng dần.
+
+Mỗi dòng là một user, khóa dense user_key (0..n-1, ổn định giữa các lần cập
+nhật: user mới được nối vào cuối):
+  user_id, install_date, source, campaign_id, country, tier, os, cpi   (UA)
+  iap_revenue, purchases, ad_revenue, ad_views                        (doanh thu theo nguồn)
+  max_level, first_active, last_active, active_days, sessions         (hoạt động)
+  last_event                                                          (µs, để nối session qua các lô)
+
+sessions cắt như analytics.sessions (session_start hoặc quá INACTIVITY_GAP
+không có event), cùng định nghĩa với số session của cube daily; session kéo
+dài qua ranh giới hai lần cập nhật chỉ được đếm một lần.
+
+Bảng ghi lại các file nguồn đã gộp (đường dẫn, kích thước, mtime) và các ngày
+event đã gộp. Lần cập nhật sau chỉ đọc các file / partition mới (ví dụ các
+ngày append trong increments/ hoặc partition Parquet mới) rồi gộp vào: tổng
+cộng dồn, max / min theo user, số ngày active cộng thêm. Dựng lại toàn bộ khi
+một file đã gộp bị sửa / xóa, hoặc lô mới có ngày event không sau mọi ngày
+đã gộp (số ngày active / session khi đó không cộng được).
+
+    python analytics/features.py --data-dir data
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir, read_sources, source_files
+from analytics.schema import user_keys
+from analytics.sessions import INACTIVITY_GAP, SESSION_START, kind_codes, sessionize
+from analytics.profiling import span
+
+FEATURES_FILE = os.path.join("features", "users.parquet")
+FEATURES_VERSION = 2  # Tăng khi đổi cột để bảng đã lưu được dựng lại
+MANIFEST_KEY = b'feature_manifest'
+
+DIMENSIONS = ['source', 'campaign_id', 'country', 'tier', 'os']
+SUM_COLUMNS = {'iap_revenue': np.float64, 'purchases': np.int64, 'ad_revenue': np.float64,
+               'ad_views': np.int64, 'active_days': np.int32, 'sessions': np.int64}
+FEATURE_COLUMNS = (['user_key', 'user_id', 'install_date'] + DIMENSIONS + ['cpi'] + list(SUM_COLUMNS)
+                   + ['max_level', 'first_active', 'last_active', 'last_event'])
+
+_NO_DAY = np.iinfo(np.int64).max
+_NO_TIME = np.iinfo(np.int64).min
+
+
+def _days(values):
+    """Ngày (số ngày từ epoch, int64); NaT -> _NO_DAY."""
+    days = pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[D]')
+    return np.where(np.isnat(days), _NO_DAY, days.astype(np.int64))
+
+
+def _dates(days):
+    out = np.where(days == _NO_DAY, np.datetime64('NaT'), days.astype('datetime64[D]'))
+    return out.astype('datetime64[s]')
+
+
+def _grow(previous, n):
+    """Các cột của previous (hoặc rỗng) kéo dài tới n user với giá trị mặc định."""
+    size = 0 if previous is None else len(previous)
+    cols = {}
+    for column, dtype in SUM_COLUMNS.items():
+        cols[column] = np.zeros(n, dtype=dtype)
+    cols['max_level'] = np.zeros(n, dtype=np.int32)
+    cols['first_active'] = np.full(n, _NO_DAY, dtype=np.int64)
+    cols['last_active'] = np.full(n, -_NO_DAY, dtype=np.int64)
+    cols['last_event'] = np.full(n, _NO_TIME, dtype=np.int64)
+    cols['install_date'] = np.full(n, np.datetime64('NaT'), dtype='datetime64[s]')
+    cols['cpi'] = np.full(n, np.nan)
+    for dim in DIMENSIONS:
+        cols[dim] = np.full(n, 'Unknown', dtype=object)
+    if size:
+        for column in list(SUM_COLUMNS) + ['max_level', 'cpi', 'last_event']:
+            cols[column][:size] = previous[column].to_numpy()
+        cols['install_date'][:size] = previous['install_date'].to_numpy().astype('datetime64[s]')
+        for dim in DIMENSIONS:
+            cols[dim][:size] = previous[dim].astype(object).to_numpy()
+        cols['first_active'][:size] = _days(previous['first_active'])
+        last = _days(previous['last_active'])
+        cols['last_active'][:size] = np.where(last == _NO_DAY, -_NO_DAY, last)
+    return cols
+
+
+def build_features(ua, events, iap, ads, previous=None):
+    """Gộp một lô (ua, events, iap, ads) chưa định kiểu (analytics.sources.read_sources) vào previous.
+
+    Ngày event của lô phải chưa có trong previous (xem update_features).
+    """
+    previous_ids = previous['user_id'] if previous is not None else pd.Series([], dtype=object)
+    (_, ua_key, ev_key, iap_key, ad_key), ids = user_keys(
+        previous_ids, ua['user_id'], events['user_id'], iap['user_id'], ads['user_id'])
+    n = len(ids)
+    cols = _grow(previous, n)
+
+    # UA: lô mới ghi đè thuộc tính của user có trong lô
+    ua = ua.assign(_key=ua_key)
+    ua = ua[ua['_key'] >= 0].drop_duplicates('_key')
+    key = ua['_key'].to_numpy()
+    cols['install_date'][key] = pd.to_datetime(ua['install_date']).to_numpy().astype('datetime64[s]')
+    cols['cpi'][key] = pd.to_numeric(ua['cpi'], errors='coerce').to_numpy(dtype=float)
+    for dim in DIMENSIONS:
+        cols[dim][key] = ua[dim].astype(object).fillna('Unknown').astype(str).to_numpy()
+
+    # Doanh thu theo nguồn
+    iap_valid, ad_valid = iap_key >= 0, ad_key >= 0
+    price = pd.to_numeric(iap['price'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    revenue = pd.to_numeric(ads['revenue'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    cols['iap_revenue'] += np.bincount(iap_key[iap_valid], weights=price[iap_valid], minlength=n)
+    cols['purchases'] += np.bincount(iap_key[iap_valid], minlength=n)
+    cols['ad_revenue'] += np.bincount(ad_key[ad_valid], weights=revenue[ad_valid], minlength=n)
+    cols['ad_views'] += np.bincount(ad_key[ad_valid], minlength=n)
+
+    # Hoạt động
+    day = _days(events['event_date'])
+    valid = (ev_key >= 0) & (day != _NO_DAY)
+    key, day = ev_key[valid].astype(np.int64), day[valid]
+    name = events['event_name'].astype(object).to_numpy()[valid]
+    np.minimum.at(cols['first_active'], key, day)
+    np.maximum.at(cols['last_active'], key, day)
+    if len(day):
+        # Cặp (user, ngày) khác nhau của lô
+        span_days = int(day.max() - day.min()) + 1
+        pairs = np.unique(key * span_days + (day - day.min()))
+        cols['active_days'] += np.bincount(pairs // span_days, minlength=n).astype(np.int32)
+    ts = pd.to_numeric(events['event_timestamp']).to_numpy(dtype=np.int64)[valid]
+    kinds = kind_codes(name)
+    sessions = sessionize(key, ts, kinds)
+    cols['sessions'] += np.bincount(sessions['user'], minlength=n)
+    # Event đầu của user trong lô nối tiếp session cuối của lô trước -> không phải session mới
+    first = sessions.drop_duplicates('user')['first'].to_numpy()
+    resumed = ((kinds[first] != SESSION_START)
+               & (cols['last_event'][key[first]] >= ts[first] - INACTIVITY_GAP * 1_000_000))
+    cols['sessions'] -= np.bincount(key[first][resumed], minlength=n)
+    np.maximum.at(cols['last_event'], key, ts)
+    level = pd.to_numeric(events['level_id'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)[valid]
+    has_level = ~np.isnan(level)
+    np.maximum.at(cols['max_level'], key[has_level], level[has_level].astype(np.int32))
+
+    cols['first_active'] = _dates(cols['first_active'])
+    cols['last_active'] = _dates(np.where(cols['last_active'] == -_NO_DAY, _NO_DAY, cols['last_active']))
+    frame = pd.DataFrame({'user_key': np.arange(n, dtype=np.int32), 'user_id': np.asarray(ids, dtype=object),
+                          **cols})
+    return frame[FEATURE_COLUMNS]
+
+
+# PERSISTENCE
+
+def features_path(data_dir):
+    return os.path.join(data_dir, FEATURES_FILE)
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def read_features(data_dir):
+    """(bảng feature, manifest) đã lưu; (None, None) nếu chưa có hoặc khác phiên bản."""
+    path = features_path(data_dir)
+    if not os.path.exists(path):
+        return None, None
+    table = pq.read_table(path)
+    manifest = json.loads((table.schema.metadata or {}).get(MANIFEST_KEY, b'{}'))
+    if manifest.get('version') != FEATURES_VERSION:
+        return None, None
+    return table.to_pandas(), manifest
+
+
+def save_features(features, data_dir, manifest):
+    path = features_path(data_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(features, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata,
+                                           MANIFEST_KEY: json.dumps(manifest).encode('utf-8')})
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def update_features(data_dir, rebuild=False):
+    """Bảng feature khớp dữ liệu nguồn hiện tại: (features, các file vừa gộp, có dựng lại toàn bộ không)."""
+    files = {os.path.relpath(path, data_dir): _stamp(path) for path in source_files(data_dir)}
+    features, manifest = (None, None) if rebuild else read_features(data_dir)
+    folded = (manifest or {}).get('files', {})
+    if features is not None and any(files.get(path) != stamp for path, stamp in folded.items()):
+        features = None  # File đã gộp bị sửa / xóa
+    new = sorted(files) if features is None else sorted(set(files) - set(folded))
+    if features is not None and not new:
+        return features, [], False
+
+    with span('features.read', files=len(new)):
+        tables = read_sources(data_dir, [os.path.join(data_dir, path) for path in new])
+    dates = set(pd.to_datetime(tables[1]['event_date']).dt.strftime('%Y-%m-%d').dropna())
+    full = features is None or bool(dates and manifest['dates'] and min(dates) <= max(manifest['dates']))
+    if full and features is not None:
+        # Lô mới có ngày không sau các ngày đã gộp: đọc lại toàn bộ
+        new = sorted(files)
+        with span('features.read', files=len(new)):
+            tables = read_sources(data_dir)
+        dates = set(pd.to_datetime(tables[1]['event_date']).dt.strftime('%Y-%m-%d').dropna())
+    with span('features.fold', files=len(new), full=full):
+        features = build_features(*tables, previous=None if full else features)
+    manifest = {'version': FEATURES_VERSION, 'files': files,
+                'dates': sorted(dates if full else dates | set(manifest['dates']))}
+    try:
+        save_features(features, data_dir, manifest)
+    except OSError:
+        pass  # Thư mục data chỉ đọc: vẫn dùng bảng trong bộ nhớ
+    return features, new, full
+
+
+def load_features(data_dir, rebuild=False):
+    return update_features(data_dir, rebuild)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - bảng feature theo user (cập nhật tăng dần)")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--rebuild', action='store_true', help="Bỏ bảng đã lưu, dựng lại từ toàn bộ dữ liệu")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None or not source_files(data_dir):
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+
+    started = time.perf_counter()
+    features, new, full = update_features(data_dir, args.rebuild)
+    mode = "dựng lại toàn bộ" if full else ("gộp tăng dần" if new else "không đổi")
+    print(f"-> {features_path(data_dir)}: {len(features):,} user, {len(new)} file mới ({mode}, "
+          f"{time.perf_counter() - started:.2f}s)")
+    print(features.drop(columns=['user_id']).describe().T[['mean', 'min', 'max']].to_string())
+
+
+if __name__ == "__main__":
+    main()
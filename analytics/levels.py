@@ -0,0 +1,171 @@
+"""
+Level analytics: funnel, churn, độ khó và kinh tế theo level trong một lượt.
+
+level_counts duyệt event có level_id đúng một lần và trả về các measure cộng
+được theo (group, level): churned (số user dừng ở level), attempts, wins,
+fails, winners (số user thắng level), attempts_to_first_win (tổng số lượt tới
+lần thắng đầu tiên) và gold_earned. Mọi phép tính là bincount / cumsum trên ô
+group * n_levels + level, không lặp theo level hay theo user.
+
+level_report dựng bảng theo level từ các measure đó (funnel, tỷ lệ thắng/thua,
+số lượt trung bình tới lần thắng đầu), cắt ở max_level bất kỳ; hai hàm
+difficulty_curve / economy_balance cho kết quả giống sql/05_game_difficulty.sql
+và sql/03_economy_balance.sql.
+
+    python analytics/levels.py --data-dir data --max-level 30
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir, load_tables
+
+LEVEL_MEASURES = ['churned', 'attempts', 'wins', 'fails', 'winners', 'attempts_to_first_win', 'gold_earned']
+WIN, FAIL = 1, 0
+OUTCOMES = {'level_complete': WIN, 'level_fail': FAIL}
+
+
+def outcome_codes(event_name):
+    """event_name -> WIN / FAIL, -1 với các event khác (level_start...)."""
+    return pd.Series(event_name).astype(str).map(OUTCOMES).fillna(-1).to_numpy(dtype=np.int8)
+
+
+def level_counts(user, level, outcome, gold=None, user_group=None, n_users=None):
+    """Các measure cộng được theo (group, level_id) sau một lượt qua event.
+
+    user: mã user 0..n_users-1 của từng event; level: level_id (>= 1);
+    outcome: WIN / FAIL / -1 (xem outcome_codes); gold: gold_earned (NaN nếu
+    không có); user_group: nhóm của từng user (ví dụ segment của cube), None =
+    một nhóm. Event của mỗi user phải theo thứ tự thời gian.
+    """
+    user = np.asarray(user, dtype=np.int64)
+    level = np.asarray(level, dtype=np.int64)
+    outcome = np.asarray(outcome)
+    n_users = int(n_users if n_users is not None else (user.max() + 1 if len(user) else 0))
+    user_group = np.zeros(n_users, dtype=np.int64) if user_group is None else np.asarray(user_group, dtype=np.int64)
+    n_groups = int(user_group.max()) + 1 if len(user_group) else 1
+    n_levels = int(level.max()) + 1 if len(level) else 1
+    size = n_groups * n_levels
+    cell = user_group[user] * n_levels + level
+
+    is_win = outcome == WIN
+    is_fail = outcome == FAIL
+    gold = np.zeros(len(level)) if gold is None else np.nan_to_num(np.asarray(gold, dtype=float))
+
+    # Churn: level cao nhất của từng user (0 = chưa chơi level nào)
+    user_max = np.zeros(n_users, dtype=np.int64)
+    np.maximum.at(user_max, user, level)
+    played = user_max > 0
+
+    # Lượt tới lần thắng đầu: gom lượt chơi theo (user, level), giữ thứ tự thời gian
+    rows = np.flatnonzero(is_win | is_fail)
+    key = user[rows] * n_levels + level[rows]
+    order = np.argsort(key, kind='stable')
+    key, won = key[order], is_win[rows][order].astype(np.int64)
+    boundary = np.ones(len(key), dtype=bool)
+    boundary[1:] = key[1:] != key[:-1]
+    starts = np.flatnonzero(boundary)
+    segment = np.cumsum(boundary) - 1
+    wins_before = np.cumsum(won) - won
+    wins_before -= wins_before[starts][segment]
+    to_first_win = np.bincount(segment, weights=wins_before == 0, minlength=len(starts))
+    has_win = np.bincount(segment, weights=won, minlength=len(starts)) > 0
+    segment_cell = user_group[key[starts] // n_levels] * n_levels + key[starts] % n_levels
+
+    counts = pd.DataFrame({
+        'group': np.repeat(np.arange(n_groups), n_levels),
+        'level_id': np.tile(np.arange(n_levels), n_groups),
+        'churned': np.bincount(user_group[played] * n_levels + user_max[played], minlength=size),
+        'attempts': np.bincount(cell[is_win | is_fail], minlength=size),
+        'wins': np.bincount(cell[is_win], minlength=size),
+        'fails': np.bincount(cell[is_fail], minlength=size),
+        'winners': np.bincount(segment_cell[has_win], minlength=size),
+        'attempts_to_first_win': np.bincount(segment_cell[has_win], weights=to_first_win[has_win],
+                                             minlength=size).astype(np.int64),
+        'gold_earned': np.bincount(cell[is_win], weights=gold[is_win], minlength=size),
+    })
+    return counts[counts['level_id'] > 0].reset_index(drop=True)
+
+
+def level_report(counts, max_level=None):
+    """Bảng theo level_id 1..max_level từ các measure của level_counts (đã cộng theo level).
+
+    reached (funnel) = số user có level cao nhất >= level, tính trên mọi level
+    trước khi cắt ở max_level (mặc định: level cao nhất có dữ liệu).
+    """
+    counts = counts.groupby('level_id')[LEVEL_MEASURES].sum() if 'level_id' in counts.columns else counts
+    top = int(counts.index.max()) if len(counts) else 0
+    max_level = int(max_level or top)
+    report = counts[LEVEL_MEASURES].reindex(pd.RangeIndex(1, max(top, max_level) + 1, name='level_id'),
+                                            fill_value=0)
+    report.insert(0, 'reached', report['churned'][::-1].cumsum()[::-1])
+    attempts = report['attempts'].where(report['attempts'] > 0)
+    report['win_rate'] = report['wins'] / attempts
+    report['fail_rate'] = report['fails'] / attempts
+    winners = report['winners'].where(report['winners'] > 0)
+    report['avg_attempts_to_first_win'] = report['attempts_to_first_win'] / winners
+    return report.loc[:max_level]
+
+
+def level_stats(events, max_level=None):
+    """level_report trực tiếp từ bảng events đã chuẩn hóa (analytics.sources)."""
+    events = events[events['level_id'].notna()]
+    user, _ = pd.factorize(events['user_id'])
+    gold = events['gold_earned'].to_numpy(dtype=float, na_value=np.nan) if 'gold_earned' in events else None
+    counts = level_counts(user, events['level_id'].to_numpy(dtype=np.int64), outcome_codes(events['event_name']), gold)
+    return level_report(counts, max_level)
+
+
+def difficulty_curve(report):
+    """Tương đương sql/05_game_difficulty.sql."""
+    curve = report[report['attempts'] > 0]
+    return pd.DataFrame({
+        'total_attempts': curve['attempts'],
+        'wins': curve['wins'],
+        'fails': curve['fails'],
+        'win_rate': curve['win_rate'].round(2),
+        'fail_rate': curve['fail_rate'].round(2),
+    }).reset_index()
+
+
+def economy_balance(report):
+    """Tương đương sql/03_economy_balance.sql (gold chỉ tính trên level_complete)."""
+    balance = report[report['wins'] > 0]
+    return pd.DataFrame({
+        'players_reached': balance['winners'],
+        'total_gold_source': balance['gold_earned'],
+        'avg_gold_per_level': (balance['gold_earned'] / balance['wins']).round(0),
+        'gold_per_user': (balance['gold_earned'] / balance['winners']).round(0),
+    }).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - level funnel / difficulty / economy")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--max-level', type=int, default=None, help="Mặc định: level cao nhất có dữ liệu")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None:
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+    _, events, _, _ = load_tables(data_dir)
+    report = level_stats(events, args.max_level)
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        print("=== Level funnel ===")
+        print(report[['reached', 'churned', 'attempts', 'wins', 'fails', 'win_rate',
+                      'avg_attempts_to_first_win']].round(2).to_string())
+        print("\n=== game_difficulty (05) ===")
+        print(difficulty_curve(report).to_string(index=False))
+        print("\n=== economy_balance (03) ===")
+        print(economy_balance(report).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
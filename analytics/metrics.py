@@ -0,0 +1,256 @@
+"""
+Các chỉ số của dashboard, tính từ rollup cube (analytics/cube.py) qua một
+backend (analytics/backends.py): lọc tier / khoảng ngày và GROUP BY chạy ở
+backend, ở đây chỉ nhận kết quả đã tổng hợp.
+
+Mỗi tab là một hàm thuần theo bộ tier và khoảng ngày đang chọn, được memo bằng
+LRU có giới hạn: đổi tab, bấm widget khác hay chọn lại một bộ lọc cũ không
+truy vấn lại. Khoảng ngày áp lên các cube có cột ngày (DAU, engagement,
+cohort LTV, pack / placement, retention); KPI trọn đời và funnel level không
+đổi theo ngày. Kết quả trả về dùng chung giữa các lần rerun, không được sửa tại chỗ.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from analytics.charts import OTHER
+from analytics.levels import LEVEL_MEASURES, level_report
+from analytics.cohorts import CohortMatrix, LTV_DAYS, BREAKDOWNS
+from analytics.retention import KPI_DAYS, retention_rates
+from analytics.engagement import EngagementSketches, WAU_DAYS
+from analytics.economy import economy_table
+from analytics.profiling import profiled
+
+CACHE_SIZE = 32
+FUNNEL_LEVELS = 20
+RETENTION_DAYS = 30
+
+
+class DashboardMetrics:
+    """Chỉ số theo tab của dashboard trên một backend cube."""
+
+    def __init__(self, backend, cache_size=CACHE_SIZE):
+        self.backend = backend
+        self.tiers = backend.distinct('users', 'tier')
+        levels = backend.query('levels', ['level_id'])
+        # Dòng chỉ có dòng tiền gold (level đang chơi sau level cuối) không tính
+        played = levels.index[levels[LEVEL_MEASURES].to_numpy().any(axis=1)]
+        self.max_level = int(played.max()) if len(played) else 0
+        daily = backend.query('daily', ['date'])
+        active = daily.index[daily['dau'] > 0]
+        # Khoảng báo cáo = mọi ngày có install hoặc event (event còn tiếp sau ngày install cuối)
+        days = daily.index[(daily['installs'] > 0) | (daily['dau'] > 0)]
+        self.period = (days.min().date(), days.max().date()) if len(days) else (None, None)
+        self.last_active = active.max() if len(active) else None
+        self._health = lru_cache(maxsize=cache_size)(self._compute_health)
+        self._ingame = lru_cache(maxsize=cache_size)(self._compute_ingame)
+        self._monetization = lru_cache(maxsize=cache_size)(self._compute_monetization)
+        self._cohorts = lru_cache(maxsize=cache_size)(self._compute_cohorts)
+        self._ltv = lru_cache(maxsize=cache_size)(self._compute_ltv)
+        self._retention = lru_cache(maxsize=cache_size)(self._compute_retention)
+        self._engagement = lru_cache(maxsize=cache_size)(self._compute_engagement)
+        self._activity = lru_cache(maxsize=cache_size)(self._compute_activity)
+        self._economy = lru_cache(maxsize=cache_size)(self._compute_economy)
+
+    @staticmethod
+    def key(selected_tiers):
+        """Khóa memo: thứ tự chọn trong multiselect không ảnh hưởng kết quả."""
+        return tuple(sorted(selected_tiers))
+
+    def dates(self, date_range):
+        """Khóa memo của khoảng ngày: None = toàn bộ (kể cả khi chọn đúng cả khoảng báo cáo)."""
+        if not date_range or len(date_range) != 2:
+            return None
+        dates = tuple(pd.Timestamp(d).date() if d is not None else None for d in date_range)
+        return None if dates == self.period else dates
+
+    @profiled('metrics.rollup')
+    def rollup(self, cube_name, tiers, by=(), period=None):
+        return self.backend.query(cube_name, by, {'tier': list(tiers)}, period)
+
+    @profiled('metrics.health')
+    def health(self, selected_tiers, date_range=None):
+        return self._health(self.key(selected_tiers), self.dates(date_range))
+
+    @profiled('metrics.ingame')
+    def ingame(self, selected_tiers, max_level=FUNNEL_LEVELS):
+        return self._ingame(self.key(selected_tiers), int(max_level))
+
+    @profiled('metrics.monetization')
+    def monetization(self, selected_tiers, date_range=None):
+        return self._monetization(self.key(selected_tiers), self.dates(date_range))
+
+    @profiled('metrics.ltv_curves')
+    def ltv_curves(self, selected_tiers, breakdown='tier', date_range=None, max_groups=None):
+        return self._ltv(self.key(selected_tiers), breakdown, self.dates(date_range), max_groups)
+
+    @profiled('metrics.engagement')
+    def engagement(self, selected_tiers, date_range=None):
+        return self._engagement(self.key(selected_tiers), self.dates(date_range))
+
+    @profiled('metrics.retention')
+    def retention(self, selected_tiers, max_day=RETENTION_DAYS, date_range=None):
+        return self._retention(self.key(selected_tiers), int(max_day), self.dates(date_range))
+
+    @profiled('metrics.activity')
+    def activity(self, selected_tiers):
+        return self._activity(self.key(selected_tiers))
+
+    @profiled('metrics.economy')
+    def economy(self, selected_tiers, date_range=None):
+        return self._economy(self.key(selected_tiers), self.dates(date_range))
+
+    def cache_info(self):
+        return {name: getattr(self, f"_{name}").cache_info()
+                for name in ('health', 'ingame', 'monetization', 'cohorts', 'ltv', 'retention', 'engagement',
+                             'activity', 'economy')}
+
+    def reporting_period(self):
+        return self.period
+
+    # TAB 1: GAME HEALTH
+
+    def _compute_health(self, tiers, period):
+        totals = self.rollup('users', tiers)
+        daily = self.rollup('daily', tiers, ['date'], period)
+        dau_series = daily['dau'][daily['dau'] > 0]
+        total_users = int(totals['users'])
+        sessions = daily['sessions'].sum()
+        per_session = (lambda total: total / sessions) if sessions else (lambda total: None)
+        session_days = daily[daily['sessions'] > 0]
+        return {
+            'avg_dau': int(dau_series.mean()) if len(dau_series) else 0,
+            # Doanh thu theo ngày phát sinh (trong khoảng ngày); ARPU trọn đời
+            'total_rev': daily['iap_revenue'].sum() + daily['ad_revenue'].sum(),
+            'total_users': total_users,
+            'arpu': (totals['iap_revenue'] + totals['ad_revenue']) / total_users if total_users > 0 else 0,
+            # Session dựng lại từ event (analytics.sessions); không có event -> None
+            'avg_session_min': per_session(daily['session_seconds'].sum() / 60),
+            'sessions_per_dau': sessions / daily['dau'].sum() if sessions else None,
+            'levels_per_session': per_session(daily['session_levels'].sum()),
+            'revenue_per_session': per_session(daily['session_revenue'].sum()),
+            'session_series': (session_days['session_seconds'] / session_days['sessions'] / 60).rename('minutes'),
+            'ads_per_user': totals['ad_views'] / max(total_users, 1),
+            'dau_series': dau_series,
+            'tier_counts': self.rollup('users', tiers, ['tier'])['users'],
+        }
+
+    def _compute_engagement(self, tiers, period):
+        """DAU / WAU / MAU / stickiness ước lượng từ HLL sketch của các segment đã chọn."""
+        if period is None:
+            cells = self.backend.cells('engagement', ['date', 'registers'], {'tier': list(tiers)})
+            return EngagementSketches.from_cells(cells).table()
+        # Lấy thêm các ngày trước khoảng để WAU / MAU ở đầu khoảng đủ cửa sổ
+        start, end = (pd.Timestamp(d) if d is not None else None for d in period)
+        wider = None if start is None else min(start - pd.Timedelta(days=WAU_DAYS - 1), start.replace(day=1))
+        cells = self.backend.cells('engagement', ['date', 'registers'], {'tier': list(tiers)}, (wider, end))
+        table = EngagementSketches.from_cells(cells).table()
+        return table[table.index >= start] if start is not None else table
+
+    # TAB 2: IN-GAME ANALYSIS
+
+    def _compute_ingame(self, tiers, max_level):
+        report = level_report(self.rollup('levels', tiers, ['level_id']), max_level)
+        played = report[report['attempts'] > 0]
+        return {
+            'funnel': pd.DataFrame({'level': [f"Lvl {lvl}" for lvl in report.index],
+                                    'users': report['reached'].to_numpy()}),
+            'churn_levels': report['churned'][report['churned'] > 0].head(10),
+            'level_outcomes': played[['wins', 'fails']],
+            'report': report,
+        }
+
+    def _compute_economy(self, tiers, period):
+        """Ví gold: số dư median / p90 / p99 và nguồn / tiêu theo ngày (trong khoảng) và theo level (trọn đời)."""
+        daily = self.rollup('daily', tiers, ['date'], period)
+        levels = self.rollup('levels', tiers, ['level_id'])
+        by_day = economy_table(self.rollup('wallet', tiers, ['date', 'bin'], period)['players'], daily)
+        by_level = economy_table(self.rollup('wallet_levels', tiers, ['level_id', 'bin'])['players'], levels)
+        source, sink = daily['gold_source'].sum(), daily['gold_sink'].sum()
+        return {
+            'gold_source': source,
+            'gold_sink': sink,
+            'source_sink_ratio': source / sink if sink > 0 else None,
+            'latest': by_day[by_day['players'] > 0].iloc[-1] if (by_day['players'] > 0).any() else None,
+            'daily': by_day,
+            'levels': by_level,
+        }
+
+    # TAB 3: MONETIZATION & LTV
+
+    def _compute_cohorts(self, tiers, period):
+        """CohortMatrix của các cohort install trong khoảng ngày, chỉ các segment thuộc tiers."""
+        keys = BREAKDOWNS + ['install_date']
+        return CohortMatrix.from_cubes({
+            'cohort_users': self.rollup('cohort_users', tiers, keys, period).reset_index(),
+            'cohort_revenue': self.rollup('cohort_revenue', tiers, keys + ['day_diff'], period).reset_index(),
+        })
+
+    def _compute_ltv(self, tiers, breakdown, period, max_groups=None):
+        """{nhóm: (DataFrame day_diff/ltv từ ngày 0 tới LTV_DAYS, CPI trung bình)} theo breakdown.
+
+        max_groups: chỉ giữ các nhóm nhiều install nhất, phần còn lại gộp vào OTHER
+        (LTV / CPI bình quân theo số install, đúng như một nhóm chung).
+        """
+        cohorts = self._cohorts(tiers, period)
+        labels, users, spend, _ = cohorts.matrix([breakdown])
+        curves = cohorts.ltv_curve([breakdown], max_day=LTV_DAYS).to_numpy()
+        installs, spend = users.sum(axis=1), spend.sum(axis=1)
+        order = [i for i in np.argsort(-installs, kind='stable') if installs[i] > 0]
+        kept = order if max_groups is None or len(order) <= max_groups else order[:max_groups - 1]
+        rest = order[len(kept):]
+        days = np.arange(LTV_DAYS + 1)
+        result = {labels[i]: (pd.DataFrame({'day_diff': days, 'ltv': curves[i]}), spend[i] / installs[i])
+                  for i in sorted(kept)}
+        if rest:
+            weights = installs[rest]
+            result[OTHER] = (pd.DataFrame({'day_diff': days, 'ltv': weights @ curves[rest] / weights.sum()}),
+                             spend[rest].sum() / weights.sum())
+        return result
+
+    def _compute_monetization(self, tiers, period):
+        totals = self.rollup('users', tiers)
+        total_users = int(totals['users'])
+        total_rev = totals['iap_revenue'] + totals['ad_revenue']
+        paying_users = int(totals['payers'])
+        return {
+            'paying_users': paying_users,
+            'paying_share': paying_users / max(total_users, 1),
+            'arppu': totals['iap_revenue'] / paying_users if paying_users else 0,
+            'avg_cpi': totals['cpi'] / total_users if total_users else 0,
+            'ads_share': totals['ad_revenue'] / total_rev if total_rev else 0,
+            'pack_rev': self.rollup('packs', tiers, ['pack'], period)['revenue'].sort_values(ascending=False),
+            'ads_place': self.rollup('placements', tiers, ['placement'], period)['revenue'],
+        }
+
+    # TAB 4: RETENTION
+
+    def _compute_retention(self, tiers, max_day, period):
+        """Ma trận cohort x Dn (ô chưa tới ngày = NaN) và D1/D3/D7 trung bình theo cohort đã đủ tuổi."""
+        cells = self.rollup('retention', tiers, ['cohort_date', 'day'], period)['users']
+        users = cells.unstack('day').reindex(columns=pd.RangeIndex(max_day + 1, name='day'))
+        if len(users):
+            # Ô đã tới ngày nhưng không có user nào quay lại = 0
+            reached = (self.last_active - users.index).days.to_numpy()[:, None] >= users.columns.to_numpy()[None, :]
+            users = users.fillna(0).where(reached)
+        rates = retention_rates(users)
+        return {
+            'users': users,
+            'rates': rates,
+            'kpi': {d: (users[d].sum() / users[0][users[d].notna()].sum() if users[d].notna().any() else None)
+                    if d in users.columns else None for d in KPI_DAYS},
+        }
+
+    def _compute_activity(self, tiers):
+        """Hoạt động trọn đời theo user (bảng feature): ngày active, session, level cao nhất, tỷ lệ lapsed."""
+        cells = self.rollup('activity', tiers, ['active_days'])
+        users = int(cells['users'].sum())
+        per_user = lambda total: total / users if users else 0
+        return {
+            'avg_active_days': per_user((cells.index.to_numpy() * cells['users'].to_numpy()).sum()),
+            'sessions_per_user': per_user(cells['sessions'].sum()),
+            'avg_max_level': per_user(cells['max_level'].sum()),
+            'lapsed_share': per_user(cells['lapsed'].sum()),
+            'active_days': cells['users'],
+        }
@@ -0,0 +1,180 @@
+"""
+Đo thời gian / bộ nhớ của các đoạn code nóng (generator, dựng cube, dashboard).
+
+Bật bằng biến môi trường ZOMBIE_PROFILE:
+  (không đặt) / 0   tắt: span() trả về context rỗng dùng chung, gần như không tốn gì
+  1                 thời gian từng span + đỉnh RSS của process (ru_maxrss)
+  memory            thêm đỉnh bộ nhớ cấp phát trong từng span (tracemalloc, gồm
+                    mảng NumPy; chậm hơn đáng kể nên chỉ dùng khi cần)
+
+Span lồng nhau được, ghi theo thread; mỗi process giữ MAX_SPANS span gần nhất
+(worker của chế độ --workers không được ghi). Xuất bằng to_json() hoặc
+to_chrome_trace() (mở ở chrome://tracing hoặc https://ui.perfetto.dev).
+
+    ZOMBIE_PROFILE=1 python data_generator/generate_data.py --trace trace.json
+    ZOMBIE_PROFILE=memory streamlit run streamlit_app/app.py
+"""
+import os
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_ENV = "ZOMBIE_PROFILE"
+MAX_SPANS = 20_000
+SPAN_COLUMNS = ['name', 'start', 'duration_ms', 'alloc_peak_mb', 'max_rss_mb', 'thread', 'depth', 'args']
+
+_NOOP = nullcontext()
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+
+
+class Profiler:
+    """Bộ ghi span dùng chung của process."""
+
+    def __init__(self, mode=None, max_spans=MAX_SPANS):
+        self.spans = deque(maxlen=max_spans)
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.mode = None
+        self.configure(mode)
+
+    def configure(self, mode):
+        """mode: None / '0' tắt, 'memory' đo thêm tracemalloc, giá trị khác chỉ đo thời gian."""
+        mode = (mode or '').strip().lower()
+        self.mode = None if mode in ('', '0', 'false', 'off', 'no') else ('memory' if mode == 'memory' else 'time')
+        if self.mode == 'memory' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, **args):
+        stack = self._stack()
+        frame = {'peak': 0, 'base': 0}
+        if self.mode == 'memory':
+            current, peak = tracemalloc.get_traced_memory()
+            # Đỉnh tới lúc này thuộc về span cha; đếm lại từ mức hiện tại
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame = {'peak': current, 'base': current}
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            alloc_peak = None
+            if self.mode == 'memory':
+                frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                alloc_peak = (frame['peak'] - frame['base']) / 2 ** 20
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+                tracemalloc.reset_peak()
+            record = (name, start - self.origin, duration * 1000, alloc_peak, _max_rss_mb(),
+                      threading.get_ident(), len(stack), args)
+            with self._lock:
+                self.spans.append(record)
+
+    def records(self):
+        """Các span đã ghi (SPAN_COLUMNS), start tính bằng giây từ lúc tạo profiler."""
+        with self._lock:
+            rows = list(self.spans)
+        return pd.DataFrame(rows, columns=SPAN_COLUMNS)
+
+    def summary(self):
+        """Tổng hợp theo tên span: số lần, tổng / trung bình / max / lần cuối (ms), đỉnh bộ nhớ."""
+        spans = self.records()
+        if not len(spans):
+            return pd.DataFrame(columns=['calls', 'total_ms', 'mean_ms', 'max_ms', 'last_ms',
+                                         'alloc_peak_mb', 'max_rss_mb'])
+        table = spans.groupby('name', sort=False).agg(
+            calls=('duration_ms', 'size'), total_ms=('duration_ms', 'sum'), mean_ms=('duration_ms', 'mean'),
+            max_ms=('duration_ms', 'max'), last_ms=('duration_ms', 'last'),
+            alloc_peak_mb=('alloc_peak_mb', 'max'), max_rss_mb=('max_rss_mb', 'max'))
+        return table.sort_values('total_ms', ascending=False)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def to_json(self, path=None):
+        """{'mode', 'spans', 'summary'} dạng JSON; ghi ra path nếu có."""
+        spans = self.records()
+        spans['thread'] = spans['thread'].astype(str)
+        payload = json.dumps({
+            'mode': self.mode,
+            'spans': json.loads(spans.to_json(orient='records')),
+            'summary': json.loads(self.summary().reset_index().to_json(orient='records')),
+        }, indent=2)
+        return _write(payload, path)
+
+    def to_chrome_trace(self, path=None):
+        """Định dạng Trace Event của Chrome (sự kiện 'X', đơn vị micro giây)."""
+        events = []
+        for span in self.records().itertuples(index=False):
+            args = {key: str(value) for key, value in span.args.items()}
+            for key in ('alloc_peak_mb', 'max_rss_mb'):
+                value = getattr(span, key)
+                if value is not None and value == value:
+                    args[key] = round(float(value), 3)
+            events.append({'name': span.name, 'cat': span.name.split('.')[0], 'ph': 'X',
+                           'ts': round(span.start * 1e6, 3), 'dur': round(span.duration_ms * 1e3, 3),
+                           'pid': os.getpid(), 'tid': int(span.thread), 'args': args})
+        return _write(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}), path)
+
+
+def _write(payload, path):
+    if path:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(payload)
+    return payload
+
+
+PROFILER = Profiler(os.environ.get(PROFILE_ENV))
+
+
+def span(name, **args):
+    """with span('stage'): ... — ghi vào PROFILER khi đang bật, không làm gì khi tắt."""
+    if PROFILER.mode is None:
+        return _NOOP
+    return PROFILER.span(name, **args)
+
+
+def profiled(name):
+    """Decorator: mỗi lần gọi hàm là một span `name`."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if PROFILER.mode is None:
+                return func(*args, **kwargs)
+            with PROFILER.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,225 @@
+"""
+Realtime: đọc luồng event của `generate_data.py --stream` và giữ các cửa sổ
+thời gian cập nhật tăng dần.
+
+LogTail đọc tiếp file log từ offset lần trước (chỉ các dòng mới, dòng đang ghi
+dở để lần sau); SocketTail nhận dòng từ socket ở một thread nền. Mỗi lần
+refresh, RealtimeWindows chỉ cộng lô event mới vào các bucket 1 giây theo tier
+và cập nhật lần thấy cuối của từng user; bucket / user cũ hơn cửa sổ dài nhất
+bị bỏ, nên bộ nhớ cố định theo cửa sổ chứ không theo lịch sử.
+
+Chỉ số của snapshot (cửa sổ trượt kết thúc ở thời điểm hiện tại, tính trên các giây trọn vẹn):
+  ccu:             số user có event trong CCU_WINDOW giây gần nhất
+  events_per_sec:  số event / giây trong RATE_WINDOW giây gần nhất
+  revenue_per_min: doanh thu IAP + quảng cáo trong 60 giây gần nhất
+  fail_rate:       level_fail / (level_complete + level_fail) trong FAIL_WINDOW giây
+
+    python analytics/realtime.py --data-dir data
+    python analytics/realtime.py --port 9009
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir
+from data_generator.stream import STREAM_DIR, STREAM_LOG, STREAM_COLUMNS
+
+HORIZON = 15 * 60  # Giây lịch sử giữ lại cho biểu đồ
+CCU_WINDOW = 60
+RATE_WINDOW = 10
+REVENUE_WINDOW = 60
+FAIL_WINDOW = 5 * 60
+TUMBLE = 10  # Độ rộng cửa sổ tumbling của biểu đồ (giây)
+BUCKET_MEASURES = ['events', 'revenue', 'wins', 'fails']
+
+
+def stream_log_path(data_dir):
+    return os.path.join(data_dir, STREAM_DIR, STREAM_LOG)
+
+
+def parse_lines(data):
+    """Các dòng NDJSON hoàn chỉnh -> DataFrame theo STREAM_COLUMNS."""
+    if not data:
+        return pd.DataFrame(columns=STREAM_COLUMNS)
+    return pa_json.read_json(pa.BufferReader(data)).to_pandas()
+
+
+class LogTail:
+    """Đọc tiếp file log append-only từ offset đã đọc."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return parse_lines(b'')
+        if os.path.getsize(self.path) < self.offset:
+            self.offset = 0  # Log bị tạo lại
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read()
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        return parse_lines(data[:end])
+
+
+class SocketTail:
+    """Nhận dòng từ socket TCP ở thread nền (tự kết nối lại), read() lấy các dòng đã nhận."""
+
+    def __init__(self, host, port, retry=1.0):
+        self.address = (host, port)
+        self.retry = retry
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with socket.create_connection(self.address) as conn:
+                    while chunk := conn.recv(1 << 16):
+                        with self._lock:
+                            self._buffer += chunk
+            except OSError:
+                pass
+            time.sleep(self.retry)
+
+    def read(self):
+        with self._lock:
+            end = self._buffer.rfind(b'\n') + 1
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        return parse_lines(data)
+
+
+class RealtimeWindows:
+    """Bucket 1 giây theo tier + lần thấy cuối của user, cập nhật bằng từng lô event mới."""
+
+    def __init__(self, horizon=HORIZON):
+        self.horizon = horizon
+        self.buckets = pd.DataFrame(columns=BUCKET_MEASURES, dtype=float,
+                                    index=pd.MultiIndex.from_arrays([[], []], names=['second', 'tier']))
+        self.last_seen = pd.DataFrame({'second': pd.Series(dtype=np.int64), 'tier': pd.Series(dtype=object)})
+        self.events_seen = 0
+
+    def update(self, events):
+        """Cộng một lô event mới (các cột STREAM_COLUMNS)."""
+        if not len(events):
+            return self
+        second = events['event_timestamp'].to_numpy(dtype=np.int64) // 1_000_000
+        name = events['event_name'].to_numpy()
+        batch = pd.DataFrame({
+            'second': second,
+            'tier': events['tier'].fillna('Unknown').to_numpy(),
+            'events': 1.0,
+            'revenue': events['revenue'].fillna(0.0).to_numpy(dtype=float),
+            'wins': (name == 'level_complete').astype(float),
+            'fails': (name == 'level_fail').astype(float),
+        })
+        self.buckets = batch.groupby(['second', 'tier']).sum().add(self.buckets, fill_value=0)
+        seen = batch.assign(user_id=events['user_id'].to_numpy()).groupby('user_id').agg(
+            second=('second', 'max'), tier=('tier', 'last'))
+        last_seen = pd.concat([self.last_seen, seen])
+        self.last_seen = last_seen[~last_seen.index.duplicated(keep='last')]
+        self.events_seen += len(events)
+
+        # Bỏ dữ liệu ngoài mọi cửa sổ
+        latest = int(second.max())
+        self.buckets = self.buckets[self.buckets.index.get_level_values('second') > latest - self.horizon]
+        self.last_seen = self.last_seen[self.last_seen['second'] > latest - CCU_WINDOW]
+        return self
+
+    def _window(self, tiers, now, seconds):
+        # Các giây đã trọn vẹn [now - seconds, now)
+        second = self.buckets.index.get_level_values('second')
+        mask = (second >= now - seconds) & (second < now)
+        if tiers is not None:
+            mask &= self.buckets.index.get_level_values('tier').isin(list(tiers))
+        return self.buckets[mask]
+
+    def snapshot(self, tiers=None, now=None):
+        """Chỉ số hiện tại (xem docstring module); tiers=None: mọi tier."""
+        now = int(time.time() if now is None else now)
+        users = self.last_seen[self.last_seen['second'] > now - CCU_WINDOW]
+        if tiers is not None:
+            users = users[users['tier'].isin(list(tiers))]
+        outcomes = self._window(tiers, now, FAIL_WINDOW)[['wins', 'fails']].sum()
+        played = outcomes['wins'] + outcomes['fails']
+        return {
+            'ccu': len(users),
+            'events_per_sec': self._window(tiers, now, RATE_WINDOW)['events'].sum() / RATE_WINDOW,
+            'revenue_per_min': self._window(tiers, now, REVENUE_WINDOW)['revenue'].sum() * 60 / REVENUE_WINDOW,
+            'fail_rate': outcomes['fails'] / played if played else None,
+        }
+
+    def series(self, tiers=None, now=None, width=TUMBLE):
+        """Cửa sổ tumbling `width` giây trong HORIZON: events/giây, doanh thu, tỷ lệ thua."""
+        now = int(time.time() if now is None else now)
+        window = self._window(tiers, now, self.horizon)
+        start = window.index.get_level_values('second') // width * width
+        frame = window.groupby(start).sum()
+        frame.index = pd.to_datetime(frame.index, unit='s').rename('time')
+        played = frame['wins'] + frame['fails']
+        return pd.DataFrame({
+            'events_per_sec': frame['events'] / width,
+            'revenue': frame['revenue'],
+            'fail_rate': frame['fails'] / played.where(played > 0),
+        })
+
+
+class RealtimeFeed:
+    """Nguồn (LogTail / SocketTail) + RealtimeWindows, refresh an toàn khi nhiều session cùng gọi."""
+
+    def __init__(self, tail, windows=None):
+        self.tail = tail
+        self.windows = windows or RealtimeWindows()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Đọc và cộng các event mới; trả về số event mới."""
+        with self._lock:
+            events = self.tail.read()
+            self.windows.update(events)
+            return len(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - chỉ số realtime từ luồng event")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--port', type=int, default=None, help="Đọc từ socket 127.0.0.1:PORT thay cho log")
+    parser.add_argument('--interval', type=float, default=2.0, help="Số giây giữa hai lần in")
+    args = parser.parse_args()
+
+    if args.port:
+        tail = SocketTail('127.0.0.1', args.port)
+    else:
+        data_dir = args.data_dir or find_data_dir() or "data"
+        tail = LogTail(stream_log_path(data_dir))
+    feed = RealtimeFeed(tail)
+    try:
+        while True:
+            new = feed.refresh()
+            snap = feed.windows.snapshot()
+            fail_rate = "n/a" if snap['fail_rate'] is None else f"{snap['fail_rate']:.1%}"
+            print(f"+{new:>6,} events | CCU {snap['ccu']:>6,} | {snap['events_per_sec']:>8,.0f} ev/s | "
+                  f"${snap['revenue_per_min']:>8,.2f}/min | fail rate {fail_rate}", flush=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Retention engine dạng bitmap: D1 / D3 / D7 / Dn cho mọi cohort mà không cần join.
+
+Mỗi ngày hoạt động là một bitset (mảng uint64) theo vị trí bit của user. User
+mới (lần đầu active) được cấp vị trí liên tiếp theo block (ngày cohort, group),
+mỗi block bắt đầu ở đầu một word 64 bit. Nhờ vậy số user của một block active
+trong ngày d = popcount trên đúng dải word của block: mỗi ngày mới chỉ cần một
+lần popcount + cumsum trên bitset của ngày đó, ma trận counts[block, ngày] được
+nối thêm một cột, các ngày cũ không phải tính lại.
+
+Cohort giống sql/02_retention_kpi.sql: ngày active đầu tiên của user; Dn là
+số ngày lịch (DATE_DIFF), ngày không có event vẫn chiếm một cột.
+
+    python analytics/retention.py --data-dir data --days 1 3 7 14
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir, load_tables
+
+WORD_BITS = 64
+KPI_DAYS = (1, 3, 7)
+
+
+class RetentionBitmap:
+    """Bitset hoạt động theo ngày, user khóa bằng chỉ số dense 0..n-1."""
+
+    def __init__(self):
+        self.days = np.empty(0, dtype='datetime64[D]')
+        self.bits = []  # Mỗi ngày một mảng uint64 (độ dài = số word tại ngày đó)
+        self.block_cohort = np.empty(0, dtype=np.int64)  # Chỉ số ngày cohort của block
+        self.block_group = np.empty(0, dtype=object)
+        self.block_start = np.empty(0, dtype=np.int64)  # Word đầu tiên của block
+        self.counts = np.zeros((0, 0), dtype=np.int64)  # [block, ngày]: số user active
+        self.n_words = 0
+        self._position = np.empty(0, dtype=np.int64)  # user -> vị trí bit (-1: chưa active)
+
+    def _add_users(self, new, groups):
+        """Cấp vị trí bit cho user mới của ngày cuối, mỗi group một block căn theo word."""
+        group = np.zeros(len(new), dtype=np.int64) if groups is None else np.asarray(groups)[new]
+        labels, block_of, sizes = np.unique(group, return_inverse=True, return_counts=True)
+        words = -(-sizes // WORD_BITS)
+        starts = self.n_words + np.cumsum(words) - words
+        order = np.argsort(block_of, kind='stable')
+        rank = np.empty(len(new), dtype=np.int64)
+        rank[order] = np.arange(len(new)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        self._position[new] = starts[block_of] * WORD_BITS + rank
+
+        self.n_words += int(words.sum())
+        self.block_cohort = np.concatenate([self.block_cohort, np.full(len(labels), len(self.days) - 1)])
+        self.block_group = np.concatenate([self.block_group, labels.astype(object)])
+        self.block_start = np.concatenate([self.block_start, starts])
+        self.counts = np.pad(self.counts, ((0, len(labels)), (0, 0)))
+
+    def append_day(self, date, users, groups=None):
+        """Thêm một ngày hoạt động (theo thứ tự thời gian).
+
+        users: chỉ số dense của các user active trong ngày (được phép trùng);
+        groups: group của từng user theo chỉ số dense (ví dụ tier / segment),
+        chỉ dùng khi user active lần đầu. Ngày bị bỏ qua (không có event) được
+        thêm dưới dạng ngày rỗng để cột thứ N luôn là ngày lịch cohort + N.
+        """
+        date = np.datetime64(date, 'D')
+        if len(self.days) and date <= self.days[-1]:
+            raise ValueError(f"Days must be appended in order: {date} after {self.days[-1]}")
+        while len(self.days) and date > self.days[-1] + 1:
+            self.append_day(self.days[-1] + 1, [])
+        users = np.asarray(users, dtype=np.int64)
+        if len(users) and users.max() >= len(self._position):
+            self._position = np.pad(self._position, (0, int(users.max()) + 1 - len(self._position)),
+                                    constant_values=-1)
+        self.days = np.append(self.days, date)
+        self.counts = np.pad(self.counts, ((0, 0), (0, 1)))
+        # Bỏ trùng bằng mask theo chỉ số dense (nhanh hơn np.unique ở hàng triệu user)
+        is_new = np.zeros(len(self._position), dtype=bool)
+        is_new[users[self._position[users] < 0]] = True
+        new = np.flatnonzero(is_new)
+        if len(new):
+            self._add_users(new, groups)
+
+        bitmap = np.zeros(self.n_words * WORD_BITS, dtype=bool)
+        bitmap[self._position[users]] = True
+        words = np.packbits(bitmap, bitorder='little').view(np.uint64)
+        self.bits.append(words)
+        # popcount theo word -> cumsum -> cắt theo dải word của từng block
+        ones = np.concatenate([[0], np.cumsum(np.bitwise_count(words), dtype=np.int64)])
+        ends = np.append(self.block_start[1:], self.n_words)
+        self.counts[:, -1] = ones[ends] - ones[self.block_start]
+        return self
+
+    @classmethod
+    def from_events(cls, dates, users, groups=None):
+        """Dựng từ các cặp (ngày, user dense) bất kỳ thứ tự."""
+        bitmap = cls()
+        days = pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]')
+        users = np.asarray(users, dtype=np.int64)
+        order = np.argsort(days, kind='stable')
+        days, users = days[order], users[order]
+        unique_days, starts = np.unique(days, return_index=True)
+        for i, day in enumerate(unique_days):
+            stop = starts[i + 1] if i + 1 < len(starts) else len(days)
+            bitmap.append_day(day, users[starts[i]:stop], groups)
+        return bitmap
+
+    def cells(self):
+        """Dạng dài (block, cohort_date, day N, users) các ô khác 0, N = ngày - ngày cohort."""
+        block, day = np.nonzero(self.counts)
+        return pd.DataFrame({
+            'block': block,
+            'cohort_date': self.days[self.block_cohort[block]],
+            'day': day - self.block_cohort[block],
+            'users': self.counts[block, day],
+        })
+
+    def retention(self, groups=None, max_day=None):
+        """Ma trận cohort_date x N: số user của cohort active ở ngày cohort + N (N=0: cohort size).
+
+        groups: chỉ tính các block thuộc các group này. Ô chưa tới ngày = NaN.
+        """
+        n_days = len(self.days)
+        max_day = n_days - 1 if max_day is None else max_day
+        rows = np.ones(len(self.block_cohort), dtype=bool) if groups is None else np.isin(self.block_group, list(groups))
+        by_cohort = np.zeros((n_days, n_days), dtype=np.int64)
+        np.add.at(by_cohort, self.block_cohort[rows], self.counts[rows])
+        # by_cohort[c, d] -> matrix[c, d - c]
+        offset = np.arange(max_day + 1)[None, :] + np.arange(n_days)[:, None]
+        valid = offset < n_days
+        matrix = np.where(valid, by_cohort[np.arange(n_days)[:, None], np.minimum(offset, n_days - 1)], np.nan)
+        frame = pd.DataFrame(matrix, index=pd.DatetimeIndex(self.days, name='cohort_date'),
+                             columns=pd.RangeIndex(max_day + 1, name='day'))
+        return frame[frame[0] > 0]
+
+
+def retention_kpi(matrix, days=KPI_DAYS):
+    """Bảng giống sql/02_retention_kpi.sql từ ma trận retention (ô chưa tới ngày = 0)."""
+    kpi = pd.DataFrame({'cohort_size': matrix[0]})
+    for d in days:
+        kpi[f"d{d}_retention"] = matrix[d].fillna(0) if d in matrix.columns else 0
+    return kpi.astype(np.int64).sort_index(ascending=False).reset_index()
+
+
+def retention_rates(matrix):
+    """Tỷ lệ retention (chia cho cohort size)."""
+    return matrix.div(matrix[0], axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - cohort retention (bitmap)")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--days', nargs='+', type=int, default=list(KPI_DAYS), help="Các mốc Dn (mặc định 1 3 7)")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None:
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+    _, events, _, _ = load_tables(data_dir)
+    users, _ = pd.factorize(events['user_id'])
+    bitmap = RetentionBitmap.from_events(events['event_date'], users)
+    print(retention_kpi(bitmap.retention(max_day=max(args.days)), args.days).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
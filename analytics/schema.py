@@ -0,0 +1,54 @@
+"""
+Kiểu dữ liệu của 4 bảng đã chuẩn hóa (xem analytics.sources).
+
+Cột dạng enum (source, tier, event_name, pack, placement...) là categorical, số
+đo dùng float32 / Int16 (cột tiền - cpi, price, revenue - giữ float64 để tổng
+doanh thu không lệch do làm tròn), và user_id của cả 4 bảng được thay bằng một khóa dense
+int32 dùng chung: user trong UA nhận khóa theo thứ tự xuất hiện trong UA, user
+chỉ có ở event / IAP / ads nhận các khóa tiếp theo. Join, groupby và
+get_indexer theo user vì vậy chạy trên số nguyên thay cho chuỗi UUID. Khóa ổn
+định giữa các lần đọc khi UA chỉ được append.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+USER_KEY = np.int32
+
+# Cột -> dtype; None = giữ nguyên kiểu lúc đọc (datetime)
+TABLE_SCHEMAS = {
+    'ua': {'user_id': USER_KEY, 'install_date': None, 'source': 'category', 'campaign_id': 'category',
+           'country': 'category', 'tier': 'category', 'os': 'category', 'cpi': np.float64},
+    'events': {'user_id': USER_KEY, 'event_date': None, 'event_timestamp': np.int64, 'event_name': 'category',
+               'level_id': 'Int16', 'gold_earned': np.float32, 'price': np.float64},
+    'iap': {'user_id': USER_KEY, 'timestamp': None, 'pack': 'category', 'price': np.float64},
+    'ads': {'user_id': USER_KEY, 'timestamp': None, 'placement': 'category', 'revenue': np.float64},
+}
+
+
+def user_keys(ua_ids, *other_ids):
+    """Khóa dense cho user_id của UA rồi của từng bảng còn lại; trả về (danh sách mảng khóa, user_id theo khóa).
+
+    Một bảng băm pyarrow duy nhất cho mọi bảng: khóa = thứ tự xuất hiện đầu tiên.
+    """
+    tables = [pa.chunked_array(pa.Array.from_pandas(pd.Series(ids))).cast(pa.large_string())
+              for ids in (ua_ids, *other_ids)]
+    encoded = pa.chunked_array([c for table in tables for c in table.chunks], type=pa.large_string())
+    encoded = encoded.dictionary_encode()
+    indices = pa.chunked_array([c.indices for c in encoded.chunks], type=pa.int32()).fill_null(-1)
+    bounds = np.cumsum([0] + [len(table) for table in tables])
+    keys = [indices.slice(start, stop - start).to_numpy().astype(USER_KEY)
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+    dictionary = encoded.chunks[-1].dictionary if encoded.num_chunks else pa.array([], pa.large_string())
+    return keys, pd.Index(dictionary.to_pandas())
+
+
+def apply_schema(ua, events, iap, ads):
+    """(ua, events, iap, ads) theo TABLE_SCHEMAS, user_id thay bằng khóa int32 chung."""
+    keys, _ = user_keys(ua['user_id'], events['user_id'], iap['user_id'], ads['user_id'])
+    tables = []
+    for (name, schema), table, key in zip(TABLE_SCHEMAS.items(), (ua, events, iap, ads), keys):
+        table = table.assign(user_id=key)
+        dtypes = {c: t for c, t in schema.items() if t is not None and c != 'user_id' and c in table.columns}
+        tables.append(table.astype(dtypes))
+    return tuple(tables)
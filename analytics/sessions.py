@@ -0,0 +1,275 @@
+"""
+Dựng lại session từ luồng event bằng phép toán mảng (không groupby-apply theo user).
+
+Event được sắp xếp theo (user, thời gian); session mới bắt đầu khi đổi user, gặp
+session_start hoặc cách event trước quá INACTIVITY_GAP giây. Mỗi session là một
+đoạn liền nhau của mảng đã sắp xếp, các measure là phép cộng theo đoạn
+(np.add.reduceat):
+  start (µs), duration_s (event đầu -> event cuối), events,
+  levels (level_start), ads (ad_reward_claim), revenue (giá IAP)
+
+Chạy theo lô trên các file event (CSV phẳng kể cả increments/, hoặc partition
+Parquet): mỗi lô được chia theo hash user_id vào BUCKETS file tạm (25 byte /
+event), rồi từng bucket được sắp xếp và cắt session riêng. Mọi event của một
+user nằm chung bucket, nên bộ nhớ chỉ cần cho một lô và một bucket.
+
+    python analytics/sessions.py --data-dir data [--output sessions.parquet]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from analytics.sources import find_data_dir, source_files, event_batches
+from analytics.profiling import span
+
+INACTIVITY_GAP = 30 * 60  # Giây, như timeout session mặc định của GA4
+BUCKETS = 16  # Tối đa 65536
+BATCH_ROWS = 1_000_000
+# Mã loại event; 0 = event khác
+KINDS = ('session_start', 'level_start', 'ad_reward_claim', 'iap_purchase')
+SESSION_START, LEVEL_START, AD_CLAIM, IAP_PURCHASE = range(1, len(KINDS) + 1)
+EVENT_DTYPE = np.dtype([('user', '<u8'), ('ts', '<i8'), ('kind', 'i1'), ('price', '<f8')])
+STREAM_COLUMNS = ['user_id', 'event_timestamp', 'event_name', 'price']
+SESSION_COLUMNS = ['user', 'start', 'duration_s', 'events', 'levels', 'ads', 'revenue']
+
+
+def _codes(categories, indices):
+    """Mã KINDS cho mảng chỉ số vào `categories` (-1 = null)."""
+    lookup = np.append(pd.Index(KINDS).get_indexer(categories) + 1, 0).astype(np.int8)
+    return lookup[indices]
+
+
+def kind_codes(names):
+    """Tên event (chuỗi hoặc categorical) -> mã int8 theo KINDS."""
+    names = pd.Categorical(names)
+    return _codes(names.categories, names.codes)
+
+
+def user_time_order(users, timestamps, first=None):
+    """Thứ tự sắp xếp theo (user, thời gian); first: event đứng trước các event khác cùng thời điểm.
+
+    Gói (hạng user, thời gian tương đối, cờ) vào một khóa int64 rồi argsort một
+    lần; khóa vượt 63 bit (rất nhiều user x khoảng thời gian dài) -> lexsort.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    later = np.zeros(len(timestamps), dtype=bool) if first is None else ~np.asarray(first, dtype=bool)
+    if len(timestamps) == 0:
+        return np.zeros(0, dtype=np.int64)
+    _, rank = np.unique(users, return_inverse=True)
+    offset = timestamps - timestamps.min()
+    time_bits = int(offset.max()).bit_length() + 1
+    if int(rank.max()).bit_length() + time_bits <= 63:
+        return np.argsort((rank.astype(np.int64) << time_bits) | (offset << 1) | later)
+    return np.lexsort((later, timestamps, users))
+
+
+def sessionize(users, timestamps, kinds, price=None, gap=INACTIVITY_GAP):
+    """Cắt session cho các event (users, timestamps µs, kinds theo kind_codes, price IAP).
+
+    Trả về DataFrame mỗi dòng một session, sắp theo (user, start), kèm cột
+    first = chỉ số (trong input) của event đầu session để lấy thêm thuộc tính
+    (ngày, segment...).
+    """
+    users = np.asarray(users)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    kinds = np.asarray(kinds)
+    n = len(users)
+    if n == 0:
+        return pd.DataFrame({'user': users[:0], 'start': timestamps[:0], 'duration_s': np.zeros(0),
+                             'events': np.zeros(0, np.int64), 'levels': np.zeros(0, np.int64),
+                             'ads': np.zeros(0, np.int64), 'revenue': np.zeros(0), 'first': np.zeros(0, np.int64)})
+    order = user_time_order(users, timestamps, kinds == SESSION_START)
+    user, ts, kind = users[order], timestamps[order], kinds[order]
+
+    new = np.empty(n, dtype=bool)
+    new[0] = True
+    np.not_equal(user[1:], user[:-1], out=new[1:])
+    new[1:] |= kind[1:] == SESSION_START
+    new[1:] |= np.diff(ts) > gap * 1_000_000
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], n)
+
+    revenue = np.zeros(len(starts))
+    if price is not None:
+        paid = np.nan_to_num(np.asarray(price, dtype=np.float64)[order]) * (kind == IAP_PURCHASE)
+        revenue = np.add.reduceat(paid, starts)
+    return pd.DataFrame({
+        'user': user[starts],
+        'start': ts[starts],
+        'duration_s': (ts[ends - 1] - ts[starts]) / 1_000_000,
+        'events': ends - starts,
+        'levels': np.add.reduceat((kind == LEVEL_START).astype(np.int64), starts),
+        'ads': np.add.reduceat((kind == AD_CLAIM).astype(np.int64), starts),
+        'revenue': revenue,
+        'first': order[starts],
+    })
+
+
+# STREAMING
+
+def _hash_users(column):
+    """Hash uint64 của user_id; chỉ hash mỗi giá trị khác nhau một lần trong lô."""
+    encoded = pc.dictionary_encode(column)
+    values = encoded.dictionary.to_numpy(zero_copy_only=False).astype(object)
+    hashes = pd.util.hash_array(values, categorize=False)  # dictionary đã không trùng
+    indices = encoded.indices.fill_null(0).to_numpy()
+    return hashes[indices] if len(hashes) else np.zeros(len(indices), dtype=np.uint64)
+
+
+def _kinds(column):
+    encoded = column if pa.types.is_dictionary(column.type) else pc.dictionary_encode(column)
+    return _codes(encoded.dictionary.to_numpy(zero_copy_only=False), encoded.indices.fill_null(-1).to_numpy())
+
+
+class SessionBuilder:
+    """Nhận event theo lô, chia theo hash user vào các file bucket tạm; sessions() cắt session từng bucket."""
+
+    def __init__(self, buckets=BUCKETS, gap=INACTIVITY_GAP, work_dir=None):
+        self.buckets = buckets
+        self.gap = gap
+        self.events = 0
+        self._dir = tempfile.mkdtemp(prefix='sessions-', dir=work_dir)
+        self._files = [open(os.path.join(self._dir, f"{i}.bin"), 'wb') for i in range(buckets)]
+
+    def add_batch(self, batch):
+        """Một pyarrow RecordBatch / Table có các cột STREAM_COLUMNS."""
+        if isinstance(batch, pa.Table):
+            for part in batch.to_batches():
+                self.add_batch(part)
+            return
+        timestamps = batch.column('event_timestamp')
+        valid = pc.and_(pc.is_valid(timestamps), pc.is_valid(batch.column('user_id'))).to_numpy(zero_copy_only=False)
+        price = batch.column('price').cast(pa.float64()).fill_null(0).to_numpy(zero_copy_only=False)
+        self.add(_hash_users(batch.column('user_id'))[valid], timestamps.fill_null(0).to_numpy()[valid],
+                 _kinds(batch.column('event_name'))[valid], price[valid])
+
+    def add(self, users, timestamps, kinds, price):
+        rows = np.empty(len(users), dtype=EVENT_DTYPE)
+        rows['user'], rows['ts'], rows['kind'], rows['price'] = users, timestamps, kinds, price
+        # Khóa bucket uint16: numpy sắp xếp ổn định bằng radix sort
+        bucket = (rows['user'] % self.buckets).astype(np.uint16)
+        order = np.argsort(bucket, kind='stable')
+        bounds = np.searchsorted(bucket[order], np.arange(self.buckets + 1))
+        rows = rows[order]
+        for i in range(self.buckets):
+            rows[bounds[i]:bounds[i + 1]].tofile(self._files[i])
+        self.events += len(rows)
+
+    def sessions(self):
+        """Lần lượt DataFrame session của từng bucket (user = hash user_id); xóa file bucket sau khi đọc."""
+        for file in self._files:
+            file.close()
+        for i in range(self.buckets):
+            path = os.path.join(self._dir, f"{i}.bin")
+            rows = np.fromfile(path, dtype=EVENT_DTYPE)
+            os.remove(path)
+            with span('sessions.bucket', bucket=i, events=len(rows)):
+                sessions = sessionize(rows['user'], rows['ts'], rows['kind'], rows['price'], self.gap)
+            yield sessions[SESSION_COLUMNS]
+
+    def close(self):
+        for file in self._files:
+            file.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_sessions(data_dir, buckets=BUCKETS, gap=INACTIVITY_GAP, batch_rows=BATCH_ROWS, work_dir=None):
+    """Session của toàn bộ file event, đọc theo lô: lần lượt DataFrame theo bucket."""
+    with SessionBuilder(buckets, gap, work_dir) as builder:
+        with span('sessions.partition'):
+            for batch in event_batches(data_dir, STREAM_COLUMNS, batch_rows):
+                builder.add_batch(batch)
+        yield from builder.sessions()
+
+
+def summarize(frames):
+    """KPI tổng hợp từ các DataFrame session (mỗi user nằm trọn trong một frame)."""
+    sessions = events = users = levels = ads = 0
+    revenue = 0.0
+    durations = []
+    for frame in frames:
+        sessions += len(frame)
+        users += frame['user'].nunique()
+        events += int(frame['events'].sum())
+        levels += int(frame['levels'].sum())
+        ads += int(frame['ads'].sum())
+        revenue += float(frame['revenue'].sum())
+        durations.append(frame['duration_s'].to_numpy())
+    durations = np.concatenate(durations) if durations else np.zeros(0)
+    per_session = (lambda total: total / sessions) if sessions else (lambda total: None)
+    return {
+        'sessions': sessions,
+        'users': users,
+        'events': events,
+        'sessions_per_user': sessions / users if users else None,
+        'avg_session_min': per_session(durations.sum() / 60),
+        'median_session_min': float(np.median(durations)) / 60 if sessions else None,
+        'levels_per_session': per_session(levels),
+        'ads_per_session': per_session(ads),
+        'revenue_per_session': per_session(revenue),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - dựng session từ event (theo lô)")
+    parser.add_argument('--data-dir', default=None, help="Mặc định: thư mục data đầu tiên tìm thấy")
+    parser.add_argument('--gap', type=float, default=INACTIVITY_GAP, help="Khoảng không hoạt động cắt session (giây)")
+    parser.add_argument('--buckets', type=int, default=BUCKETS, help="Số bucket theo hash user (file tạm)")
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS, help="Số event mỗi lô đọc")
+    parser.add_argument('--work-dir', default=None, help="Thư mục cho file bucket tạm (mặc định: thư mục tạm hệ thống)")
+    parser.add_argument('--output', default=None, help="Ghi bảng session ra file Parquet")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or find_data_dir()
+    if data_dir is None or not source_files(data_dir):
+        parser.error("Không tìm thấy dữ liệu. Chạy data_generator/generate_data.py trước.")
+
+    started = time.perf_counter()
+    frames = stream_sessions(data_dir, args.buckets, args.gap, args.batch_rows, args.work_dir)
+    writer = None
+    if args.output:
+        def written(frames):
+            nonlocal writer
+            for frame in frames:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                writer = writer or pq.ParquetWriter(args.output, table.schema)
+                writer.write_table(table)
+                yield frame
+        frames = written(frames)
+    try:
+        kpis = summarize(frames)
+    finally:
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"-> {kpis['events']:,} event, {kpis['sessions']:,} session, {kpis['users']:,} user "
+          f"({elapsed:.2f}s, {kpis['events'] / max(elapsed, 1e-9):,.0f} event/s)")
+    for name, value in kpis.items():
+        if name not in ('sessions', 'users', 'events'):
+            print(f"   {name:<22} {'n/a' if value is None else f'{value:,.3f}'}")
+    if writer is not None:
+        print(f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
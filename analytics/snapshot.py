@@ -0,0 +1,108 @@
+"""
+Snapshot dữ liệu dùng chung cho mọi session của dashboard, làm mới ở nền.
+
+Một SnapshotStore mỗi process giữ một giá trị chỉ đọc (DashboardMetrics); mọi
+session dùng chung cùng object, không copy. Thread nền kiểm tra dữ liệu nguồn
+mỗi `interval` giây (fingerprint kích thước / mtime, không đọc file); khi dữ
+liệu đổi thì dựng giá trị mới ngoài lock đọc rồi thay bằng một phép gán, nên
+session không bao giờ chờ reload và mỗi lần rerun thấy trọn một phiên bản.
+
+Dữ liệu đang được ghi dở không bị nạp: phải thấy cùng một fingerprint ở hai lần
+kiểm tra liên tiếp mới dựng lại. Dựng lỗi thì giữ snapshot cũ và ghi lại lỗi.
+
+    ZOMBIE_REFRESH_SECONDS=10 streamlit run streamlit_app/app.py   # 0 = tắt làm mới nền
+"""
+import os
+import time
+import threading
+from typing import Any, NamedTuple
+
+from analytics.profiling import span
+
+REFRESH_ENV = "ZOMBIE_REFRESH_SECONDS"
+REFRESH_SECONDS = 30.0
+
+
+class Snapshot(NamedTuple):
+    value: Any
+    version: Any
+    loaded_at: float
+    generation: int
+
+
+class SnapshotStore:
+    """Giữ snapshot hiện tại; load() dựng giá trị mới, version() trả khóa dữ liệu nguồn."""
+
+    def __init__(self, load, version, interval=REFRESH_SECONDS):
+        self._load = load
+        self._version = version
+        self.interval = interval
+        self.error = None
+        self._snapshot = None
+        self._pending = None
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def snapshot(self):
+        """Snapshot hiện tại (None trước lần nạp đầu); đọc một lần cho cả lượt rerun."""
+        return self._snapshot
+
+    def get(self):
+        snapshot = self._snapshot
+        return None if snapshot is None else snapshot.value
+
+    def refresh(self, force=False):
+        """Dựng lại nếu dữ liệu nguồn đã đổi và ổn định; True nếu snapshot được thay."""
+        with self._build_lock:
+            current = self._snapshot
+            version = self._version()
+            if not force and current is not None:
+                if version == current.version:
+                    self._pending = None
+                    return False
+                # Lần đầu thấy khóa mới: đợi lần kiểm tra sau (file có thể đang ghi dở)
+                if version != self._pending:
+                    self._pending = version
+                    return False
+            with span('snapshot.build'):
+                value = self._load()
+            # Dữ liệu đổi trong lúc dựng: giữ khóa cũ để lần sau dựng lại
+            if self._version() != version:
+                version = self._pending = None
+            else:
+                self._pending = None
+            generation = current.generation + 1 if current is not None else 1
+            self._snapshot = Snapshot(value, version, time.time(), generation)
+            self.error = None
+            return True
+
+    def start(self):
+        """Nạp lần đầu (đồng bộ) rồi chạy thread làm mới nền nếu interval > 0."""
+        if self._snapshot is None:
+            self.refresh(force=True)
+        if self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='snapshot-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as exc:  # giữ snapshot cũ, thử lại ở lần sau
+                self.error = exc
+                self._pending = None
+
+
+def refresh_interval():
+    """Chu kỳ làm mới (giây) từ ZOMBIE_REFRESH_SECONDS, mặc định REFRESH_SECONDS."""
+    value = os.environ.get(REFRESH_ENV)
+    return float(value) if value not in (None, '') else REFRESH_SECONDS
@@ -0,0 +1,308 @@
+"""
+Đọc dữ liệu nguồn cho dashboard và các engine phân tích.
+
+Hỗ trợ ba kiểu thư mục data/:
+  * dataset Parquet của generator (data/parquet/<table>/, --format parquet),
+  * output text của generator (user_acquisition.csv, user_events_flat.csv, kể cả
+    các ngày append trong increments/); IAP / quảng cáo được tách từ bảng event,
+  * bộ CSV có sẵn trong repo (user_acquisition, iap_transactions, ad_impressions).
+
+Mọi kiểu đều được chuẩn hóa về 4 bảng với cùng tên cột mà app.py dùng:
+  ua:     user_id, install_date, source, campaign_id, country, tier, os, cpi
+  events: user_id, event_date, event_timestamp (µs), event_name, level_id, gold_earned, price (IAP)
+  iap:    user_id, timestamp, pack, price
+  ads:    user_id, timestamp, placement, revenue
+
+Chỉ đọc các cột cần dùng; kiểu dữ liệu và khóa user int32 theo analytics.schema.
+event_batches đọc bảng event theo lô (không nạp cả bảng, không qua cache).
+
+Mỗi file CSV chỉ được parse một lần: kết quả (đã đổi kiểu ngày giờ) được lưu
+thành file Arrow IPC trong data/cache/ và mở lại bằng memory map ở các lần sau,
+các process / session khác dùng chung page cache của hệ điều hành. Cache theo
+(đường dẫn, kích thước, mtime) của file nguồn. Lần đọc đầu tiên đọc 4 bảng song
+song.
+"""
+import os
+import sys
+import glob
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from data_generator.config import COUNTRY_TIERS
+from analytics.schema import apply_schema
+from analytics.profiling import span, profiled
+
+DATA_CANDIDATES = ["data", "../data", "./"]
+TEXT_EXTENSIONS = ('', '.gz', '.zst')
+CACHE_DIR = "cache"
+CACHE_KEY = b'source_file'
+
+UA_COLUMNS = ['user_id', 'install_date', 'source', 'campaign_id', 'country', 'tier', 'os', 'cpi']
+EVENT_COLUMNS = ['user_id', 'event_date', 'event_timestamp', 'event_name', 'level_id', 'gold_earned', 'price']
+IAP_COLUMNS = ['user_id', 'timestamp', 'pack', 'price']
+AD_COLUMNS = ['user_id', 'timestamp', 'placement', 'revenue']
+# CSV event phẳng của generator: thêm các cột để lấy country/os, IAP và quảng cáo
+FLAT_COLUMNS = EVENT_COLUMNS + ['country', 'os', 'product_id']
+# Byte trung bình mỗi dòng CSV event phẳng, để quy số dòng mỗi lô ra block_size
+FLAT_ROW_BYTES = 128
+
+
+def _text_file(data_dir, name):
+    for ext in TEXT_EXTENSIONS:
+        path = os.path.join(data_dir, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _text_files(data_dir, name):
+    """File chính + các ngày append (increments/event_date=*/) của một bảng text."""
+    main = _text_file(data_dir, name)
+    increments = sorted(glob.glob(os.path.join(data_dir, 'increments', 'event_date=*', name + '*')))
+    return ([main] if main else []) + increments
+
+
+def _parquet_dir(data_dir, table):
+    path = os.path.join(data_dir, 'parquet', table)
+    return path if os.path.isdir(path) else None
+
+
+def find_data_dir(candidates=DATA_CANDIDATES):
+    """Thư mục data đầu tiên có bảng user acquisition (CSV hoặc Parquet)."""
+    for path in candidates:
+        if _text_file(path, 'user_acquisition.csv') or _parquet_dir(path, 'user_acquisition'):
+            return path
+    return None
+
+
+def source_files(data_dir):
+    """Toàn bộ file nguồn mà load_tables đọc (dùng làm fingerprint cho cache)."""
+    if _parquet_dir(data_dir, 'user_acquisition'):
+        return sorted(glob.glob(os.path.join(data_dir, 'parquet', '*', '*=*', '*.parquet')))
+    files = []
+    for name in ('user_acquisition.csv', 'user_events_flat.csv', 'iap_transactions.csv', 'ad_impressions.csv'):
+        files += _text_files(data_dir, name)
+    return files
+
+
+def fingerprint(files):
+    """Hash của (đường dẫn, kích thước, mtime) các file input."""
+    digest = hashlib.sha256()
+    for path in files:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+# READERS
+
+def _parse_csv(path, columns, column_types, dates):
+    """Các cột `columns` có trong một file CSV (pyarrow, tự giải nén .gz / .zst); `dates` parse bằng pandas."""
+    header = pa_csv.open_csv(path).schema.names
+    # Cột chuỗi ít giá trị (event_name, country, pack...) đọc thẳng thành dictionary
+    convert = pa_csv.ConvertOptions(column_types=column_types or {}, auto_dict_encode=True,
+                                    include_columns=[c for c in header if c in columns])
+    table = pa_csv.read_csv(path, convert_options=convert)
+    if not any(c in table.column_names for c in dates):
+        return table
+    frame = table.to_pandas()
+    for column in dates:
+        if column in frame.columns:
+            frame[column] = pd.to_datetime(frame[column], format='mixed')
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def _cached_csv(path, directory, columns, column_types=None, dates=()):
+    """_parse_csv qua cache Arrow IPC trong `directory`, mở lại bằng memory map."""
+    options = f"{os.path.abspath(path)}|{columns}|{sorted((column_types or {}).items())}|{dates}"
+    cache_path = os.path.join(directory, hashlib.sha1(options.encode('utf-8')).hexdigest()[:16] + '.arrow')
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')
+    if os.path.exists(cache_path):
+        reader = pa.ipc.open_file(pa.memory_map(cache_path))
+        if (reader.schema.metadata or {}).get(CACHE_KEY) == key:
+            return reader.read_all()
+    with span('sources.parse_csv', file=os.path.basename(path)):
+        table = _parse_csv(path, columns, column_types, dates)
+    # File IPC chỉ cho một dictionary mỗi cột
+    table = table.unify_dictionaries().replace_schema_metadata({**(table.schema.metadata or {}), CACHE_KEY: key})
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with pa.OSFile(cache_path + '.tmp', 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError:
+        pass  # Thư mục data chỉ đọc: bỏ qua cache
+    return table
+
+
+def _read_csv(data_dir, paths, columns, column_types=None, dates=()):
+    """Đọc (và nối) các cột `columns` của các file CSV, mỗi file qua cache Arrow (data_dir/cache/)."""
+    directory = os.path.join(data_dir, CACHE_DIR)
+    tables = [_cached_csv(path, directory, columns, column_types, dates) for path in paths]
+    return pa.concat_tables(_unify_dictionaries(tables), promote_options='default').to_pandas()
+
+
+def _unify_dictionaries(tables):
+    """auto_dict_encode tùy từng file: cột là dictionary ở file này nhưng chuỗi ở file khác -> chuỗi."""
+    types = {}
+    for table in tables:
+        for field in table.schema:
+            types.setdefault(field.name, set()).add(field.type)
+    mixed = {name for name, kinds in types.items() if len(kinds) > 1}
+    unified = []
+    for table in tables:
+        for name in mixed & set(table.column_names):
+            i = table.schema.get_field_index(name)
+            kind = table.schema.field(i).type
+            if pa.types.is_dictionary(kind):
+                table = table.set_column(i, name, table.column(i).cast(kind.value_type))
+        unified.append(table)
+    return unified
+
+
+def _read_parquet(data_dir, table, columns, files=None):
+    """Các cột `columns` của một bảng Parquet; files: chỉ đọc các file partition này (None = tất cả)."""
+    partition = {'events': 'event_date', 'user_acquisition': 'install_date'}.get(table, 'event_date')
+    directory = _parquet_dir(data_dir, table)
+    if directory is None:
+        return _empty(columns)
+    source = directory
+    if files is not None:
+        source = [path for path in files if os.path.dirname(os.path.dirname(path)) == directory]
+        if not source:
+            return _empty(columns)
+    dataset = ds.dataset(source, format='parquet', partition_base_dir=directory,
+                         partitioning=ds.partitioning(pa.schema([(partition, pa.string())]), flavor='hive'))
+    return dataset.to_table(columns=columns).to_pandas()
+
+
+def _from_micros(values):
+    return pd.to_datetime(values, unit='us')
+
+
+def _empty(columns):
+    return pd.DataFrame({c: pd.Series(dtype=object) for c in columns})
+
+
+def _load_parquet(data_dir, files=None):
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        ua, events, iap, ads = pool.map(lambda args: _read_parquet(data_dir, *args, files), [
+            ('user_acquisition', UA_COLUMNS),
+            ('events', EVENT_COLUMNS),
+            ('iap_transactions', ['user_id', 'event_timestamp', 'product_id', 'price']),
+            ('ad_impressions', ['user_id', 'event_timestamp', 'placement', 'revenue']),
+        ])
+    ua['install_date'] = pd.to_datetime(ua['install_date'], format='%Y%m%d')
+    events['event_date'] = pd.to_datetime(events['event_date'], format='%Y%m%d')
+
+    iap = iap.rename(columns={'product_id': 'pack'})
+    iap['timestamp'] = _from_micros(iap.pop('event_timestamp'))
+    ads['timestamp'] = _from_micros(ads.pop('event_timestamp'))
+    return ua, events, iap[IAP_COLUMNS], ads[AD_COLUMNS]
+
+
+def _load_text(data_dir, files=None):
+    reads = {
+        'ua': ('user_acquisition.csv', UA_COLUMNS, {'install_date': pa.timestamp('s')}, ()),
+        'flat': ('user_events_flat.csv', FLAT_COLUMNS, {'event_date': pa.string()}, ('event_date',)),
+        'iap': ('iap_transactions.csv', IAP_COLUMNS, {'timestamp': pa.timestamp('s')}, ()),
+        'ads': ('ad_impressions.csv', AD_COLUMNS, {'timestamp': pa.timestamp('s')}, ()),
+    }
+    wanted = None if files is None else set(files)
+    files = {table: [path for path in _text_files(data_dir, name) if wanted is None or path in wanted]
+             for table, (name, *_) in reads.items()}
+    with ThreadPoolExecutor(max_workers=len(reads)) as pool:
+        futures = {table: pool.submit(_read_csv, data_dir, files[table], *options)
+                   for table, (_, *options) in reads.items() if files[table]}
+        tables = {table: future.result() for table, future in futures.items()}
+    ua, flat, iap, ads = tables.get('ua'), tables.get('flat'), tables.get('iap'), tables.get('ads')
+    if ua is None:
+        ua = _empty(UA_COLUMNS)
+
+    if flat is None:
+        flat = _empty(EVENT_COLUMNS)
+    events = flat[[c for c in flat.columns if c in EVENT_COLUMNS]]
+
+    # Output text của generator: UA không có country/tier/os -> lấy từ event của user
+    if 'country' not in ua.columns and {'country', 'os'} <= set(flat.columns):
+        geo = flat.drop_duplicates('user_id').set_index('user_id')[['country', 'os']]
+        ua = ua.join(geo, on='user_id')
+    if 'tier' not in ua.columns and 'country' in ua.columns:
+        ua['tier'] = ua['country'].map(COUNTRY_TIERS)
+
+    # Không có file IAP / quảng cáo riêng -> tách từ bảng event phẳng
+    if iap is None and 'product_id' in flat.columns:
+        iap = flat[flat['event_name'] == 'iap_purchase'].rename(columns={'product_id': 'pack'})
+        iap = iap.assign(timestamp=_from_micros(iap['event_timestamp']))
+    elif iap is None:
+        iap = _empty(IAP_COLUMNS)
+
+    if ads is None and 'event_timestamp' in flat.columns:
+        # Dataset của engine legacy không có ad_impressions.csv (không mô phỏng doanh thu quảng cáo)
+        ads = flat[flat['event_name'] == 'ad_reward_claim']
+        ads = ads.assign(timestamp=_from_micros(ads['event_timestamp']), placement='End Game', revenue=0.0)
+    elif ads is None:
+        ads = _empty(AD_COLUMNS)
+
+    for column in UA_COLUMNS:
+        if column not in ua.columns:
+            ua[column] = 'Unknown'
+    return (ua[UA_COLUMNS], events.reset_index(drop=True),
+            iap[IAP_COLUMNS].reset_index(drop=True), ads[AD_COLUMNS].reset_index(drop=True))
+
+
+def event_batches(data_dir, columns, batch_rows=1_000_000):
+    """Lần lượt các pyarrow RecordBatch (khoảng batch_rows dòng) gồm các cột `columns` của bảng event.
+
+    Đọc trực tiếp từng file (partition Parquet hoặc CSV phẳng + increments/),
+    bộ nhớ chỉ cần cho một lô; cột không có trong file CSV là null.
+    """
+    if _parquet_dir(data_dir, 'user_acquisition'):
+        directory = _parquet_dir(data_dir, 'events')
+        paths = sorted(glob.glob(os.path.join(directory, '*=*', '*.parquet'))) if directory else []
+        for path in paths:
+            yield from pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=columns)
+        return
+    types = {'user_id': pa.string(), 'event_timestamp': pa.int64(), 'event_name': pa.string(),
+             'level_id': pa.int16(), 'gold_earned': pa.float64(), 'price': pa.float64()}
+    read = pa_csv.ReadOptions(block_size=batch_rows * FLAT_ROW_BYTES)
+    convert = pa_csv.ConvertOptions(include_columns=columns, include_missing_columns=True,
+                                    column_types={c: types.get(c, pa.string()) for c in columns})
+    for path in _text_files(data_dir, 'user_events_flat.csv'):
+        with pa_csv.open_csv(path, read_options=read, convert_options=convert) as reader:
+            yield from reader
+
+
+def read_sources(data_dir, files=None):
+    """(ua, events, iap, ads) đã chuẩn hóa nhưng chưa định kiểu (user_id gốc).
+
+    files: chỉ đọc các file nguồn này (tập con của source_files), ví dụ các
+    partition mới; None = toàn bộ.
+    """
+    if _parquet_dir(data_dir, 'user_acquisition'):
+        ua, events, iap, ads = _load_parquet(data_dir, files)
+    else:
+        ua, events, iap, ads = _load_text(data_dir, files)
+    # User Organic không có campaign (null trong Parquet, chuỗi rỗng trong CSV)
+    campaign = ua['campaign_id'].astype(object)
+    ua['campaign_id'] = campaign.where(campaign.notna() & (campaign != ''), 'Organic')
+    return ua, events, iap, ads
+
+
+@profiled('sources.load_tables')
+def load_tables(data_dir):
+    """(ua, events, iap, ads) đã chuẩn hóa và định kiểu; ưu tiên dataset Parquet nếu có."""
+    ua, events, iap, ads = read_sources(data_dir)
+    with span('sources.apply_schema'):
+        return apply_schema(ua, events, iap, ads)
@@ -0,0 +1,347 @@
+"""
+Local SQL warehouse: chạy các mart trong sql/ bằng DuckDB nhúng, không cần BigQuery.
+
+Các file dữ liệu sinh ra được đăng ký thành view raw_events, master_events và
+user_acquisition. Câu SQL BigQuery được dịch sang DuckDB (COUNTIF, SAFE_DIVIDE,
+DATE_DIFF, PARSE_DATE, DATE_TRUNC, FLOAT64), mỗi mart được materialize thành
+một bảng trong warehouse.duckdb. Kết quả được cache theo (câu SQL + fingerprint
+file input): chạy lại mart không đổi chỉ đọc lại bảng đã có.
+
+File có câu MERGE (08_user_features.sql) là script bảo trì một bảng tăng dần
+trong warehouse, chạy trước mọi mart đọc bảng đó. Script chỉ gộp dữ liệu mới
+khi các file đã gộp không đổi (chỉ thêm ngày / partition); file đã gộp bị sửa
+/ xóa, hoặc script đổi, thì bảng được dựng lại từ đầu.
+
+    python analytics/sql_runner.py --data-dir data
+"""
+import os
+import re
+import sys
+import glob
+import time
+import json
+import hashlib
+import argparse
+
+import duckdb
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from data_generator.config import DATA_DIR
+from data_generator.writers import USER_ACQUISITION_SCHEMA
+from analytics.sources import fingerprint
+
+SQL_DIR = os.path.join(ROOT_DIR, "sql")
+WAREHOUSE_FILE = "warehouse.duckdb"
+CACHE_TABLE = "_mart_cache"
+SCRIPT_TABLE = "_script_inputs"
+
+PARAM_STRUCT = ("STRUCT(key VARCHAR, value STRUCT(string_value VARCHAR, int_value BIGINT, "
+                "float_value DOUBLE, double_value DOUBLE))[]")
+RAW_EVENT_COLUMNS = {
+    'event_date': 'VARCHAR',
+    'event_timestamp': 'BIGINT',
+    'event_name': 'VARCHAR',
+    'user_id': 'VARCHAR',
+    'user_pseudo_id': 'VARCHAR',
+    'event_params': PARAM_STRUCT,
+}
+
+
+# BIGQUERY -> DUCKDB
+
+_TABLE_REF = re.compile(r'`[\w-]+\.[\w-]+\.(\w+)`')
+_TYPES = re.compile(r'\bFLOAT64\b', re.IGNORECASE)
+_MERGE = re.compile(r'^\s*MERGE\b', re.IGNORECASE | re.MULTILINE)
+_STATEMENT_END = re.compile(r';\s*(?:\n|$)')
+_CALL = re.compile(r'\b(COUNTIF|SAFE_DIVIDE|DATE_DIFF|PARSE_DATE|DATE_TRUNC)\s*\(', re.IGNORECASE)
+_TRANSLATIONS = {
+    'COUNTIF': lambda cond: f"count_if({cond})",
+    'SAFE_DIVIDE': lambda a, b: f"(CASE WHEN ({b}) = 0 THEN NULL ELSE ({a}) / ({b}) END)",
+    'DATE_DIFF': lambda end, start, part: f"date_diff('{part.lower()}', {start}, {end})",
+    'PARSE_DATE': lambda fmt, value: f"CAST(strptime({value}, {fmt}) AS DATE)",
+    'DATE_TRUNC': lambda value, part: f"CAST(date_trunc('{part.lower()}', {value}) AS DATE)",
+}
+
+
+def _call_args(sql, open_paren):
+    """Tách tham số của lời gọi hàm có '(' tại open_paren: trả về (args, vị trí sau ')')."""
+    depth, last, quote = 0, open_paren + 1, None
+    args = []
+    for i in range(open_paren, len(sql)):
+        ch = sql[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                args.append(sql[last:i])
+                return [a.strip() for a in args], i + 1
+        elif ch == ',' and depth == 1:
+            args.append(sql[last:i])
+            last = i + 1
+    raise ValueError(f"Unbalanced parentheses after position {open_paren}")
+
+
+def translate_bigquery(sql):
+    """Dịch câu SQL BigQuery (standard SQL) trong sql/ sang dialect DuckDB."""
+    sql = _TYPES.sub('DOUBLE', _TABLE_REF.sub(r'\1', sql))
+    out, pos = [], 0
+    while True:
+        match = _CALL.search(sql, pos)
+        if match is None:
+            break
+        args, end = _call_args(sql, match.end() - 1)
+        out.append(sql[pos:match.start()])
+        out.append(_TRANSLATIONS[match.group(1).upper()](*(translate_bigquery(a) for a in args)))
+        pos = end
+    out.append(sql[pos:])
+    return ''.join(out).strip().rstrip(';')
+
+
+# INPUT FILES
+
+def _first_existing(*patterns):
+    """Các file khớp pattern đầu tiên có kết quả (file đơn .json / .json.gz / .json.zst ...)."""
+    for pattern in patterns:
+        files = sorted(glob.glob(pattern))
+        if files:
+            return files
+    return []
+
+
+def _text_files(data_dir, name, table):
+    """(file có header, part file không header) của một bảng text, kể cả các ngày append."""
+    merged = _first_existing(*(os.path.join(data_dir, name + ext) for ext in ('', '.gz', '.zst')))
+    parts = [] if merged else sorted(glob.glob(os.path.join(data_dir, 'parts', table, 'part-*')))
+    increments = sorted(glob.glob(os.path.join(data_dir, 'increments', 'event_date=*', name + '*')))
+    return merged + increments, parts
+
+
+def _sql_list(files):
+    return '[' + ', '.join("'" + f.replace("'", "''") + "'" for f in files) + ']'
+
+
+def discover_sources(data_dir):
+    """SQL của các view nguồn và danh sách file mỗi view đọc; ưu tiên dataset Parquet nếu có."""
+    data_dir = os.path.abspath(data_dir)
+    views, files = {}, {}
+
+    parquet = sorted(glob.glob(os.path.join(data_dir, 'parquet', 'events', 'event_date=*', '*.parquet')))
+    if parquet:
+        views['raw_events'] = (
+            f"SELECT {', '.join(RAW_EVENT_COLUMNS)} FROM read_parquet({_sql_list(parquet)}, "
+            f"hive_partitioning = true, hive_types = {{'event_date': VARCHAR}})")
+        files['raw_events'] = parquet
+    else:
+        with_header, parts = _text_files(data_dir, 'user_events_nested.json', 'user_events_nested')
+        events = with_header + parts
+        if events:
+            columns = ', '.join(f"'{k}': '{v}'" for k, v in RAW_EVENT_COLUMNS.items())
+            views['raw_events'] = (f"SELECT * FROM read_json({_sql_list(events)}, "
+                                   f"format = 'newline_delimited', columns = {{{columns}}})")
+            files['raw_events'] = events
+
+    if 'raw_events' in views:
+        # Bảng phẳng đã làm sạch: event_date kiểu DATE, params tách thành cột
+        param = "[p.value FOR p IN event_params IF p.key = '{}'][1].{}"
+        views['master_events'] = f"""
+            SELECT
+                CAST(strptime(event_date, '%Y%m%d') AS DATE) AS event_date,
+                event_timestamp,
+                event_name,
+                user_id,
+                user_pseudo_id,
+                CAST({param.format('level_id', 'int_value')} AS INTEGER) AS level_id,
+                {param.format('gold_earned', 'int_value')} AS gold_earned,
+                {param.format('status', 'string_value')} AS win_loss_status,
+                {param.format('price', 'float_value')} AS revenue
+            FROM raw_events"""
+        files['master_events'] = files['raw_events']
+
+    parquet = sorted(glob.glob(os.path.join(data_dir, 'parquet', 'user_acquisition', 'install_date=*', '*.parquet')))
+    if parquet:
+        views['user_acquisition'] = (
+            "SELECT user_id, CAST(strptime(install_date, '%Y%m%d') AS DATE) AS install_date, "
+            "source, campaign_id, country, tier, os, cpi "
+            f"FROM read_parquet({_sql_list(parquet)}, hive_partitioning = true, "
+            "hive_types = {'install_date': VARCHAR})")
+        files['user_acquisition'] = parquet
+    else:
+        with_header, parts = _text_files(data_dir, 'user_acquisition.csv', 'user_acquisition')
+        selects = []
+        if with_header:
+            selects.append(f"SELECT * FROM read_csv({_sql_list(with_header)}, header = true, union_by_name = true)")
+        if parts:
+            names = ', '.join(f"'{n}'" for n in USER_ACQUISITION_SCHEMA.names)
+            selects.append(f"SELECT * FROM read_csv({_sql_list(parts)}, header = false, names = [{names}])")
+        if selects:
+            views['user_acquisition'] = ' UNION ALL BY NAME '.join(selects)
+            files['user_acquisition'] = with_header + parts
+    return views, files
+
+
+def mart_files(sql_dir=SQL_DIR):
+    """Các file .sql có nội dung (01_data_cleaning.sql hiện đang trống)."""
+    paths = []
+    for path in sorted(glob.glob(os.path.join(sql_dir, '*.sql'))):
+        with open(path, encoding='utf-8') as f:
+            if f.read().strip():
+                paths.append(path)
+    return paths
+
+
+def mart_name(path):
+    """sql/02_retention_kpi.sql -> retention_kpi."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r'^\d+_', '', stem).lower()
+
+
+def read_mart(path):
+    with open(path, encoding='utf-8') as f:
+        return translate_bigquery(f.read())
+
+
+def is_script(sql):
+    """Script bảo trì bảng tăng dần (có câu MERGE), không phải mart SELECT."""
+    return bool(_MERGE.search(sql))
+
+
+# WAREHOUSE
+
+class LocalWarehouse:
+    """Kết nối DuckDB với các view nguồn đã đăng ký và bảng mart đã materialize."""
+
+    def __init__(self, data_dir=DATA_DIR, database=None):
+        self.data_dir = data_dir
+        self.con = duckdb.connect(database or os.path.join(data_dir, WAREHOUSE_FILE))
+        self.views, self.files = discover_sources(data_dir)
+        for view, sql in self.views.items():
+            # TEMP: view nguồn gắn với phiên hiện tại, chỉ bảng mart được lưu vào file
+            self.con.execute(f"CREATE OR REPLACE TEMP VIEW {view} AS {sql}")
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS {CACHE_TABLE} "
+                         "(mart VARCHAR PRIMARY KEY, cache_key VARCHAR, rows BIGINT, seconds DOUBLE, "
+                         "built_at TIMESTAMP)")
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS {SCRIPT_TABLE} "
+                         "(script VARCHAR PRIMARY KEY, sql_hash VARCHAR, stamps VARCHAR)")
+        self._inputs = ''.join(self.views[v] + fingerprint(self.files[v]) for v in sorted(self.views))
+        self._scripts_run = set()  # Script đã chạy trong phiên này
+
+    def cache_key(self, sql):
+        return hashlib.sha256((duckdb.__version__ + sql + self._inputs).encode('utf-8')).hexdigest()
+
+    def _record(self, name, key, started):
+        rows = self.con.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+        self.con.execute(f"INSERT OR REPLACE INTO {CACHE_TABLE} VALUES (?, ?, ?, ?, now())",
+                         [name, key, rows, time.perf_counter() - started])
+
+    def run_mart(self, path, refresh=False):
+        """Materialize một file sql/ thành bảng: trả về (DataFrame, lấy từ cache hay không)."""
+        name, sql = mart_name(path), read_mart(path)
+        # Script bảo trì các bảng mà mart này đọc chạy trước
+        for script in mart_files(os.path.dirname(path)):
+            if script != path and re.search(rf'\b{mart_name(script)}\b', sql) and is_script(read_mart(script)):
+                self.run_script(script, refresh)
+        if is_script(sql):
+            return self.run_script(path, refresh)
+        key = self.cache_key(sql)
+
+        cached = self.con.execute(f"SELECT cache_key FROM {CACHE_TABLE} WHERE mart = ?", [name]).fetchone()
+        if not refresh and cached and cached[0] == key:
+            return self.con.table(name).df(), True
+
+        started = time.perf_counter()
+        self.con.execute(f'CREATE OR REPLACE TABLE "{name}" AS {sql}')
+        self._record(name, key, started)
+        return self.con.table(name).df(), False
+
+    def run_script(self, path, refresh=False):
+        """Chạy script MERGE (tăng dần) một lần mỗi phiên: trả về (bảng, không có gì mới hay không)."""
+        name, sql = mart_name(path), read_mart(path)
+        key = self.cache_key(sql)
+        cached = self.con.execute(f"SELECT cache_key FROM {CACHE_TABLE} WHERE mart = ?", [name]).fetchone()
+        if name in self._scripts_run or (not refresh and cached and cached[0] == key):
+            return self.con.table(name).df(), True
+
+        sql_hash = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+        stamps = {file: fingerprint([file]) for view in sorted(self.files) for file in self.files[view]}
+        previous = self.con.execute(f"SELECT sql_hash, stamps FROM {SCRIPT_TABLE} WHERE script = ?",
+                                    [name]).fetchone()
+        # Dựng lại khi script đổi, --refresh, hoặc file đã gộp bị sửa / xóa (không chỉ thêm file mới)
+        full = (refresh or previous is None or previous[0] != sql_hash
+                or any(stamps.get(p) != stamp for p, stamp in json.loads(previous[1]).items()))
+        started = time.perf_counter()
+        self.con.execute("BEGIN TRANSACTION")
+        try:
+            if full:
+                self.con.execute(f'DROP TABLE IF EXISTS "{name}"')
+            for statement in _STATEMENT_END.split(sql + ';'):
+                if statement.strip():
+                    self.con.execute(statement)
+            self.con.execute(f"INSERT OR REPLACE INTO {SCRIPT_TABLE} VALUES (?, ?, ?)",
+                             [name, sql_hash, json.dumps(stamps)])
+            self._record(name, key, started)
+            self.con.execute("COMMIT")
+        except Exception:
+            self.con.execute("ROLLBACK")
+            raise
+        self._scripts_run.add(name)
+        return self.con.table(name).df(), False
+
+    def run_all(self, sql_dir=SQL_DIR, refresh=False):
+        """Chạy mọi mart trong sql_dir (bỏ file rỗng): trả về {mart: (DataFrame, cached)}."""
+        return {mart_name(path): self.run_mart(path, refresh) for path in mart_files(sql_dir)}
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - chạy các mart SQL trên DuckDB local")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--sql-dir', default=SQL_DIR)
+    parser.add_argument('--database', default=None, help=f"File DuckDB (mặc định <data-dir>/{WAREHOUSE_FILE})")
+    parser.add_argument('--refresh', action='store_true', help="Bỏ qua cache, chạy lại mọi mart")
+    parser.add_argument('marts', nargs='*', help="Tên mart hoặc tên file trong sql/ (mặc định: tất cả)")
+    args = parser.parse_args()
+
+    paths = mart_files(args.sql_dir)
+    if args.marts:
+        # Chọn theo tên mart (retention_kpi) hoặc tên file (02_retention_kpi[.sql])
+        wanted = {os.path.splitext(m)[0].lower() for m in args.marts}
+        names = {p: {mart_name(p), os.path.splitext(os.path.basename(p))[0].lower()} for p in paths}
+        unknown = wanted - set().union(*names.values())
+        if unknown:
+            parser.error(f"Không có mart: {', '.join(sorted(unknown))} "
+                         f"(có: {', '.join(mart_name(p) for p in paths)})")
+        paths = [p for p in paths if names[p] & wanted]
+
+    with LocalWarehouse(args.data_dir, args.database) as warehouse:
+        print(f"Nguồn: {', '.join(f'{v} ({len(f)} files)' for v, f in warehouse.files.items()) or 'không có'}")
+        for path in paths:
+            started = time.perf_counter()
+            try:
+                df, cached = warehouse.run_mart(path, args.refresh)
+            except duckdb.CatalogException as exc:
+                print(f"-> {mart_name(path)}: bỏ qua (thiếu dữ liệu nguồn: {str(exc).splitlines()[0]})")
+                continue
+            source = "cache" if cached else "materialized"
+            print(f"-> {mart_name(path)}: {len(df):,} dòng ({source}, {time.perf_counter() - started:.2f}s)")
+            print(df.head(5).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
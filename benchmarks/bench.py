@@ -0,0 +1,284 @@
+"""
+Benchmark theo quy mô cho generator và các phép tính của dashboard (offline).
+
+Với mỗi số user trong --scales:
+  1. generate: chạy generate_data.py ở process riêng (ZOMBIE_PROFILE=1), đo
+     events/s, thời gian từng giai đoạn (simulate / JSON / CSV / Parquet export,
+     lấy từ Chrome trace), dung lượng output và đỉnh RSS của process đó.
+  2. dashboard: trên dataset vừa sinh, ở process riêng, đo không qua Streamlit:
+     đọc nguồn, dựng cube (thay cho master join cũ), lọc tier và hàm tính của
+     từng tab (DAU, funnel + win/fail, LTV, pack / placement, retention, ...),
+     mỗi phép lấy trung vị của --repeat lần, bỏ qua memo LRU; cả dựng session
+     trong bộ nhớ và theo lô trên file event (analytics.sessions), dựng sổ cái
+     gold (analytics.economy).
+
+Kết quả ghi ra report JSON; --baseline so với report cũ và đánh dấu chỉ số
+chậm / tốn bộ nhớ hơn quá --tolerance (exit code 1 nếu có regression).
+
+    python benchmarks/bench.py --scales 10000 100000
+    python benchmarks/bench.py --save-baseline
+    python benchmarks/bench.py --baseline benchmarks/baseline.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from data_generator.config import SEED
+from analytics.profiling import PROFILE_ENV
+
+GENERATOR = os.path.join(ROOT_DIR, 'data_generator', 'generate_data.py')
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPORT = os.path.join(BENCH_DIR, 'results', 'latest.json')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+SCALES = [10_000, 100_000]
+REPEAT = 5
+TOLERANCE = 0.25  # Chậm hơn 25% so với baseline = regression
+
+NOISE_FLOOR = {'seconds': 0.005, 'mb': 5.0}  # Chênh lệch tuyệt đối nhỏ hơn mức này không tính regression
+# Thời gian và bộ nhớ: càng thấp càng tốt; throughput: càng cao càng tốt
+HIGHER_IS_BETTER = {'events_per_sec'}
+
+
+def _run_measured(cmd, env=None):
+    """Chạy process con, trả về (exit code, stdout, giây, đỉnh RSS MB của chính process đó)."""
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    output = proc.stdout.read()
+    peak_rss = None
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss = usage.ru_maxrss / 1024  # Linux: KB
+    else:
+        proc.wait()
+    return proc.returncode, output, time.perf_counter() - started, peak_rss
+
+
+def _dir_size_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files) / 2 ** 20
+
+
+def bench_generate(scale, engine, fmt, seed, data_dir):
+    """Sinh dataset `scale` user vào data_dir; events/s, giai đoạn, output, đỉnh RSS."""
+    shutil.rmtree(data_dir, ignore_errors=True)
+    trace = data_dir.rstrip(os.sep) + '.trace.json'
+    cmd = [sys.executable, GENERATOR, '--engine', engine, '--users', str(scale), '--seed', str(seed),
+           '--data-dir', data_dir, '--format', fmt, '--trace', trace]
+    code, output, seconds, peak_rss = _run_measured(cmd, {**os.environ, PROFILE_ENV: '1'})
+    if code != 0:
+        raise RuntimeError(f"generate_data.py exited with {code}:\n{output}")
+    events = int(re.search(r"([\d,]+) events", output).group(1).replace(',', ''))
+    with open(trace, encoding='utf-8') as file:
+        spans = pd.DataFrame(json.load(file)['traceEvents'])
+    os.remove(trace)
+    stages = (spans.groupby('name')['dur'].sum() / 1e6).round(4).to_dict() if len(spans) else {}
+    return {
+        'events': events,
+        'seconds': round(seconds, 4),
+        'events_per_sec': round(events / max(seconds, 1e-9), 1),
+        'peak_rss_mb': None if peak_rss is None else round(peak_rss, 1),
+        'output_mb': round(_dir_size_mb(data_dir), 1),
+        'stages': stages,
+    }
+
+
+def _median_seconds(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return round(float(np.median(times)), 6)
+
+
+def dashboard_timings(data_dir, repeat=REPEAT):
+    """Thời gian (giây) từng phép tính của dashboard trên data_dir, chạy trong process hiện tại."""
+    from analytics.sources import load_tables, CACHE_DIR
+    from analytics.cube import build_cubes
+    from analytics.metrics import DashboardMetrics, FUNNEL_LEVELS, RETENTION_DAYS
+    from analytics.backends import LocalBackend
+    from analytics.cohorts import BREAKDOWNS
+    from analytics.features import update_features
+    from analytics.sessions import sessionize, kind_codes, stream_sessions, summarize
+    from analytics.economy import GoldLedger
+
+    shutil.rmtree(os.path.join(data_dir, CACHE_DIR), ignore_errors=True)
+    timings = {}
+    started = time.perf_counter()
+    tables = load_tables(data_dir)
+    timings['load_tables_cold'] = round(time.perf_counter() - started, 6)
+    timings['load_tables'] = _median_seconds(lambda: load_tables(data_dir), max(1, repeat // 2))
+    cubes = None
+
+    def build():
+        nonlocal cubes
+        cubes = build_cubes(*tables)
+    timings['build_cubes'] = _median_seconds(build, max(1, repeat // 2))
+    timings['features_rebuild'] = _median_seconds(lambda: update_features(data_dir, rebuild=True), max(1, repeat // 2))
+    timings['features_unchanged'] = _median_seconds(lambda: update_features(data_dir), repeat)
+    events = tables[1]
+    timings['sessionize'] = _median_seconds(lambda: sessionize(
+        events['user_id'].to_numpy(), events['event_timestamp'].to_numpy(), kind_codes(events['event_name']),
+        events['price'].to_numpy(dtype=float, na_value=np.nan)), repeat)
+    timings['sessions_stream'] = _median_seconds(lambda: summarize(stream_sessions(data_dir)), max(1, repeat // 2))
+    timings['gold_ledger'] = _median_seconds(lambda: GoldLedger.from_events(events), repeat)
+
+    backend = LocalBackend(cubes)
+    metrics = DashboardMetrics(backend)
+    every = metrics.key(metrics.tiers)
+    single = metrics.key(metrics.tiers[:1])
+
+    def ltv():
+        metrics._cohorts.cache_clear()  # Dựng lại ma trận cohort mỗi lần đo
+        return [metrics._compute_ltv(every, by, None) for by in BREAKDOWNS]
+    cases = {
+        'tier_filter': lambda: [backend.rows(name, {'tier': single}, None) for name in cubes],
+        'dau': lambda: metrics._compute_health(every, None),
+        'dau_wau_mau': lambda: metrics._compute_engagement(every, None),
+        'funnel_win_fail': lambda: metrics._compute_ingame(every, FUNNEL_LEVELS),
+        'ltv_curves': ltv,
+        'pack_placement': lambda: metrics._compute_monetization(every, None),
+        'retention': lambda: metrics._compute_retention(every, RETENTION_DAYS, None),
+        'activity': lambda: metrics._compute_activity(every),
+        'economy': lambda: metrics._compute_economy(every, None),
+        'dau_single_tier': lambda: metrics._compute_health(single, None),
+    }
+    for name, func in cases.items():
+        timings[name] = _median_seconds(func, repeat)
+    return timings
+
+
+def bench_dashboard(data_dir, repeat):
+    """dashboard_timings ở process riêng để đo đỉnh RSS độc lập."""
+    cmd = [sys.executable, os.path.abspath(__file__), '--dashboard-only', data_dir, '--repeat', str(repeat)]
+    code, output, seconds, peak_rss = _run_measured(cmd)
+    if code != 0:
+        raise RuntimeError(f"dashboard benchmark exited with {code}:\n{output}")
+    timings = json.loads(output.strip().splitlines()[-1])
+    return {'seconds': round(seconds, 4), 'peak_rss_mb': None if peak_rss is None else round(peak_rss, 1),
+            'timings': timings}
+
+
+def environment():
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def flatten(report):
+    """{(case, chỉ số): giá trị} của mọi số đo có thể so sánh."""
+    values = {}
+    for case, result in report['results'].items():
+        for key, value in result.items():
+            if isinstance(value, dict):
+                for sub, sub_value in value.items():
+                    values[(case, f"{key}.{sub}")] = sub_value
+            elif key not in ('events', 'output_mb'):
+                values[(case, key)] = value
+    return values
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """Bảng so sánh với baseline: ratio > 1 là tệ hơn; regression khi tệ hơn quá tolerance."""
+    current, previous = flatten(report), flatten(baseline)
+    rows = []
+    for (case, metric), value in current.items():
+        before = previous.get((case, metric))
+        if value is None or not before:
+            continue
+        higher = metric.split('.')[-1] in HIGHER_IS_BETTER
+        ratio = before / value if higher else value / before
+        floor = NOISE_FLOOR['mb'] if metric.endswith('_mb') else 0 if higher else NOISE_FLOOR['seconds']
+        rows.append({'case': case, 'metric': metric, 'baseline': before, 'current': value,
+                     'ratio': round(ratio, 3), 'regression': ratio > 1 + tolerance and abs(value - before) > floor})
+    return pd.DataFrame(rows, columns=['case', 'metric', 'baseline', 'current', 'ratio', 'regression'])
+
+
+def run(scales, engines, formats, seed, repeat, work_dir, keep=False):
+    report = {'environment': {**environment(), 'seed': seed, 'repeat': repeat}, 'results': {}}
+    for scale in scales:
+        for engine in engines:
+            for fmt in formats:
+                if fmt == 'parquet' and engine == 'legacy':
+                    continue
+                data_dir = os.path.join(work_dir, f"{engine}-{fmt}-{scale}")
+                print(f"-> generate {engine}/{fmt} {scale:,} users...", flush=True)
+                generated = bench_generate(scale, engine, fmt, seed, data_dir)
+                report['results'][f"generate/{engine}/{fmt}/{scale}"] = generated
+                print(f"   {generated['events']:,} events, {generated['events_per_sec']:,.0f} events/s, "
+                      f"peak RSS {generated['peak_rss_mb']} MB", flush=True)
+                print(f"-> dashboard {engine}/{fmt} {scale:,} users...", flush=True)
+                report['results'][f"dashboard/{engine}/{fmt}/{scale}"] = bench_dashboard(data_dir, repeat)
+                if not keep:
+                    shutil.rmtree(data_dir, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - benchmark generator + dashboard theo quy mô")
+    parser.add_argument('--scales', nargs='+', type=int, default=SCALES, help="Số user (mặc định 10000 100000)")
+    parser.add_argument('--engines', nargs='+', choices=['legacy', 'vectorized'], default=['vectorized'])
+    parser.add_argument('--formats', nargs='+', choices=['text', 'parquet'], default=['text'])
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="Số lần đo mỗi phép tính dashboard (lấy trung vị)")
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'zombie-bench'),
+                        help="Thư mục chứa dataset sinh ra (mặc định trong thư mục tạm)")
+    parser.add_argument('--keep', action='store_true', help="Giữ lại dataset sau khi đo")
+    parser.add_argument('--output', default=DEFAULT_REPORT, help="File report JSON")
+    parser.add_argument('--baseline', default=None, help=f"Report để so sánh (mặc định {DEFAULT_BASELINE} nếu có)")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Ngưỡng regression (0.25 = chậm hơn 25%%)")
+    parser.add_argument('--save-baseline', action='store_true', help="Ghi report thành baseline mới")
+    parser.add_argument('--dashboard-only', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dashboard_only:
+        print(json.dumps(dashboard_timings(args.dashboard_only, args.repeat)))
+        return
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    report = run(args.scales, args.engines, args.formats, args.seed, args.repeat, args.work_dir, args.keep)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"-> Đã lưu {args.output}")
+    if args.save_baseline:
+        shutil.copyfile(args.output, DEFAULT_BASELINE)
+        print(f"-> Đã lưu baseline {DEFAULT_BASELINE}")
+
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) else None)
+    if baseline_path and not args.save_baseline:
+        with open(baseline_path, encoding='utf-8') as file:
+            table = compare(report, json.load(file), args.tolerance)
+        print(table.to_string(index=False))
+        regressions = table[table['regression']]
+        if len(regressions):
+            print(f"-> {len(regressions)} regression (> {args.tolerance:.0%}) so với {baseline_path}")
+            sys.exit(1)
+        print(f"-> Không có regression so với {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Checkpoint trạng thái người chơi và chế độ append từng ngày.
+
+Sau mỗi lần chạy, trạng thái cần để mô phỏng tiếp của từng người chơi còn
+hoạt động (level hiện tại, số ngày chơi còn lại, ngày cài đặt, thuộc tính
+acquisition) được lưu gọn trong checkpoint.parquet. append_days() đọc lại
+checkpoint và chỉ sinh event cho N ngày tiếp theo, mỗi ngày ghi vào một
+partition increments/event_date=YYYYMMDD/, nên job hằng đêm tốn O(event mới)
+thay vì chạy lại toàn bộ lịch sử.
+"""
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_generator.config import START_DATE, COUNTRIES, DEVICE_CATEGORIES, OS_LIST, SOURCES, CAMPAIGN_IDS
+from data_generator.simulation import (
+    COHORT_SIZE, STATE_COLUMNS, CITY_LIST, simulate_users, simulate_events, write_users, write_events,
+)
+from data_generator.writers import TABLES, open_writers
+from data_generator.parquet_writer import PARQUET_DIR, open_parquet_writers
+
+CHECKPOINT_FILE = "checkpoint.parquet"
+INCREMENTS_DIR = "increments"
+
+CATEGORIES = {
+    'country': COUNTRIES,
+    'city': CITY_LIST,
+    'device_category': DEVICE_CATEGORIES,
+    'mobile_os': OS_LIST,
+    'source': SOURCES,
+    'campaign_id': CAMPAIGN_IDS,
+}
+CHECKPOINT_SCHEMA = pa.schema([
+    ('user_index', pa.int64()),
+    ('user_id', pa.string()),
+    ('user_pseudo_id', pa.string()),
+    ('install_date', pa.date32()),
+    ('remaining_days', pa.int16()),
+    ('current_level', pa.int16()),
+    ('country', pa.dictionary(pa.int8(), pa.string())),
+    ('city', pa.dictionary(pa.int8(), pa.string())),
+    ('device_category', pa.dictionary(pa.int8(), pa.string())),
+    ('mobile_os', pa.dictionary(pa.int8(), pa.string())),
+    ('source', pa.dictionary(pa.int8(), pa.string())),
+    ('cpi', pa.float64()),
+    ('campaign_id', pa.dictionary(pa.int8(), pa.string())),
+])
+
+
+def remaining_days(state, day_to):
+    """Số ngày chơi còn lại tính từ day_to (0 = đã churn)."""
+    end = state['install_offset'].to_numpy(dtype=np.int64) + state['play_days'].to_numpy(dtype=np.int64)
+    return np.clip(end - day_to, 0, None)
+
+
+def save_checkpoint(data_dir, state, seed, day_to, next_user_index, start_date=START_DATE):
+    """Lưu trạng thái của các người chơi còn ngày chơi sau day_to (ghi atomically)."""
+    remaining = remaining_days(state, day_to)
+    alive = state[remaining > 0]
+    install_date = (pd.Timestamp(start_date)
+                    + pd.to_timedelta(alive['install_offset'].to_numpy(dtype=np.int64), unit='D'))
+    columns = {
+        'user_index': alive['user_index'],
+        'user_id': alive['user_id'],
+        'user_pseudo_id': alive['user_pseudo_id'],
+        'install_date': install_date,
+        'remaining_days': remaining[remaining > 0],
+        'current_level': alive['current_level'],
+    }
+    columns.update({name: alive[name] for name in CATEGORIES})
+    columns['cpi'] = alive['cpi']
+    table = pa.Table.from_arrays(
+        [pa.array(np.asarray(columns[f.name]) if f.name in ('install_date', 'remaining_days') else columns[f.name],
+                  from_pandas=True).cast(f.type)
+         for f in CHECKPOINT_SCHEMA],
+        schema=CHECKPOINT_SCHEMA,
+    ).replace_schema_metadata({
+        'seed': str(seed),
+        'start_date': pd.Timestamp(start_date).strftime('%Y-%m-%d'),
+        'day_to': str(day_to),
+        'next_user_index': str(next_user_index),
+    })
+
+    path = os.path.join(data_dir, CHECKPOINT_FILE)
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def load_checkpoint(data_dir):
+    """Đọc checkpoint: trả về (state theo STATE_COLUMNS, meta)."""
+    table = pq.read_table(os.path.join(data_dir, CHECKPOINT_FILE))
+    raw = {k.decode(): v.decode() for k, v in table.schema.metadata.items()}
+    meta = {
+        'seed': int(raw['seed']),
+        'start_date': pd.Timestamp(raw['start_date']).to_pydatetime(),
+        'day_to': int(raw['day_to']),
+        'next_user_index': int(raw['next_user_index']),
+    }
+    df = table.to_pandas()
+    install_offset = ((pd.to_datetime(df['install_date']) - pd.Timestamp(meta['start_date'])).dt.days
+                      .to_numpy(dtype=np.int64))
+    df['install_offset'] = install_offset.astype(np.int16)
+    df['play_days'] = (meta['day_to'] - install_offset + df['remaining_days'].to_numpy(dtype=np.int64)).astype(np.int16)
+    for name, categories in CATEGORIES.items():
+        df[name] = pd.Categorical(df[name].astype(object), categories=categories)
+    return df[STATE_COLUMNS], meta
+
+
+def _open_day_writers(data_dir, date_str, compression, fmt):
+    """Writer cho một ngày append: thư mục increments/ (text) hoặc partition mới của dataset Parquet."""
+    if fmt == 'parquet':
+        root = os.path.join(data_dir, PARQUET_DIR)
+        return root, open_parquet_writers(root, compression=compression)
+    part_dir = os.path.join(data_dir, INCREMENTS_DIR, f"event_date={date_str}")
+    os.makedirs(part_dir, exist_ok=True)
+    return part_dir, open_writers({table: os.path.join(part_dir, name) for table, (name, _) in TABLES.items()},
+                                  compression)
+
+
+def append_days(data_dir, num_days, new_users_per_day=0, compression=None, cohort_size=COHORT_SIZE, fmt='text'):
+    """Mô phỏng tiếp num_days ngày từ checkpoint, mỗi ngày ghi một partition mới.
+
+    new_users_per_day: số user cài đặt mới mỗi ngày (user_index tiếp nối checkpoint).
+    fmt='parquet': ghi thêm partition event_date=YYYYMMDD vào dataset data_dir/parquet/.
+    Trả về danh sách thư mục đã ghi.
+    """
+    state, meta = load_checkpoint(data_dir)
+    seed, start_date = meta['seed'], meta['start_date']
+    next_user_index = meta['next_user_index']
+    day_from = meta['day_to']
+    partitions = []
+
+    for day in range(day_from, day_from + num_days):
+        date_str = (start_date + timedelta(days=day)).strftime('%Y%m%d')
+        new_users = simulate_users(np.arange(next_user_index, next_user_index + new_users_per_day),
+                                   seed, start_date, install_offset=day)
+        new_users['current_level'] = np.ones(len(new_users), dtype=np.int16)
+        next_user_index += new_users_per_day
+        state = pd.concat([state, new_users[STATE_COLUMNS]], ignore_index=True)
+
+        install_offset = state['install_offset'].to_numpy(dtype=np.int64)
+        active = np.flatnonzero((install_offset <= day)
+                                & (day < install_offset + state['play_days'].to_numpy(dtype=np.int64)))
+        levels = state['current_level'].to_numpy(dtype=np.int16).copy()
+
+        part_dir, (stack, writers) = _open_day_writers(data_dir, date_str, compression, fmt)
+        with stack:
+            write_users(new_users, writers)
+            for start in range(0, len(active), cohort_size):
+                rows = active[start:start + cohort_size]
+                users = state.iloc[rows].reset_index(drop=True)
+                events, level = simulate_events(users, seed, start_date, day_from=day, day_to=day + 1)
+                write_events(users, events, writers)
+                levels[rows] = level
+        state['current_level'] = levels
+
+        # Bỏ người chơi đã hết ngày chơi để checkpoint luôn gọn
+        state = state[remaining_days(state, day + 1) > 0].reset_index(drop=True)
+        partitions.append(part_dir)
+
+    save_checkpoint(data_dir, state, seed, day_from + num_days, next_user_index, start_date)
+    return partitions
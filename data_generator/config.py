@@ -0,0 +1,70 @@
+from datetime import datetime
+
+# Cấu hình
+NUM_USERS = 1000
+START_DATE = datetime(2025, 11, 1)
+DAYS_RANGE = 30  # Dữ liệu trong 30 ngày
+DATA_DIR = "./data"
+SEED = 42
+
+# GAME CONFIGURATION
+SOURCES = ['Organic', 'Facebook Ads', 'Google Ads', 'Unity Ads', 'TikTok Ads']
+WEAPONS = ['Glock-17', 'AK-47', 'M4A1', 'Shotgun-S1', 'Sniper-AWP', 'Katana']
+LEVELS = range(1, 21)  # Level 1 đến 20
+EVENTS = ['session_start', 'level_start', 'level_complete', 'level_fail', 'ad_reward_claim', 'iap_purchase']
+
+# USER PROFILE
+COUNTRIES = ['Vietnam', 'USA', 'Thailand', 'Brazil', 'Philippines']
+DEVICE_CATEGORIES = ['mobile', 'tablet']
+OS_LIST = ['Android', 'iOS']
+ANDROID_SHARE = 0.7  # 70% Android
+
+# Phân nhóm thị trường cho UA (Tier 1 = giá trị cao nhất)
+COUNTRY_TIERS = {
+    'USA': 'Tier 1',
+    'Thailand': 'Tier 2',
+    'Vietnam': 'Tier 3',
+    'Brazil': 'Tier 3',
+    'Philippines': 'Tier 3',
+}
+TIERS = ['Tier 1', 'Tier 2', 'Tier 3']
+
+# CPI (min, max) theo nguồn, Organic = 0
+CPI_RANGES = {
+    'Organic': (0.0, 0.0),
+    'Facebook Ads': (1.5, 3.0),
+    'Google Ads': (1.2, 2.5),
+    'Unity Ads': (0.8, 1.5),
+    'TikTok Ads': (0.5, 1.2),
+}
+CAMPAIGN_IDS = [f"CMP_{i}" for i in range(100, 106)]
+
+# Bảng tra thành phố theo quốc gia (thay cho fake.city() trong chế độ vectorized)
+CITIES = {
+    'Vietnam': ['Ha Noi', 'Ho Chi Minh City', 'Da Nang', 'Hai Phong', 'Can Tho'],
+    'USA': ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Seattle'],
+    'Thailand': ['Bangkok', 'Chiang Mai', 'Phuket', 'Pattaya', 'Khon Kaen'],
+    'Brazil': ['Sao Paulo', 'Rio de Janeiro', 'Brasilia', 'Salvador', 'Fortaleza'],
+    'Philippines': ['Manila', 'Quezon City', 'Cebu City', 'Davao City', 'Makati'],
+}
+
+# BEHAVIOUR MODEL
+# Retention curve simulation: Rất nhiều user bỏ sau ngày 1
+PLAY_DAYS = [1, 3, 7, 14, 30]
+PLAY_DAYS_WEIGHTS = [40, 20, 15, 15, 10]
+SESSIONS_PER_DAY = (1, 3)
+LEVELS_PER_SESSION = (1, 5)
+LEVEL_MINUTES = (2, 10)  # Thời gian chơi mỗi màn
+RESULT_MINUTES = (1, 3)
+WIN_RATE_BASE = 0.9
+WIN_RATE_STEP = 0.03
+WIN_RATE_FLOOR = 0.2
+HARD_LEVEL_EVERY = 5  # Level chia hết cho 5 thì khó
+TIME_SPENT_SEC = (60, 300)
+GOLD_EARNED = (50, 200)
+DEATH_REASONS = ['Zombie Bite', 'Out of Ammo', 'Time Out']
+AD_RATE = 0.3
+AD_GOLD_REWARD = 50
+AD_REVENUE = (0.005, 0.03)  # Doanh thu mỗi lượt xem quảng cáo (USD)
+IAP_RATE = 0.05
+PACK_PRICES = [0.99, 4.99, 9.99]
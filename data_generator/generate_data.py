@@ -1,30 +1,26 @@
 import os
+import sys
 import json
+import time
 import random
+import argparse
 import pandas as pd
-import numpy as np
 from faker import Faker
-from datetime import datetime, timedelta
+from datetime import timedelta
+from itertools import islice
 
-# Cấu hình
-NUM_USERS = 1000
-START_DATE = datetime(2025, 11, 1)
-DAYS_RANGE = 30  # Dữ liệu trong 30 ngày
-DATA_DIR = "./data"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Khởi tạo Faker
-fake = Faker()
-Faker.seed(42)
-random.seed(42)
+from data_generator.config import NUM_USERS, START_DATE, DAYS_RANGE, DATA_DIR, SEED, SOURCES, WEAPONS
+from data_generator.simulation import export_users
+from data_generator.writers import TABLES, LEGACY_TABLES, open_writers
+from data_generator.sharding import SHARD_SIZE, MANIFEST_FILE, run_sharded, merge_parts
+from data_generator.parquet_writer import PARQUET_DIR, open_parquet_writers
+from data_generator.checkpoint import CHECKPOINT_FILE, save_checkpoint, append_days
+from data_generator.stream import STREAM_RATE, run_stream
+from analytics.profiling import PROFILER, PROFILE_ENV, span
 
-# Đảm bảo thư mục data tồn tại
-os.makedirs(DATA_DIR, exist_ok=True)
-
-# GAME CONFIGURATION
-SOURCES = ['Organic', 'Facebook Ads', 'Google Ads', 'Unity Ads', 'TikTok Ads']
-WEAPONS = ['Glock-17', 'AK-47', 'M4A1', 'Shotgun-S1', 'Sniper-AWP', 'Katana']
-LEVELS = range(1, 21)  # Level 1 đến 20
-EVENTS = ['session_start', 'level_start', 'level_complete', 'level_fail', 'ad_reward_claim', 'iap_purchase']
+CHUNK_EVENTS = 50_000  # Số event gom lại trước khi ghi (chế độ legacy)
 
 # HELPER FUNCTIONS
 
@@ -54,216 +50,327 @@ def get_random_timestamp(date_obj):
     seconds = random.randint(0, 86399)
     return date_obj + timedelta(seconds=seconds)
 
-# MAIN GENERATION
-
-print("1. Đang khởi tạo hồ sơ người dùng (User Profiles)...")
-
-users = []
-for _ in range(NUM_USERS):
-    user_id = fake.uuid4()
-    join_date = START_DATE + timedelta(days=random.randint(0, DAYS_RANGE - 5))
-
-    # Xác định Geo & Device cố định cho user đó
-    country = random.choice(['Vietnam', 'USA', 'Thailand', 'Brazil', 'Philippines'])
-    device_cat = random.choice(['mobile', 'tablet'])
-    os_sys = 'Android' if random.random() > 0.3 else 'iOS'  # 70% Android
-
-    # Xác định Source & CPI
-    source = random.choice(SOURCES)
-    cpi = 0.0
-    if source == 'Facebook Ads':
-        cpi = round(random.uniform(1.5, 3.0), 2)
-    elif source == 'Google Ads':
-        cpi = round(random.uniform(1.2, 2.5), 2)
-    elif source == 'Unity Ads':
-        cpi = round(random.uniform(0.8, 1.5), 2)
-    elif source == 'TikTok Ads':
-        cpi = round(random.uniform(0.5, 1.2), 2)
-
-    users.append({
-        'user_id': user_id,
-        'user_pseudo_id': fake.md5(),  # Device ID
-        'install_date': join_date,
-        'country': country,
-        'city': fake.city(),
-        'device_category': device_cat,
-        'mobile_os': os_sys,
-        'source': source,
-        'cpi': cpi,
-        'campaign_id': f"CMP_{random.randint(100, 105)}" if source != 'Organic' else None
-    })
-
-# STEP 1: EXPORT USER ACQUISITION (CSV)
-df_ua = pd.DataFrame(users)[['user_id', 'install_date', 'source', 'campaign_id', 'cpi']]
-df_ua.to_csv(f"{DATA_DIR}/user_acquisition.csv", index=False)
-print(f"-> Đã lưu {DATA_DIR}/user_acquisition.csv")
-
-# STEP 2: GENERATE EVENTS (JSON & CSV)
-
-all_events_nested = []  # Dành cho JSON (BigQuery)
-all_events_flat = []  # Dành cho CSV (Tableau)
-
-for user in users:
-    # Mô phỏng user chơi game trong vài ngày sau khi cài đặt
-    # Retention curve simulation: Rất nhiều user bỏ sau ngày 1
-    play_days = random.choices(
-        [1, 3, 7, 14, 30],
-        weights=[40, 20, 15, 15, 10],
-        k=1
-    )[0]
-
-    current_level = 1
-
-    for day_offset in range(play_days):
-        active_date = user['install_date'] + timedelta(days=day_offset)
-        if active_date > START_DATE + timedelta(days=DAYS_RANGE):
-            break
-
-        # Mỗi ngày chơi 1-3 sessions
-        num_sessions = random.randint(1, 3)
-        for _ in range(num_sessions):
-            session_time = get_random_timestamp(active_date)
-
-            # --- Event: session_start ---
-            base_event = {
-                'event_date': session_time.strftime('%Y%m%d'),
-                'event_timestamp': int(session_time.timestamp() * 1000000),
-                'user_id': user['user_id'],
-                'user_pseudo_id': user['user_pseudo_id'],
-                'geo': {'country': user['country'], 'city': user['city']},
-                'device': {'category': user['device_category'], 'mobile_os': user['mobile_os']}
-            }
-
-            # 1. Session Start
-            evt_session = base_event.copy()
-            evt_session['event_name'] = 'session_start'
-            evt_session['event_params'] = generate_ga4_params({'ga_session_id': random.randint(1000, 9999)})
-            all_events_nested.append(evt_session)
-
-            # Flatten for CSV (chỉ lấy field quan trọng)
-            flat_row = {k: v for k, v in base_event.items() if k not in ['geo', 'device']}
-            flat_row.update({'event_name': 'session_start', 'country': user['country'], 'os': user['mobile_os']})
-            all_events_flat.append(flat_row)
-
-            # 2. Gameplay Loop (Chơi 1-5 levels mỗi session)
-            num_levels = random.randint(1, 5)
-            session_cursor = session_time
-
-            for _ in range(num_levels):
-                session_cursor += timedelta(minutes=random.randint(2, 10))  # Thời gian chơi mỗi màn
-
-                # --- Event: level_start ---
-                difficulty = 'Hard' if current_level % 5 == 0 else 'Normal'  # Level chia hết cho 5 thì khó
-                weapon = random.choice(WEAPONS)
-
-                evt_start = base_event.copy()
-                evt_start['event_name'] = 'level_start'
-                evt_start['event_timestamp'] = int(session_cursor.timestamp() * 1000000)
-                params_dict = {'level_id': current_level, 'difficulty': difficulty, 'weapon_used': weapon}
-                evt_start['event_params'] = generate_ga4_params(params_dict)
-                all_events_nested.append(evt_start)
-
-                # Flatten
-                flat_row = {k: v for k, v in base_event.items() if k not in ['geo', 'device']}
-                flat_row.update({'event_name': 'level_start', 'country': user['country'], 'os': user['mobile_os']})
-                flat_row.update(params_dict)  # Bung param ra cột
-                all_events_flat.append(flat_row)
-
-                # Win or Lose? (Càng lên cao càng dễ thua)
-                win_rate = max(0.2, 0.9 - (current_level * 0.03))
-                is_win = random.random() < win_rate
-
-                session_cursor += timedelta(minutes=random.randint(1, 3))
-
-                if is_win:
-                    # Event: level_complete
-                    evt_end = base_event.copy()
-                    evt_end['event_name'] = 'level_complete'
-                    evt_end['event_timestamp'] = int(session_cursor.timestamp() * 1000000)
-                    gold_earned = random.randint(50, 200)
-                    params_dict = {'level_id': current_level, 'time_spent_sec': random.randint(60, 300),
-                                   'gold_earned': gold_earned, 'status': 'Win'}
-                    evt_end['event_params'] = generate_ga4_params(params_dict)
-                    all_events_nested.append(evt_end)
-
-                    # Flatten
-                    flat_row = {k: v for k, v in base_event.items() if k not in ['geo', 'device']}
-                    flat_row.update(
-                        {'event_name': 'level_complete', 'country': user['country'], 'os': user['mobile_os']})
-                    flat_row.update(params_dict)
-                    all_events_flat.append(flat_row)
-
-                    current_level += 1  # Lên cấp
-                else:
-                    # Event: level_fail
-                    evt_fail = base_event.copy()
-                    evt_fail['event_name'] = 'level_fail'
-                    evt_fail['event_timestamp'] = int(session_cursor.timestamp() * 1000000)
-                    params_dict = {'level_id': current_level,
-                                   'death_reason': random.choice(['Zombie Bite', 'Out of Ammo', 'Time Out']),
-                                   'status': 'Fail'}
-                    evt_fail['event_params'] = generate_ga4_params(params_dict)
-                    all_events_nested.append(evt_fail)
-
-                    # Flatten
-                    flat_row = {k: v for k, v in base_event.items() if k not in ['geo', 'device']}
-                    flat_row.update({'event_name': 'level_fail', 'country': user['country'], 'os': user['mobile_os']})
-                    flat_row.update(params_dict)
-                    all_events_flat.append(flat_row)
-
-                # 3. Monetization (Randomly)
-                # Ad Watch (Sau khi chơi xong level)
-                if random.random() < 0.3:
-                    evt_ad = base_event.copy()
-                    evt_ad['event_name'] = 'ad_reward_claim'
-                    evt_ad['event_timestamp'] = int((session_cursor + timedelta(seconds=30)).timestamp() * 1000000)
-                    params_dict = {'ad_type': 'Rewarded Video', 'placement': 'End Game', 'gold_reward': 50}
-                    evt_ad['event_params'] = generate_ga4_params(params_dict)
-                    all_events_nested.append(evt_ad)
-
-                    # Flatten
-                    flat_row = {k: v for k, v in base_event.items() if k not in ['geo', 'device']}
-                    flat_row.update(
-                        {'event_name': 'ad_reward_claim', 'country': user['country'], 'os': user['mobile_os']})
-                    flat_row.update(params_dict)
-                    all_events_flat.append(flat_row)
-
-                # IAP Purchase (Hiếm hơn)
-                if random.random() < 0.05:
-                    evt_iap = base_event.copy()
-                    evt_iap['event_name'] = 'iap_purchase'
-                    evt_iap['event_timestamp'] = int((session_cursor + timedelta(seconds=60)).timestamp() * 1000000)
-                    pack_price = random.choice([0.99, 4.99, 9.99])
-                    product_id = f"pack_gem_{int(pack_price)}"
-                    params_dict = {'product_id': product_id, 'price': pack_price, 'currency': 'USD', 'quantity': 1}
-                    evt_iap['event_params'] = generate_ga4_params(params_dict)
-                    all_events_nested.append(evt_iap)
-
-                    # Flatten
-                    flat_row = {k: v for k, v in base_event.items() if k not in ['geo', 'device']}
-                    flat_row.update({'event_name': 'iap_purchase', 'country': user['country'], 'os': user['mobile_os']})
-                    flat_row.update(params_dict)
-                    all_events_flat.append(flat_row)
-
-# STEP 3: EXPORT EVENTS
-
-# Lưu JSON
-json_path = f"{DATA_DIR}/user_events_nested.json"
-with open(json_path, 'w', encoding='utf-8') as f:
-    for entry in all_events_nested:
-        json.dump(entry, f)
-        f.write('\n')
-print(f"-> Đã lưu {json_path} (Format: NDJSON cho BigQuery)")
-
-# Lưu CSV
-df_events = pd.DataFrame(all_events_flat)
-# Sắp xếp lại cột cho đẹp (đưa param lên đầu hoặc cuối tùy ý)
-cols = ['event_date', 'event_timestamp', 'event_name', 'user_id', 'country', 'os',
-        'level_id', 'status', 'weapon_used', 'gold_earned', 'price', 'product_id']
-# Lọc chỉ lấy các cột có trong df (vì params không đồng nhất giữa các rows)
-exist_cols = [c for c in cols if c in df_events.columns]
-df_events = df_events[exist_cols]
-df_events.to_csv(f"{DATA_DIR}/user_events_flat.csv", index=False)
-print(f"-> Đã lưu {DATA_DIR}/user_events_flat.csv (Format: CSV cho Tableau)")
-
-print("DONE")
+# MAIN GENERATION (LEGACY: vòng lặp từng user -> event)
+
+def build_user_profiles(fake, num_users):
+    """Sinh hồ sơ người dùng bằng Faker, từng user một."""
+    users = []
+    for _ in range(num_users):
+        user_id = fake.uuid4()
+        join_date = START_DATE + timedelta(days=random.randint(0, DAYS_RANGE - 5))
+
+        # Xác định Geo & Device cố định cho user đó
+        country = random.choice(['Vietnam', 'USA', 'Thailand', 'Brazil', 'Philippines'])
+        device_cat = random.choice(['mobile', 'tablet'])
+        os_sys = 'Android' if random.random() > 0.3 else 'iOS'  # 70% Android
+
+        # Xác định Source & CPI
+        source = random.choice(SOURCES)
+        cpi = 0.0
+        if source == 'Facebook Ads':
+            cpi = round(random.uniform(1.5, 3.0), 2)
+        elif source == 'Google Ads':
+            cpi = round(random.uniform(1.2, 2.5), 2)
+        elif source == 'Unity Ads':
+            cpi = round(random.uniform(0.8, 1.5), 2)
+        elif source == 'TikTok Ads':
+            cpi = round(random.uniform(0.5, 1.2), 2)
+
+        users.append({
+            'user_id': user_id,
+            'user_pseudo_id': fake.md5(),  # Device ID
+            'install_date': join_date,
+            'country': country,
+            'city': fake.city(),
+            'device_category': device_cat,
+            'mobile_os': os_sys,
+            'source': source,
+            'cpi': cpi,
+            'campaign_id': f"CMP_{random.randint(100, 105)}" if source != 'Organic' else None
+        })
+    return users
+
+
+def generate_events(users):
+    """Generator: lần lượt yield từng event lồng nhau (GA4 schema) của mỗi user."""
+    for user in users:
+        # Mô phỏng user chơi game trong vài ngày sau khi cài đặt
+        # Retention curve simulation: Rất nhiều user bỏ sau ngày 1
+        play_days = random.choices(
+            [1, 3, 7, 14, 30],
+            weights=[40, 20, 15, 15, 10],
+            k=1
+        )[0]
+
+        current_level = 1
+
+        for day_offset in range(play_days):
+            active_date = user['install_date'] + timedelta(days=day_offset)
+            if active_date > START_DATE + timedelta(days=DAYS_RANGE):
+                break
+
+            # Mỗi ngày chơi 1-3 sessions
+            num_sessions = random.randint(1, 3)
+            for _ in range(num_sessions):
+                session_time = get_random_timestamp(active_date)
+
+                # --- Event: session_start ---
+                base_event = {
+                    'event_date': session_time.strftime('%Y%m%d'),
+                    'event_timestamp': int(session_time.timestamp() * 1000000),
+                    'user_id': user['user_id'],
+                    'user_pseudo_id': user['user_pseudo_id'],
+                    'geo': {'country': user['country'], 'city': user['city']},
+                    'device': {'category': user['device_category'], 'mobile_os': user['mobile_os']}
+                }
+
+                # 1. Session Start
+                evt_session = base_event.copy()
+                evt_session['event_name'] = 'session_start'
+                evt_session['event_params'] = generate_ga4_params({'ga_session_id': random.randint(1000, 9999)})
+                yield evt_session
+
+                # 2. Gameplay Loop (Chơi 1-5 levels mỗi session)
+                num_levels = random.randint(1, 5)
+                session_cursor = session_time
+
+                for _ in range(num_levels):
+                    session_cursor += timedelta(minutes=random.randint(2, 10))  # Thời gian chơi mỗi màn
+
+                    # --- Event: level_start ---
+                    difficulty = 'Hard' if current_level % 5 == 0 else 'Normal'  # Level chia hết cho 5 thì khó
+                    weapon = random.choice(WEAPONS)
+
+                    evt_start = base_event.copy()
+                    evt_start['event_name'] = 'level_start'
+                    evt_start['event_timestamp'] = int(session_cursor.timestamp() * 1000000)
+                    params_dict = {'level_id': current_level, 'difficulty': difficulty, 'weapon_used': weapon}
+                    evt_start['event_params'] = generate_ga4_params(params_dict)
+                    yield evt_start
+
+                    # Win or Lose? (Càng lên cao càng dễ thua)
+                    win_rate = max(0.2, 0.9 - (current_level * 0.03))
+                    is_win = random.random() < win_rate
+
+                    session_cursor += timedelta(minutes=random.randint(1, 3))
+
+                    if is_win:
+                        # Event: level_complete
+                        evt_end = base_event.copy()
+                        evt_end['event_name'] = 'level_complete'
+                        evt_end['event_timestamp'] = int(session_cursor.timestamp() * 1000000)
+                        gold_earned = random.randint(50, 200)
+                        params_dict = {'level_id': current_level, 'time_spent_sec': random.randint(60, 300),
+                                       'gold_earned': gold_earned, 'status': 'Win'}
+                        evt_end['event_params'] = generate_ga4_params(params_dict)
+                        yield evt_end
+
+                        current_level += 1  # Lên cấp
+                    else:
+                        # Event: level_fail
+                        evt_fail = base_event.copy()
+                        evt_fail['event_name'] = 'level_fail'
+                        evt_fail['event_timestamp'] = int(session_cursor.timestamp() * 1000000)
+                        params_dict = {'level_id': current_level,
+                                       'death_reason': random.choice(['Zombie Bite', 'Out of Ammo', 'Time Out']),
+                                       'status': 'Fail'}
+                        evt_fail['event_params'] = generate_ga4_params(params_dict)
+                        yield evt_fail
+
+                    # 3. Monetization (Randomly)
+                    # Ad Watch (Sau khi chơi xong level)
+                    if random.random() < 0.3:
+                        evt_ad = base_event.copy()
+                        evt_ad['event_name'] = 'ad_reward_claim'
+                        evt_ad['event_timestamp'] = int((session_cursor + timedelta(seconds=30)).timestamp() * 1000000)
+                        params_dict = {'ad_type': 'Rewarded Video', 'placement': 'End Game', 'gold_reward': 50}
+                        evt_ad['event_params'] = generate_ga4_params(params_dict)
+                        yield evt_ad
+
+                    # IAP Purchase (Hiếm hơn)
+                    if random.random() < 0.05:
+                        evt_iap = base_event.copy()
+                        evt_iap['event_name'] = 'iap_purchase'
+                        evt_iap['event_timestamp'] = int((session_cursor + timedelta(seconds=60)).timestamp() * 1000000)
+                        pack_price = random.choice([0.99, 4.99, 9.99])
+                        product_id = f"pack_gem_{int(pack_price)}"
+                        params_dict = {'product_id': product_id, 'price': pack_price, 'currency': 'USD', 'quantity': 1}
+                        evt_iap['event_params'] = generate_ga4_params(params_dict)
+                        yield evt_iap
+
+
+def flatten_event(event):
+    """Flatten for CSV (chỉ lấy field quan trọng), bung event_params ra cột."""
+    row = {
+        'event_date': event['event_date'],
+        'event_timestamp': event['event_timestamp'],
+        'event_name': event['event_name'],
+        'user_id': event['user_id'],
+        'country': event['geo']['country'],
+        'os': event['device']['mobile_os'],
+    }
+    for param in event['event_params']:
+        row[param['key']] = next(iter(param['value'].values()))
+    return row
+
+
+def chunked(iterable, size):
+    """Gom generator thành từng list có tối đa `size` phần tử."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def open_output_writers(data_dir, compression, fmt='text', tables=None):
+    """Writers cho output: text = user acquisition (CSV), events NDJSON, events CSV, quảng cáo (CSV);
+    parquet = dataset data/parquet/<table>/ partition theo ngày. tables: chỉ mở các bảng text này."""
+    if fmt == 'parquet':
+        return open_parquet_writers(f"{data_dir}/{PARQUET_DIR}", compression=compression)
+    return open_writers({table: f"{data_dir}/{name}" for table, (name, _) in TABLES.items()
+                         if tables is None or table in tables}, compression)
+
+
+FORMAT_NOTES = {
+    'user_events_nested': " (Format: NDJSON cho BigQuery)",
+    'user_events_flat': " (Format: CSV cho Tableau)",
+    'ad_impressions': " (Format: CSV, doanh thu từng lượt xem quảng cáo)",
+    'events': " (Format: Parquet, partition theo event_date)",
+}
+
+
+def report(writers, started):
+    events = writers['events' if 'events' in writers else 'user_events_nested'].rows
+    elapsed = time.perf_counter() - started
+    print(f"-> {events:,} events trong {elapsed:.2f}s ({events / max(elapsed, 1e-9):,.0f} events/s)")
+    for table, writer in writers.items():
+        print(f"-> Đã lưu {writer.path}{FORMAT_NOTES.get(table, '')}")
+
+
+def run_legacy(num_users, seed, data_dir, compression=None):
+    fake = Faker()
+    Faker.seed(seed)
+    random.seed(seed)
+
+    print("1. Đang khởi tạo hồ sơ người dùng (User Profiles)...")
+    started = time.perf_counter()
+    with span('generate.user_profiles'):
+        users = build_user_profiles(fake, num_users)
+    stack, writers = open_output_writers(data_dir, compression, tables=LEGACY_TABLES)
+    with stack:
+        # STEP 1: EXPORT USER ACQUISITION (CSV)
+        with span('generate.ua_export'):
+            writers['user_acquisition'].write_frame(pd.DataFrame(users))
+
+        # STEP 2: GENERATE & STREAM EVENTS (JSON & CSV), mỗi lần một chunk
+        chunks = chunked(generate_events(users), CHUNK_EVENTS)
+        while True:
+            with span('generate.event_loop'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            with span('generate.json_export'):
+                writers['user_events_nested'].write_lines(json.dumps(event) for event in chunk)
+            with span('generate.csv_export'):
+                writers['user_events_flat'].write_frame(pd.DataFrame([flatten_event(event) for event in chunk]))
+    report(writers, started)
+
+
+# MAIN GENERATION (VECTORIZED: mô phỏng cả cohort bằng NumPy)
+
+def run_vectorized(num_users, seed, data_dir, compression=None, checkpoint=False, fmt='text'):
+    print("1. Đang mô phỏng theo cohort (Vectorized NumPy engine)...")
+    started = time.perf_counter()
+    stack, writers = open_output_writers(data_dir, compression, fmt)
+    with stack:
+        state = export_users(0, num_users, seed, writers, keep_state=checkpoint)
+    report(writers, started)
+    if checkpoint:
+        print(f"-> Đã lưu {save_checkpoint(data_dir, state, seed, DAYS_RANGE + 1, num_users)}")
+
+
+def run_parallel(num_users, seed, data_dir, compression=None, workers=None, shard_size=SHARD_SIZE, merge=False,
+                 checkpoint=False, fmt='text'):
+    print(f"1. Đang mô phỏng song song ({workers or os.cpu_count()} workers, shard = {shard_size:,} users)...")
+    started = time.perf_counter()
+    manifest = run_sharded(num_users, seed, data_dir, compression, workers, shard_size, checkpoint, fmt)
+    events_table = 'events' if fmt == 'parquet' else 'user_events_nested'
+    events = sum(part['rows'] for part in manifest['tables'][events_table]['parts'])
+    elapsed = time.perf_counter() - started
+    print(f"-> {events:,} events trong {elapsed:.2f}s ({events / max(elapsed, 1e-9):,.0f} events/s)")
+    print(f"-> Đã lưu {len(manifest['shards'])} shards + {data_dir}/{MANIFEST_FILE}")
+    if merge:
+        for path in merge_parts(data_dir, manifest):
+            print(f"-> Đã ghép {path}")
+
+
+def run_append(data_dir, num_days, new_users_per_day=0, compression=None, fmt='text'):
+    print(f"1. Đang mô phỏng tiếp {num_days} ngày từ {data_dir}/{CHECKPOINT_FILE}...")
+    started = time.perf_counter()
+    partitions = append_days(data_dir, num_days, new_users_per_day, compression, fmt=fmt)
+    elapsed = time.perf_counter() - started
+    for path in partitions:
+        print(f"-> Đã lưu {path}")
+    print(f"-> {len(partitions)} ngày trong {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zombie Protocol - sinh dữ liệu giả lập")
+    parser.add_argument('--engine', choices=['legacy', 'vectorized'], default='vectorized',
+                        help="vectorized: NumPy theo cohort (mặc định); legacy: vòng lặp Python + Faker như bản gốc")
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None)
+    parser.add_argument('--format', choices=['text', 'parquet'], default='text',
+                        help="text: NDJSON + CSV; parquet: dataset Hive-partitioned theo ngày (chỉ engine vectorized)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Bật chế độ song song (vectorized): số process, mỗi shard ghi part file riêng")
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--merge', action='store_true', help="Ghép các part file thành file output đơn")
+    parser.add_argument('--checkpoint', action='store_true',
+                        help="Lưu trạng thái người chơi (vectorized/song song) để append các ngày tiếp theo")
+    parser.add_argument('--append-days', type=int, default=None,
+                        help="Mô phỏng tiếp N ngày từ checkpoint, ghi vào increments/event_date=YYYYMMDD/")
+    parser.add_argument('--new-users-per-day', type=int, default=0,
+                        help="Số user cài đặt mới mỗi ngày trong chế độ append")
+    parser.add_argument('--stream', action='store_true',
+                        help="Phát event liên tục (asyncio) vào data/stream/events.ndjson hoặc socket --port")
+    parser.add_argument('--rate', type=int, default=STREAM_RATE, help="Số event/giây ở chế độ --stream")
+    parser.add_argument('--port', type=int, default=None, help="Chế độ --stream: phát qua TCP 127.0.0.1:PORT thay cho log")
+    parser.add_argument('--max-events', type=int, default=None, help="Chế độ --stream: dừng sau N event")
+    parser.add_argument('--trace', default=None,
+                        help=f"Ghi Chrome trace của các giai đoạn ra file (bật đo thời gian nếu chưa đặt {PROFILE_ENV})")
+    args = parser.parse_args()
+
+    if args.format == 'parquet' and args.engine == 'legacy' and not (args.workers or args.append_days):
+        parser.error("--format parquet cần --engine vectorized (hoặc --workers / --append-days)")
+
+    # Đảm bảo thư mục data tồn tại
+    os.makedirs(args.data_dir, exist_ok=True)
+    if args.trace and not PROFILER.enabled:
+        PROFILER.configure('1')
+
+    if args.stream:
+        run_stream(args.data_dir, args.users, args.seed, args.rate, args.port, args.max_events)
+    elif args.append_days:
+        run_append(args.data_dir, args.append_days, args.new_users_per_day, args.compression, args.format)
+    elif args.workers:
+        run_parallel(args.users, args.seed, args.data_dir, args.compression, args.workers, args.shard_size, args.merge,
+                     args.checkpoint, args.format)
+    elif args.engine == 'vectorized':
+        run_vectorized(args.users, args.seed, args.data_dir, args.compression, args.checkpoint, args.format)
+    else:
+        run_legacy(args.users, args.seed, args.data_dir, args.compression)
+    if PROFILER.enabled:
+        print(PROFILER.summary().round(2).to_string())
+    if args.trace:
+        PROFILER.to_chrome_trace(args.trace)
+        print(f"-> Đã lưu {args.trace} (chrome://tracing)")
+    print("DONE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Counter-based random draws (splitmix64), vectorized với NumPy.
+
+Mỗi giá trị ngẫu nhiên là hàm thuần của (seed, key, stream): key được dựng
+từ tọa độ của đối tượng (user index, ngày, session, lượt chơi) nên lịch sử
+của một user không phụ thuộc vào NUM_USERS, cách chia cohort/shard hay số
+worker. Cùng seed + cùng user index -> cùng kết quả.
+"""
+import zlib
+
+import numpy as np
+
+_MASK = (1 << 64) - 1
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_TO_UNIT = 2.0 ** -53
+
+
+def _mix(z):
+    """splitmix64 finalizer (phép nhân uint64 trên mảng tự wrap mod 2^64)."""
+    z = np.asarray(z, dtype=np.uint64)
+    with np.errstate(over='ignore'):  # 0-d array được tính như scalar và cảnh báo overflow
+        z = (z ^ (z >> np.uint64(30))) * _M1
+        z = (z ^ (z >> np.uint64(27))) * _M2
+    return z ^ (z >> np.uint64(31))
+
+
+def _stream_id(name):
+    return np.uint64(zlib.crc32(name.encode('utf-8')))
+
+
+def derive_key(seed, *parts):
+    """Key uint64 cho từng phần tử từ seed và các tọa độ (mảng cùng độ dài hoặc scalar)."""
+    key = _mix(np.full(1, (seed * 0x9E3779B97F4A7C15) & _MASK, dtype=np.uint64))
+    for part in parts:
+        key = _mix(key ^ (np.asarray(part).astype(np.uint64) + _GOLDEN))
+    return key
+
+
+def bits(key, stream):
+    """64 bit ngẫu nhiên cho mỗi key, tách theo tên stream (mỗi biến ngẫu nhiên một stream)."""
+    return _mix(key ^ _mix(_stream_id(stream)))
+
+
+def uniform(key, stream):
+    """Số thực đều trong [0, 1)."""
+    return (bits(key, stream) >> np.uint64(11)).astype(np.float64) * _TO_UNIT
+
+
+def randint(key, stream, bounds):
+    """Số nguyên đều trong [low, high], cả hai đầu inclusive như random.randint."""
+    low, high = bounds
+    return low + np.floor(uniform(key, stream) * (high - low + 1)).astype(np.int64)
+
+
+def choice_index(key, stream, n, p=None):
+    """Chỉ số trong range(n), đều hoặc theo trọng số p."""
+    if p is None:
+        return randint(key, stream, (0, n - 1))
+    cdf = np.cumsum(np.asarray(p, dtype=float))
+    return np.minimum(np.searchsorted(cdf / cdf[-1], uniform(key, stream), side='right'), n - 1)
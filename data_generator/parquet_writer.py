@@ -0,0 +1,204 @@
+"""
+Parquet sink: dataset Hive-partitioned theo ngày (event_date=YYYYMMDD/).
+
+Mỗi bảng là một thư mục dataset, mỗi partition chứa một file / writer
+(part-00000.parquet, hoặc part-<shard>.parquet ở chế độ song song). Cột có
+kiểu cố định, cột ít giá trị (event_name, country, os, weapon_used...) được
+dictionary-encode, mỗi row group có thống kê min/max, event_params giữ dạng
+list<struct> như schema GA4 gốc. Reader (Streamlit, BigQuery load job,
+DuckDB) nhờ đó chỉ đọc đúng partition và cột cần thiết.
+"""
+import os
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PARQUET_DIR = "parquet"
+PARQUET_COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 256_000
+
+
+def _dict():
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+PARAM_VALUE_TYPE = pa.struct([
+    ('string_value', pa.string()),
+    ('int_value', pa.int64()),
+    ('float_value', pa.float64()),
+    ('double_value', pa.float64()),
+])
+EVENT_PARAM_TYPE = pa.struct([('key', _dict()), ('value', PARAM_VALUE_TYPE)])
+
+EVENTS_SCHEMA = pa.schema([
+    ('event_date', pa.string()),
+    ('event_timestamp', pa.int64()),
+    ('event_name', _dict()),
+    ('user_id', pa.string()),
+    ('user_pseudo_id', pa.string()),
+    ('country', _dict()),
+    ('city', _dict()),
+    ('device_category', _dict()),
+    ('os', _dict()),
+    ('level_id', pa.int16()),
+    ('status', _dict()),
+    ('weapon_used', _dict()),
+    ('gold_earned', pa.int16()),
+    ('price', pa.float64()),
+    ('product_id', _dict()),
+    ('event_params', pa.list_(EVENT_PARAM_TYPE)),
+])
+USER_ACQUISITION_PARQUET_SCHEMA = pa.schema([
+    ('install_date', pa.string()),
+    ('user_id', pa.string()),
+    ('source', _dict()),
+    ('campaign_id', _dict()),
+    ('country', _dict()),
+    ('tier', _dict()),
+    ('os', _dict()),
+    ('cpi', pa.float64()),
+])
+IAP_TRANSACTIONS_SCHEMA = pa.schema([
+    ('event_date', pa.string()),
+    ('transaction_id', pa.string()),
+    ('user_id', pa.string()),
+    ('event_timestamp', pa.int64()),
+    ('product_id', _dict()),
+    ('price', pa.float64()),
+    ('currency', _dict()),
+])
+AD_IMPRESSIONS_SCHEMA = pa.schema([
+    ('event_date', pa.string()),
+    ('impression_id', pa.string()),
+    ('user_id', pa.string()),
+    ('event_timestamp', pa.int64()),
+    ('ad_type', _dict()),
+    ('placement', _dict()),
+    ('revenue', pa.float64()),
+])
+
+# Các bảng Parquet: tên -> (schema, cột partition). Cột partition nằm trong
+# tên thư mục, không lưu lại trong file.
+PARQUET_TABLES = {
+    'events': (EVENTS_SCHEMA, 'event_date'),
+    'user_acquisition': (USER_ACQUISITION_PARQUET_SCHEMA, 'install_date'),
+    'iap_transactions': (IAP_TRANSACTIONS_SCHEMA, 'event_date'),
+    'ad_impressions': (AD_IMPRESSIONS_SCHEMA, 'event_date'),
+}
+
+
+def _partition_codes(values):
+    """(codes, labels) của cột partition; label dạng YYYYMMDD (cột ngày hoặc chuỗi event_date)."""
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), [str(c) for c in values.cat.categories]
+    codes, uniques = pd.factorize(values)
+    if pd.api.types.is_datetime64_any_dtype(uniques):
+        return codes, list(pd.DatetimeIndex(uniques).strftime('%Y%m%d'))
+    return codes, [str(u) for u in uniques]
+
+
+class ParquetDatasetWriter:
+    """Ghi một bảng thành dataset Parquet Hive-partitioned.
+
+    Mỗi partition giữ một pq.ParquetWriter mở suốt quá trình ghi, mỗi lần
+    write_* thêm row group mới vào đúng file của partition đó.
+    """
+
+    def __init__(self, root, schema, partition, basename='part-00000', compression=PARQUET_COMPRESSION):
+        self.path = root
+        self.schema = schema
+        self.partition = partition
+        self.file_schema = schema.remove(schema.get_field_index(partition))
+        self.basename = basename
+        self.compression = compression
+        self.rows = 0
+        self._writers = {}
+        self._rows = {}
+
+    def _writer(self, key):
+        writer = self._writers.get(key)
+        if writer is None:
+            path = os.path.join(self.path, f"{self.partition}={key}", f"{self.basename}.parquet")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = pq.ParquetWriter(path, self.file_schema, compression=self.compression,
+                                      use_dictionary=True, write_statistics=True)
+            self._writers[key] = writer
+            self._rows[key] = 0
+        return writer
+
+    def write_frame(self, df, arrays=None):
+        """DataFrame -> Table theo schema (cột thiếu ghi null, cột thừa bỏ qua).
+
+        arrays: các cột Arrow dựng sẵn (ví dụ event_params), ưu tiên hơn cột của df.
+        """
+        arrays = arrays or {}
+        columns = {}
+        for field in self.file_schema:
+            if field.name in arrays:
+                columns[field.name] = arrays[field.name]
+            elif field.name in df.columns:
+                columns[field.name] = pa.array(df[field.name], from_pandas=True).cast(field.type)
+            else:
+                columns[field.name] = pa.nulls(len(df), field.type)
+        self.write_table(pa.table(columns, schema=self.file_schema), *_partition_codes(df[self.partition]))
+
+    def write_table(self, table, codes, labels):
+        """table: các cột theo file_schema; codes: chỉ số partition (trong labels) của từng dòng."""
+        if len(table) == 0:
+            return
+        # Một lần take theo partition (stable: giữ thứ tự trong partition), sau đó chỉ slice
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+        if bounds[-1] - bounds[0] < len(table):
+            raise ValueError(f"Missing {self.partition} for some rows")
+        if not (np.diff(order) == 1).all():
+            table = table.take(order)
+        for i, key in enumerate(labels):
+            start, stop = bounds[i], bounds[i + 1]
+            if stop > start:
+                self._writer(key).write_table(table.slice(start, stop - start), row_group_size=ROW_GROUP_SIZE)
+                self._rows[key] += int(stop - start)
+        self.rows += len(table)
+
+    def files(self):
+        """[(đường dẫn file, số dòng), ...] theo thứ tự partition."""
+        return [(os.path.join(self.path, f"{self.partition}={key}", f"{self.basename}.parquet"), self._rows[key])
+                for key in sorted(self._writers)]
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_parquet_writers(root, basename='part-00000', compression=None, tables=None):
+    """Mở writer cho các bảng trong PARQUET_TABLES, mỗi bảng là thư mục root/<table>/.
+
+    compression: codec Parquet (mặc định zstd). Trả về (ExitStack, {table: writer})
+    như writers.open_writers.
+    """
+    stack = ExitStack()
+    writers = {}
+    for table in tables or PARQUET_TABLES:
+        schema, partition = PARQUET_TABLES[table]
+        writers[table] = stack.enter_context(
+            ParquetDatasetWriter(os.path.join(root, table), schema, partition, basename,
+                                 compression or PARQUET_COMPRESSION))
+    return stack, writers
+
+
+def read_dataset(root, table):
+    """pyarrow Dataset của một bảng, cột partition được đọc lại dạng string YYYYMMDD."""
+    schema, partition = PARQUET_TABLES[table]
+    return ds.dataset(os.path.join(root, table), format='parquet',
+                      partitioning=ds.partitioning(pa.schema([schema.field(partition)]), flavor='hive'))
@@ -0,0 +1,150 @@
+"""
+Sinh dữ liệu song song theo shard (multi-process).
+
+User được chia thành các shard liên tiếp có kích thước cố định; mỗi shard do
+một process mô phỏng và ghi part file riêng cho từng bảng. Vì mọi lần rút
+ngẫu nhiên được key theo (seed, user index), nội dung part file chỉ phụ thuộc
+vào (seed, num_users, shard_size), không phụ thuộc số worker. manifest.json
+liệt kê các part theo thứ tự để ghép (merge_parts) hoặc load thẳng.
+"""
+import os
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+from data_generator.config import START_DATE, DAYS_RANGE
+from data_generator.checkpoint import save_checkpoint
+from data_generator.simulation import export_users
+from data_generator.writers import TABLES, open_writers, output_path, csv_header
+from data_generator.parquet_writer import PARQUET_DIR, PARQUET_TABLES, open_parquet_writers
+
+SHARD_SIZE = 50_000
+PARTS_DIR = "parts"
+MANIFEST_FILE = "manifest.json"
+
+
+def shard_ranges(num_users, shard_size=SHARD_SIZE):
+    """[(shard_id, start, stop), ...] phủ toàn bộ user [0, num_users)."""
+    return [(i, start, min(start + shard_size, num_users))
+            for i, start in enumerate(range(0, num_users, shard_size))]
+
+
+def part_path(table, shard_id):
+    """Đường dẫn tương đối (so với data_dir) của part file, chưa có đuôi nén."""
+    name, _ = TABLES[table]
+    _, ext = os.path.splitext(name)
+    return os.path.join(PARTS_DIR, table, f"part-{shard_id:05d}{ext}")
+
+
+def write_shard(task):
+    """Mô phỏng và ghi một shard; chạy trong worker process."""
+    shard_id, start, stop, seed, data_dir, compression, keep_state, fmt = task
+    if fmt == 'parquet':
+        # Mỗi shard ghi file part-<shard>.parquet riêng trong từng partition của dataset
+        stack, writers = open_parquet_writers(os.path.join(data_dir, PARQUET_DIR), f"part-{shard_id:05d}",
+                                              compression)
+    else:
+        paths = {table: os.path.join(data_dir, part_path(table, shard_id)) for table in TABLES}
+        for path in paths.values():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        stack, writers = open_writers(paths, compression, header=False)
+    with stack:
+        state = export_users(start, stop, seed, writers, keep_state)
+
+    files = {}
+    for table, writer in writers.items():
+        written = writer.files() if fmt == 'parquet' else [(writer.path, writer.rows)]
+        files[table] = [{
+            'path': os.path.relpath(path, data_dir),
+            'rows': rows,
+            'bytes': os.path.getsize(path),
+        } for path, rows in written]
+    return {'shard': shard_id, 'users': [start, stop], 'files': files, 'state': state}
+
+
+def run_sharded(num_users, seed, data_dir, compression=None, workers=None, shard_size=SHARD_SIZE, checkpoint=False,
+                fmt='text'):
+    """Chạy toàn bộ shard trên process pool, ghi manifest.json và trả về manifest.
+
+    checkpoint=True: gom trạng thái người chơi từ các shard và ghi một checkpoint chung.
+    fmt='parquet': các shard cùng ghi vào dataset data_dir/parquet/ thay vì part file NDJSON/CSV.
+    """
+    tasks = [(shard_id, start, stop, seed, data_dir, compression, checkpoint, fmt)
+             for shard_id, start, stop in shard_ranges(num_users, shard_size)]
+    if workers == 1:
+        results = [write_shard(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map giữ đúng thứ tự shard, bất kể shard nào xong trước
+            results = list(pool.map(write_shard, tasks))
+
+    if checkpoint:
+        state = pd.concat([r['state'] for r in results], ignore_index=True)
+        save_checkpoint(data_dir, state, seed, DAYS_RANGE + 1, num_users)
+
+    manifest = {
+        'seed': seed,
+        'num_users': num_users,
+        'shard_size': shard_size,
+        'start_date': START_DATE.strftime('%Y-%m-%d'),
+        'days_range': DAYS_RANGE,
+        'compression': compression,
+        'shards': [{'shard': r['shard'], 'users': r['users']} for r in results],
+        'tables': {},
+    }
+    for table in results[0]['files'] if results else []:
+        if fmt == 'parquet':
+            schema, partition = PARQUET_TABLES[table]
+            info = {'file': os.path.join(PARQUET_DIR, table), 'format': 'parquet', 'partitioning': partition}
+        else:
+            name, schema = TABLES[table]
+            info = {'file': name, 'format': 'ndjson' if schema is None else 'csv'}
+        info['columns'] = None if schema is None else schema.names
+        info['parts'] = [dict(part, shard=r['shard']) for r in results for part in r['files'][table]]
+        manifest['tables'][table] = info
+    with open(os.path.join(data_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    return manifest
+
+
+def _header_bytes(schema, compression):
+    """Header CSV, nén thành một member/frame riêng nếu cần (gzip/zstd cho phép nối)."""
+    header = csv_header(schema)
+    if not compression:
+        return header
+    buffer = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(buffer, compression) as stream:
+        stream.write(header)
+    return buffer.getvalue().to_pybytes()
+
+
+def merge_parts(data_dir, manifest=None):
+    """Ghép part file của từng bảng thành một file theo thứ tự shard trong manifest.
+
+    Chỉ nối byte (kể cả khi nén: các gzip member / zstd frame nối nhau vẫn hợp lệ),
+    không giải nén lại. Bảng Parquet đã là dataset nên được bỏ qua. Trả về danh
+    sách file đã ghi.
+    """
+    if manifest is None:
+        with open(os.path.join(data_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    compression = manifest['compression']
+    merged = []
+    for table, info in manifest['tables'].items():
+        if info['format'] == 'parquet':
+            continue
+        target = output_path(os.path.join(data_dir, info['file']), compression)
+        with open(target, 'wb') as out:
+            schema = TABLES[table][1]
+            if schema is not None:
+                out.write(_header_bytes(schema, compression))
+            for part in info['parts']:
+                with open(os.path.join(data_dir, part['path']), 'rb') as src:
+                    shutil.copyfileobj(src, out, 1 << 20)
+        merged.append(target)
+    return merged
@@ -0,0 +1,618 @@
+"""
+Vectorized simulation engine.
+
+Same behavioural model as the per-event loop in generate_data.py, but every
+random draw (play days, sessions, levels, win/fail, ads, IAP) is made as a
+NumPy array for a whole cohort of users at once. The only Python-level loop
+is over the "attempt rank" of the level chain, because a user's next level
+depends on whether the previous attempt was won.
+
+Draws are counter-based (keyed_random): each user's history depends only on
+(seed, user index), never on cohort size, user count or worker count.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from data_generator.keyed_random import derive_key, bits, uniform, randint, choice_index
+from data_generator.config import (
+    START_DATE, DAYS_RANGE, SOURCES, WEAPONS, EVENTS, COUNTRIES, DEVICE_CATEGORIES, OS_LIST,
+    ANDROID_SHARE, CPI_RANGES, CAMPAIGN_IDS, CITIES, PLAY_DAYS, PLAY_DAYS_WEIGHTS,
+    SESSIONS_PER_DAY, LEVELS_PER_SESSION, LEVEL_MINUTES, RESULT_MINUTES, WIN_RATE_BASE,
+    WIN_RATE_STEP, WIN_RATE_FLOOR, HARD_LEVEL_EVERY, TIME_SPENT_SEC, GOLD_EARNED, DEATH_REASONS,
+    AD_RATE, AD_GOLD_REWARD, AD_REVENUE, IAP_RATE, PACK_PRICES, COUNTRY_TIERS, TIERS,
+)
+from data_generator.parquet_writer import EVENT_PARAM_TYPE, PARAM_VALUE_TYPE
+from analytics.profiling import span
+
+SESSION_START, LEVEL_START, LEVEL_COMPLETE, LEVEL_FAIL, AD_REWARD_CLAIM, IAP_PURCHASE = range(6)
+DIFFICULTIES = ['Normal', 'Hard']
+STATUSES = ['Win', 'Fail']
+PRODUCT_IDS = [f"pack_gem_{int(p)}" for p in PACK_PRICES]
+CITY_LIST = [city for country in COUNTRIES for city in CITIES[country]]
+
+COHORT_SIZE = 20_000  # Số user mô phỏng trong một lần (giới hạn bộ nhớ)
+NDJSON_CHUNK_ROWS = 200_000
+
+# Trạng thái người chơi cần để mô phỏng tiếp (checkpoint)
+STATE_COLUMNS = ['user_index', 'user_id', 'user_pseudo_id', 'install_offset', 'play_days', 'current_level',
+                 'country', 'city', 'device_category', 'mobile_os', 'source', 'cpi', 'campaign_id']
+
+FLAT_COLUMNS = ['event_date', 'event_timestamp', 'event_name', 'user_id', 'country', 'os',
+                'level_id', 'status', 'weapon_used', 'gold_earned', 'price', 'product_id']
+
+
+# HELPER FUNCTIONS
+
+def _segment_starts(counts):
+    """Vị trí bắt đầu của từng segment khi các segment nằm liền nhau."""
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    return starts
+
+
+def _rank_in_segment(counts):
+    """Chỉ số 0..n-1 bên trong mỗi segment, ví dụ [2, 3] -> [0, 1, 0, 1, 2]."""
+    total = int(counts.sum())
+    return np.arange(total, dtype=np.int64) - np.repeat(_segment_starts(counts), counts)
+
+
+def _categorical(codes, categories):
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def _date_lookup(start_date, days):
+    """event_date (YYYYMMDD) cho từng day offset, tra bảng thay vì strftime."""
+    return list(pd.date_range(start_date, periods=days).strftime('%Y%m%d'))
+
+
+# USER PROFILES
+
+def _random_bytes(key, stream, n):
+    """16 byte ngẫu nhiên / user (2 x 64 bit)."""
+    words = np.stack([bits(key, stream + '_hi'), bits(key, stream + '_lo')], axis=1)
+    raw = words.astype('>u8').view(np.uint8).reshape(n, 16)
+    return raw
+
+
+def _uuid4(raw):
+    """Chuỗi uuid4 từ mảng byte (n, 16): set version=4 và variant=10xx."""
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hex_ids = raw.tobytes().hex()
+    return [f"{h[0:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
+            for h in (hex_ids[i:i + 32] for i in range(0, 32 * len(raw), 32))]
+
+
+def simulate_users(user_index, seed, start_date=START_DATE, days_range=DAYS_RANGE, install_offset=None):
+    """Sinh hồ sơ người dùng cho cả cohort bằng mảng NumPy.
+
+    user_index là chỉ số toàn cục của user; mọi thuộc tính chỉ phụ thuộc vào
+    (seed, user_index). IDs được tạo hàng loạt (uuid4 / md5-style hex), city
+    tra từ bảng CITIES theo country thay vì gọi Faker cho từng user.
+    install_offset (ngày cài đặt tính từ start_date) có thể truyền vào để sinh
+    user mới cho các ngày append.
+    """
+    user_index = np.asarray(user_index, dtype=np.int64)
+    n = len(user_index)
+    key = derive_key(seed, user_index)
+
+    user_id = _uuid4(_random_bytes(key, 'user_id', n))
+    pseudo_hex = _random_bytes(key, 'user_pseudo_id', n).tobytes().hex()
+    user_pseudo_id = [pseudo_hex[i:i + 32] for i in range(0, 32 * n, 32)]
+
+    if install_offset is None:
+        install_offset = randint(key, 'install_offset', (0, days_range - 5))
+    install_offset = np.broadcast_to(np.asarray(install_offset, dtype=np.int16), (n,)).copy()
+
+    country = choice_index(key, 'country', len(COUNTRIES))
+    city_per_country = len(CITY_LIST) // len(COUNTRIES)
+    city = country * city_per_country + choice_index(key, 'city', city_per_country)
+    device_cat = choice_index(key, 'device_category', len(DEVICE_CATEGORIES))
+    os_sys = (uniform(key, 'mobile_os') >= ANDROID_SHARE).astype(np.int8)  # 0 = Android, 1 = iOS
+
+    source = choice_index(key, 'source', len(SOURCES))
+    cpi_low = np.array([CPI_RANGES[s][0] for s in SOURCES])[source]
+    cpi_high = np.array([CPI_RANGES[s][1] for s in SOURCES])[source]
+    cpi = np.round(cpi_low + uniform(key, 'cpi') * (cpi_high - cpi_low), 2)
+    campaign = choice_index(key, 'campaign_id', len(CAMPAIGN_IDS))
+    campaign = np.where(source == SOURCES.index('Organic'), -1, campaign)
+
+    play_days = np.asarray(PLAY_DAYS)[
+        choice_index(key, 'play_days', len(PLAY_DAYS), PLAY_DAYS_WEIGHTS)].astype(np.int16)
+
+    return pd.DataFrame({
+        'user_index': user_index,
+        'user_id': user_id,
+        'user_pseudo_id': user_pseudo_id,
+        'install_date': pd.Timestamp(start_date) + pd.to_timedelta(install_offset, unit='D'),
+        'install_offset': install_offset,
+        'country': _categorical(country, COUNTRIES),
+        'city': _categorical(city, CITY_LIST),
+        'device_category': _categorical(device_cat, DEVICE_CATEGORIES),
+        'mobile_os': _categorical(os_sys, OS_LIST),
+        'source': _categorical(source, SOURCES),
+        'cpi': cpi,
+        'campaign_id': _categorical(campaign, CAMPAIGN_IDS),
+        'play_days': play_days,
+    })
+
+
+# EVENTS
+
+def simulate_events(users, seed, start_date=START_DATE, days_range=DAYS_RANGE, day_from=0, day_to=None):
+    """Sinh event của cohort trong các ngày [day_from, day_to) (tính từ start_date).
+
+    Trả về (events, current_level): events là DataFrame dạng cột (một dòng /
+    event), current_level là level của từng user sau cửa sổ ngày này. Level
+    bắt đầu lấy từ cột users['current_level'] nếu có (resume từ checkpoint).
+
+    Thứ tự event giống vòng lặp gốc: theo user -> ngày -> session -> level,
+    trong mỗi level là level_start, level_complete/level_fail, rồi
+    ad_reward_claim và iap_purchase (nếu có). Timestamp tính theo UTC.
+    Mỗi lần rút ngẫu nhiên được key theo (user_index, ngày, session, lượt chơi),
+    nên chạy một lần 30 ngày hay chạy nối từng ngày đều ra cùng event.
+    """
+    if day_to is None:
+        day_to = days_range + 1  # Vòng lặp gốc giữ cả ngày START_DATE + DAYS_RANGE
+    user_index = users['user_index'].to_numpy(dtype=np.int64)
+    install_offset = users['install_offset'].to_numpy(dtype=np.int64)
+    play_days = users['play_days'].to_numpy(dtype=np.int64)
+    if 'current_level' in users:
+        start_level = users['current_level'].to_numpy(dtype=np.int32)
+    else:
+        start_level = np.ones(len(users), dtype=np.int32)
+
+    # 1. User -> ngày chơi trong cửa sổ [day_from, day_to)
+    first_day = np.maximum(install_offset, day_from)
+    days_per_user = np.clip(np.minimum(install_offset + play_days, day_to) - first_day, 0, None)
+    day_user = np.repeat(np.arange(len(users)), days_per_user)
+    day_abs = first_day[day_user] + _rank_in_segment(days_per_user)
+    day_key = derive_key(seed, user_index[day_user], day_abs)
+
+    # 2. Ngày -> sessions (1-3 sessions mỗi ngày)
+    sessions_per_day = randint(day_key, 'sessions', SESSIONS_PER_DAY)
+    sess_day = np.repeat(day_abs, sessions_per_day)
+    sess_user = np.repeat(day_user, sessions_per_day)
+    sess_key = derive_key(seed, np.repeat(day_key, sessions_per_day), _rank_in_segment(sessions_per_day))
+    n_sess = len(sess_user)
+    sess_sec = randint(sess_key, 'session_time', (0, 86399))
+    ga_session_id = randint(sess_key, 'ga_session_id', (1000, 9999))
+    epoch = int(pd.Timestamp(start_date).tz_localize('UTC').timestamp())
+    sess_ts = (epoch + sess_day * 86400 + sess_sec) * 1_000_000
+
+    # 3. Session -> level attempts (1-5 levels mỗi session)
+    levels_per_sess = randint(sess_key, 'levels', LEVELS_PER_SESSION)
+    att_sess = np.repeat(np.arange(n_sess), levels_per_sess)
+    att_user = sess_user[att_sess]
+    att_key = derive_key(seed, sess_key[att_sess], _rank_in_segment(levels_per_sess))
+
+    play_sec = randint(att_key, 'play_time', LEVEL_MINUTES) * 60
+    result_sec = randint(att_key, 'result_time', RESULT_MINUTES) * 60
+    weapon = choice_index(att_key, 'weapon', len(WEAPONS))
+    win_draw = uniform(att_key, 'win')
+    time_spent = randint(att_key, 'time_spent', TIME_SPENT_SEC)
+    gold = randint(att_key, 'gold_earned', GOLD_EARNED)
+    death = choice_index(att_key, 'death_reason', len(DEATH_REASONS))
+    has_ad = uniform(att_key, 'ad') < AD_RATE
+    has_iap = uniform(att_key, 'iap') < IAP_RATE
+    pack = choice_index(att_key, 'pack', len(PACK_PRICES))
+    ad_revenue = np.round(AD_REVENUE[0] + uniform(att_key, 'ad_revenue') * (AD_REVENUE[1] - AD_REVENUE[0]), 4)
+    n_att = len(att_sess)
+
+    # 4. Level chain: level hiện tại phụ thuộc kết quả lần chơi trước,
+    # nên lặp theo thứ hạng attempt của user (tối đa vài trăm vòng), mỗi vòng là 1 phép vector
+    att_level, is_win, current_level = _play_levels(att_user, start_level, win_draw)
+
+    # 5. Timestamp trong session: cộng dồn (play + result) theo từng session
+    step = play_sec + result_sec
+    cum_step = np.cumsum(step)
+    sess_first_att = _segment_starts(levels_per_sess)
+    before = cum_step - step - np.repeat(cum_step[sess_first_att] - step[sess_first_att], levels_per_sess)
+    start_ts = sess_ts[att_sess] + (before + play_sec) * 1_000_000
+    end_ts = start_ts + result_sec * 1_000_000
+
+    # 6. Vị trí của từng event trong output (scatter thay vì append)
+    att_size = 2 + has_ad + has_iap
+    att_before = np.cumsum(att_size) - att_size
+    att_pos = att_before + att_sess + 1
+    sess_pos = att_before[sess_first_att] + np.arange(n_sess)
+    n_events = int(att_size.sum()) + n_sess
+
+    ev_user = np.empty(n_events, dtype=np.int32)
+    ev_sess = np.empty(n_events, dtype=np.int64)
+    ev_ts = np.empty(n_events, dtype=np.int64)
+    ev_name = np.empty(n_events, dtype=np.int8)
+    ev_att = np.full(n_events, -1, dtype=np.int64)
+
+    ev_user[sess_pos] = sess_user
+    ev_sess[sess_pos] = np.arange(n_sess)
+    ev_ts[sess_pos] = sess_ts
+    ev_name[sess_pos] = SESSION_START
+
+    ad_pos = att_pos[has_ad] + 2
+    iap_pos = att_pos[has_iap] + 2 + has_ad[has_iap]
+    att_idx = np.arange(n_att)
+    for pos, sel, ts, name in (
+        (att_pos, att_idx, start_ts, LEVEL_START),
+        (att_pos + 1, att_idx, end_ts, np.where(is_win, LEVEL_COMPLETE, LEVEL_FAIL)),
+        (ad_pos, att_idx[has_ad], end_ts[has_ad] + 30_000_000, AD_REWARD_CLAIM),
+        (iap_pos, att_idx[has_iap], end_ts[has_iap] + 60_000_000, IAP_PURCHASE),
+    ):
+        ev_user[pos] = att_user[sel]
+        ev_sess[pos] = att_sess[sel]
+        ev_ts[pos] = ts
+        ev_name[pos] = name
+        ev_att[pos] = sel
+
+    # 7. Params theo loại event
+    is_attempt = ev_att >= 0
+    a = np.where(is_attempt, ev_att, 0)
+    is_start = ev_name == LEVEL_START
+    is_complete = ev_name == LEVEL_COMPLETE
+    is_fail = ev_name == LEVEL_FAIL
+    is_level = is_start | is_complete | is_fail
+    is_ad = ev_name == AD_REWARD_CLAIM
+    is_iap = ev_name == IAP_PURCHASE
+    level = att_level[a]
+
+    dates = _date_lookup(start_date, day_to)
+    price = np.asarray(PACK_PRICES)[pack[a]]
+
+    events = pd.DataFrame({
+        'user_row': ev_user,
+        'event_date': _categorical(sess_day[ev_sess], dates),
+        'event_timestamp': ev_ts,
+        'event_name': _categorical(ev_name, EVENTS),
+        'ga_session_id': pd.arrays.IntegerArray(ga_session_id[ev_sess].astype(np.int32), ev_name != SESSION_START),
+        'level_id': pd.arrays.IntegerArray(level.astype(np.int16), ~is_level),
+        'difficulty': _categorical(np.where(is_start, (level % HARD_LEVEL_EVERY == 0).astype(np.int8), -1),
+                                   DIFFICULTIES),
+        'weapon_used': _categorical(np.where(is_start, weapon[a], -1), WEAPONS),
+        'time_spent_sec': pd.arrays.IntegerArray(time_spent[a].astype(np.int16), ~is_complete),
+        'gold_earned': pd.arrays.IntegerArray(gold[a].astype(np.int16), ~is_complete),
+        'death_reason': _categorical(np.where(is_fail, death[a], -1), DEATH_REASONS),
+        'status': _categorical(np.where(is_complete, 0, np.where(is_fail, 1, -1)), STATUSES),
+        'ad_type': _categorical(np.where(is_ad, 0, -1), ['Rewarded Video']),
+        'placement': _categorical(np.where(is_ad, 0, -1), ['End Game']),
+        'gold_reward': pd.arrays.IntegerArray(np.full(n_events, AD_GOLD_REWARD, dtype=np.int16), ~is_ad),
+        'product_id': _categorical(np.where(is_iap, pack[a], -1), PRODUCT_IDS),
+        'price': np.where(is_iap, price, np.nan),
+        'currency': _categorical(np.where(is_iap, 0, -1), ['USD']),
+        'quantity': pd.arrays.IntegerArray(np.ones(n_events, dtype=np.int8), ~is_iap),
+        'ad_revenue': np.where(is_ad, ad_revenue[a], np.nan),
+        # Key ngẫu nhiên của event (key lượt chơi / session), dùng sinh transaction_id, impression_id
+        'event_key': np.where(is_attempt, att_key[a], sess_key[ev_sess]),
+    })
+    return events, current_level
+
+
+def _play_levels(att_user, start_level, win_draw):
+    """Level và kết quả thắng/thua của từng attempt, cùng level cuối của mỗi user.
+
+    win_rate = max(0.2, 0.9 - level * 0.03). Các attempt cùng thứ hạng thuộc
+    các user khác nhau nên cả vòng cập nhật được bằng một phép vector.
+    """
+    n_att = len(att_user)
+    att_level = np.empty(n_att, dtype=np.int32)
+    is_win = np.empty(n_att, dtype=bool)
+    current_level = np.array(start_level, dtype=np.int32)
+    if n_att == 0:
+        return att_level, is_win, current_level
+
+    per_user = np.bincount(att_user, minlength=len(current_level))
+    rank = _rank_in_segment(per_user)
+    order = np.argsort(rank, kind='stable')
+    bounds = np.searchsorted(rank[order], np.arange(rank.max() + 2))
+
+    for r in range(len(bounds) - 1):
+        idx = order[bounds[r]:bounds[r + 1]]
+        u = att_user[idx]
+        lv = current_level[u]
+        win = win_draw[idx] < np.maximum(WIN_RATE_FLOOR, WIN_RATE_BASE - lv * WIN_RATE_STEP)
+        att_level[idx] = lv
+        is_win[idx] = win
+        current_level[u] = lv + win
+    return att_level, is_win, current_level
+
+
+def simulate(user_index, seed, start_date=START_DATE, days_range=DAYS_RANGE):
+    """Mô phỏng một cohort gồm các user_index cho trước: trả về (users, events).
+
+    users có thêm cột current_level = level của user ở cuối khoảng dữ liệu.
+    """
+    users = simulate_users(user_index, seed, start_date, days_range)
+    events, current_level = simulate_events(users, seed, start_date, days_range)
+    users['current_level'] = current_level.astype(np.int16)
+    return users, events
+
+
+def simulate_cohorts(start, stop, seed, cohort_size=COHORT_SIZE, start_date=START_DATE, days_range=DAYS_RANGE):
+    """Mô phỏng user [start, stop) theo từng cohort cố định (bộ nhớ ~ một cohort).
+
+    Vì mỗi user có seed riêng, kết quả không phụ thuộc cohort_size: ghép các
+    cohort lại luôn ra cùng một output.
+    """
+    for first in range(start, stop, cohort_size):
+        yield simulate(np.arange(first, min(first + cohort_size, stop)), seed, start_date, days_range)
+
+
+def export_users(start, stop, seed, writers, keep_state=False):
+    """Mô phỏng user [start, stop) theo cohort và ghi thẳng ra các writer.
+
+    writers: {table: writer} của writers.TABLES (NDJSON/CSV) hoặc
+    parquet_writer.PARQUET_TABLES; chỉ các bảng có trong dict được ghi.
+
+    keep_state=True: trả về trạng thái người chơi (STATE_COLUMNS) để lưu checkpoint.
+    """
+    states = []
+    cohorts = simulate_cohorts(start, stop, seed)
+    while True:
+        with span('generate.simulate'):
+            cohort = next(cohorts, None)
+        if cohort is None:
+            break
+        users, events = cohort
+        write_users(users, writers)
+        write_events(users, events, writers)
+        if keep_state:
+            states.append(users[STATE_COLUMNS])
+    return pd.concat(states, ignore_index=True) if states else None
+
+
+def write_users(users, writers):
+    with span('generate.ua_export'):
+        writers['user_acquisition'].write_frame(acquisition_frame(users))
+
+
+def write_events(users, events, writers):
+    if 'user_events_nested' in writers:
+        with span('generate.json_export'):
+            writers['user_events_nested'].write_arrays(iter_ndjson(users, events))
+    if 'user_events_flat' in writers:
+        with span('generate.csv_export'):
+            writers['user_events_flat'].write_frame(flatten_events(users, events))
+    if 'events' in writers:
+        with span('generate.parquet_export'):
+            writers['events'].write_frame(events_table(users, events), {'event_params': event_params_array(events)})
+    if 'iap_transactions' in writers:
+        with span('generate.parquet_export'):
+            writers['iap_transactions'].write_frame(iap_transactions(users, events))
+    if 'ad_impressions' in writers:
+        with span('generate.parquet_export' if 'events' in writers else 'generate.csv_export'):
+            writers['ad_impressions'].write_frame(ad_impressions(users, events))
+
+
+# EXPORT FORMATTING
+
+def flatten_events(users, events):
+    """Bảng phẳng cho CSV (Tableau), cùng cột với chế độ legacy."""
+    u = events['user_row'].to_numpy()
+    flat = events[['event_date', 'event_timestamp', 'event_name', 'level_id', 'status',
+                   'weapon_used', 'gold_earned', 'price', 'product_id']].copy(deep=False)
+    # Cột theo user giữ dạng Categorical (code = user_row): writer giải mã trong Arrow, không tạo object
+    flat['user_id'] = _categorical(u, users['user_id'].to_numpy(dtype=object))
+    for column, source in (('country', 'country'), ('os', 'mobile_os')):
+        flat[column] = _categorical(users[source].cat.codes.to_numpy()[u], users[source].cat.categories)
+    return flat[FLAT_COLUMNS]
+
+
+def acquisition_frame(users):
+    """Bảng UA: thêm tier (theo country) và os."""
+    frame = users.copy(deep=False)
+    frame['tier'] = users['country'].map(COUNTRY_TIERS).astype(pd.CategoricalDtype(TIERS))
+    frame['os'] = users['mobile_os']
+    return frame
+
+
+def _event_rows(users, events, event_name):
+    """Các event thuộc một loại, kèm user_id (dùng cho bảng giao dịch / quảng cáo)."""
+    rows = events[events['event_name'].cat.codes.to_numpy() == event_name]
+    frame = rows.copy(deep=False)
+    frame['user_id'] = users['user_id'].to_numpy(dtype=object)[rows['user_row'].to_numpy()]
+    return frame
+
+
+def iap_transactions(users, events):
+    frame = _event_rows(users, events, IAP_PURCHASE)
+    key = frame['event_key'].to_numpy(dtype=np.uint64)
+    frame['transaction_id'] = _uuid4(_random_bytes(key, 'transaction_id', len(frame)))
+    return frame
+
+
+def ad_impressions(users, events):
+    frame = _event_rows(users, events, AD_REWARD_CLAIM)
+    key = frame['event_key'].to_numpy(dtype=np.uint64)
+    frame['impression_id'] = _uuid4(_random_bytes(key, 'impression_id', len(frame)))
+    frame['revenue'] = frame['ad_revenue']
+    frame['timestamp'] = (frame['event_timestamp'].to_numpy() // 1_000_000).astype('datetime64[s]')
+    return frame
+
+
+# event_params theo loại event: (key, kiểu value); key trùng tên cột trong events
+EVENT_PARAMS = {
+    SESSION_START: [('ga_session_id', 'int_value')],
+    LEVEL_START: [('level_id', 'int_value'), ('difficulty', 'string_value'), ('weapon_used', 'string_value')],
+    LEVEL_COMPLETE: [('level_id', 'int_value'), ('time_spent_sec', 'int_value'), ('gold_earned', 'int_value'),
+                     ('status', 'string_value')],
+    LEVEL_FAIL: [('level_id', 'int_value'), ('death_reason', 'string_value'), ('status', 'string_value')],
+    AD_REWARD_CLAIM: [('ad_type', 'string_value'), ('placement', 'string_value'), ('gold_reward', 'int_value')],
+    IAP_PURCHASE: [('product_id', 'string_value'), ('price', 'float_value'), ('currency', 'string_value'),
+                   ('quantity', 'int_value')],
+}
+PARAM_KEYS = list(dict.fromkeys(key for params in EVENT_PARAMS.values() for key, _ in params))
+
+
+def event_params_array(events):
+    """event_params dạng Arrow list<struct<key, value>>, dựng bằng scatter theo loại event."""
+    name = events['event_name'].cat.codes.to_numpy()
+    n_params = np.zeros(len(events), dtype=np.int32)
+    for code, params in EVENT_PARAMS.items():
+        n_params[name == code] = len(params)
+    offsets = np.zeros(len(events) + 1, dtype=np.int32)
+    np.cumsum(n_params, out=offsets[1:])
+    total = int(offsets[-1])
+
+    # string_value: code vào một bảng chuỗi chung (categories của các cột chuỗi), không tạo object
+    string_columns = list(dict.fromkeys(key for params in EVENT_PARAMS.values()
+                                        for key, kind in params if kind == 'string_value'))
+    pool_start = dict(zip(string_columns, np.cumsum([0] + [len(events[c].cat.categories)
+                                                           for c in string_columns])))
+    pool = [str(v) for c in string_columns for v in events[c].cat.categories]
+
+    key_codes = np.empty(total, dtype=np.int32)
+    values = {field.name: [np.zeros(total, dtype=np.int32 if field.type == pa.string() else
+                                    np.int64 if field.type == pa.int64() else np.float64),
+                           np.zeros(total, dtype=bool)]
+              for field in PARAM_VALUE_TYPE}
+    for code, params in EVENT_PARAMS.items():
+        idx = np.flatnonzero(name == code)
+        for j, (key, kind) in enumerate(params):
+            pos = offsets[idx] + j
+            column = events[key]
+            if kind == 'string_value':
+                data = column.cat.codes.to_numpy()[idx] + pool_start[key]
+            else:
+                data = column.to_numpy(dtype=values[kind][0].dtype, na_value=0)[idx]
+            key_codes[pos] = PARAM_KEYS.index(key)
+            values[kind][0][pos] = data
+            values[kind][1][pos] = True
+
+    children = []
+    for field, (data, valid) in zip(PARAM_VALUE_TYPE, values.values()):
+        if field.type == pa.string():
+            children.append(pa.DictionaryArray.from_arrays(pa.array(data, mask=~valid), pa.array(pool))
+                            .cast(pa.string()))
+        else:
+            children.append(pa.array(data, type=field.type, mask=~valid))
+    value = pa.StructArray.from_arrays(children, fields=list(PARAM_VALUE_TYPE))
+    key = pa.DictionaryArray.from_arrays(pa.array(key_codes), pa.array(PARAM_KEYS))
+    items = pa.StructArray.from_arrays([key, value], fields=list(EVENT_PARAM_TYPE))
+    return pa.ListArray.from_arrays(pa.array(offsets), items)
+
+
+def events_table(users, events):
+    """Bảng event cho Parquet: cột của bảng phẳng + geo/device, giữ dạng Categorical."""
+    u = events['user_row'].to_numpy()
+    frame = events[['event_date', 'event_timestamp', 'event_name', 'level_id', 'status',
+                    'weapon_used', 'gold_earned', 'price', 'product_id']].copy(deep=False)
+    for column in ('user_id', 'user_pseudo_id'):
+        frame[column] = _categorical(u, users[column].to_numpy(dtype=object))
+    for column, source in (('country', 'country'), ('city', 'city'),
+                           ('device_category', 'device_category'), ('os', 'mobile_os')):
+        frame[column] = _categorical(users[source].cat.codes.to_numpy()[u], users[source].cat.categories)
+    return frame
+
+
+def _param(key, kind, value):
+    return f'{{"key": "{key}", "value": {{"{kind}": {value}}}}}'
+
+
+def _lookup(column, table, idx):
+    """Tra chuỗi đã format sẵn theo category code của một cột Categorical (các dòng idx)."""
+    return pa.array(table, pa.string()).take(column.cat.codes.to_numpy()[idx])
+
+
+def _text(values):
+    """Số nguyên -> chuỗi bằng kernel Arrow (không qua int Python)."""
+    return pc.cast(pa.array(values), pa.string())
+
+
+def user_json_parts(users):
+    """Phần JSON cố định của từng user (id, geo, device), format một lần cho cả cohort."""
+    return pa.array([
+        f'"user_id": "{uid}", "user_pseudo_id": "{pid}", '
+        f'"geo": {{"country": {json.dumps(c)}, "city": {json.dumps(city)}}}, '
+        f'"device": {{"category": "{dev}", "mobile_os": "{os_}"}}'
+        for uid, pid, c, city, dev, os_ in zip(
+            users['user_id'], users['user_pseudo_id'], users['country'], users['city'],
+            users['device_category'], users['mobile_os'])
+    ], pa.string())
+
+
+def iter_ndjson(users, events, chunk_rows=NDJSON_CHUNK_ROWS):
+    """Generator các lô dòng NDJSON, format từng lát `chunk_rows` event để giới hạn bộ nhớ."""
+    user_part = user_json_parts(users)
+    for start in range(0, len(events), chunk_rows):
+        yield format_ndjson(users, events.iloc[start:start + chunk_rows], user_part)
+
+
+def format_ndjson(users, events, user_part=None):
+    """Các dòng NDJSON (GA4 nested schema, kèm '\\n'), cùng định dạng json.dump của chế độ legacy.
+
+    Trả về pa.StringArray theo thứ tự event. Phần user (id, geo, device) được
+    format một lần cho mỗi user; params dùng template theo loại event. Các chỗ
+    %s được ghép cả cột một lúc bằng binary_join_element_wise của Arrow, không
+    format chuỗi Python cho từng event.
+    """
+    if user_part is None:
+        user_part = user_json_parts(users)
+
+    name = events['event_name'].cat.codes.to_numpy()
+    level = events['level_id'].to_numpy(dtype=np.int64, na_value=0)
+    difficulty = [_param('difficulty', 'string_value', json.dumps(d)) for d in DIFFICULTIES]
+    weapon = [_param('weapon_used', 'string_value', json.dumps(w)) for w in WEAPONS]
+    death = [_param('death_reason', 'string_value', json.dumps(r)) for r in DEATH_REASONS]
+    product = [f"{_param('product_id', 'string_value', json.dumps(p))}, {_param('price', 'float_value', price)}"
+               for p, price in zip(PRODUCT_IDS, PACK_PRICES)]
+    session_id = events['ga_session_id'].to_numpy(dtype=np.int64, na_value=0)
+    time_spent = events['time_spent_sec'].to_numpy(dtype=np.int64, na_value=0)
+    gold = events['gold_earned'].to_numpy(dtype=np.int64, na_value=0)
+
+    # Template event_params cho từng loại event, %s là giá trị lấy từ cột
+    level_param = _param('level_id', 'int_value', '%s')
+    templates = {
+        SESSION_START: _param('ga_session_id', 'int_value', '%s'),
+        LEVEL_START: ', '.join([level_param, '%s', '%s']),
+        LEVEL_COMPLETE: ', '.join([level_param, _param('time_spent_sec', 'int_value', '%s'),
+                                   _param('gold_earned', 'int_value', '%s'),
+                                   _param('status', 'string_value', '"Win"')]),
+        LEVEL_FAIL: ', '.join([level_param, '%s', _param('status', 'string_value', '"Fail"')]),
+        AD_REWARD_CLAIM: ', '.join([_param('ad_type', 'string_value', '"Rewarded Video"'),
+                                    _param('placement', 'string_value', '"End Game"'),
+                                    _param('gold_reward', 'int_value', AD_GOLD_REWARD)]),
+        IAP_PURCHASE: ', '.join(['%s', _param('currency', 'string_value', '"USD"'),
+                                 _param('quantity', 'int_value', 1)]),
+    }
+    columns = {
+        SESSION_START: lambda idx: (_text(session_id[idx]),),
+        LEVEL_START: lambda idx: (_text(level[idx]), _lookup(events['difficulty'], difficulty, idx),
+                                  _lookup(events['weapon_used'], weapon, idx)),
+        LEVEL_COMPLETE: lambda idx: (_text(level[idx]), _text(time_spent[idx]), _text(gold[idx])),
+        LEVEL_FAIL: lambda idx: (_text(level[idx]), _lookup(events['death_reason'], death, idx)),
+        AD_REWARD_CLAIM: lambda idx: (),
+        IAP_PURCHASE: lambda idx: (_lookup(events['product_id'], product, idx),),
+    }
+
+    # params theo từng loại event, rồi đưa về thứ tự event (chuỗi ngắn, trước khi ghép cả dòng)
+    params, order = [], []
+    for code, fmt in templates.items():
+        idx = np.flatnonzero(name == code)
+        if not len(idx):
+            continue
+        pieces = fmt.split('%s')
+        if len(pieces) == 1:
+            params.append(pa.array(np.full(len(idx), fmt, dtype=object), pa.string()))
+        else:
+            # Ghép xen kẽ đoạn literal của template với các cột giá trị
+            args = [piece for pair in zip(pieces, columns[code](idx)) for piece in pair] + [pieces[-1]]
+            params.append(pc.binary_join_element_wise(*args, ''))
+        order.append(idx)
+    if not params:
+        return pa.array([], pa.string())
+    position = np.empty(len(events), dtype=np.int64)
+    position[np.concatenate(order)] = np.arange(len(events))
+    params = pa.concat_arrays(params).take(position)
+
+    # Đoạn đầu dòng theo ngày và đoạn event_name theo loại: bảng tra nhỏ, ít phần phải ghép hơn
+    dates = events['event_date']
+    date_head = [f'{{"event_date": "{d}", "event_timestamp": ' for d in dates.cat.categories]
+    name_head = [f', "event_name": "{e}", "event_params": [' for e in EVENTS]
+    everything = np.arange(len(events))
+    return pc.binary_join_element_wise(
+        _lookup(dates, date_head, everything), _text(events['event_timestamp'].to_numpy()),
+        ', ', user_part.take(events['user_row'].to_numpy()), _lookup(events['event_name'], name_head, everything),
+        params, ']}\n', '')
@@ -0,0 +1,149 @@
+"""
+Chế độ streaming: phát event liên tục theo thời gian thực qua asyncio.
+
+Event được sinh bằng engine vectorized (simulation.simulate_cohorts), sắp theo
+event_timestamp rồi phát lại với tốc độ cố định (event/giây), mỗi nhịp
+BATCH_INTERVAL giây một lô. event_timestamp được gán lại bằng giờ lúc phát để
+phía consumer tính cửa sổ theo thời gian thực. Hết dữ liệu thì mô phỏng lượt
+user tiếp theo (seed + 1...), nên luồng không dừng cho tới khi Ctrl+C.
+
+Đích ghi (mỗi dòng một event NDJSON, cột theo STREAM_COLUMNS):
+  * log append-only data/stream/events.ndjson (analytics/realtime.py đọc tiếp từ offset),
+  * socket TCP local: mọi client kết nối tới host:port nhận cùng luồng dòng.
+"""
+import os
+import time
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from data_generator.config import COUNTRY_TIERS
+from data_generator.simulation import simulate_cohorts
+
+STREAM_DIR = "stream"
+STREAM_LOG = "events.ndjson"
+STREAM_RATE = 2_000  # event / giây
+BATCH_INTERVAL = 0.1  # giây giữa hai lô
+STREAM_COLUMNS = ['event_timestamp', 'event_name', 'user_id', 'tier', 'country', 'os', 'level_id', 'revenue']
+
+
+def stream_frames(num_users, seed):
+    """Vô hạn các bảng event (STREAM_COLUMNS) theo thứ tự thời gian, mỗi bảng một lượt mô phỏng num_users user."""
+    while True:
+        parts = []
+        for users, events in simulate_cohorts(0, num_users, seed):
+            u = events['user_row'].to_numpy()
+            country = users['country'].to_numpy(dtype=object)[u]
+            parts.append(pd.DataFrame({
+                'event_timestamp': events['event_timestamp'].to_numpy(),
+                'event_name': events['event_name'].astype(str).to_numpy(),
+                'user_id': users['user_id'].to_numpy(dtype=object)[u],
+                'tier': pd.Series(country).map(COUNTRY_TIERS).to_numpy(),
+                'country': country,
+                'os': users['mobile_os'].to_numpy(dtype=object)[u],
+                'level_id': events['level_id'],
+                # Doanh thu của event: giá gói IAP hoặc doanh thu lượt xem quảng cáo
+                'revenue': events['price'].fillna(events['ad_revenue']).fillna(0.0).to_numpy(),
+            }))
+        frame = pd.concat(parts, ignore_index=True)
+        yield frame.sort_values('event_timestamp', kind='stable', ignore_index=True)
+        seed += 1
+
+
+class LogSink:
+    """Ghi nối vào file NDJSON (append-only)."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+
+    async def send(self, payload):
+        self.file.write(payload)
+        self.file.flush()
+
+    async def close(self):
+        self.file.close()
+
+
+class SocketSink:
+    """Server TCP local: gửi mỗi lô tới mọi client đang kết nối, client rớt thì bỏ."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.clients = set()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._accept, self.host, self.port)
+        return self
+
+    async def _accept(self, reader, writer):
+        self.clients.add(writer)
+
+    async def send(self, payload):
+        data = payload.encode('utf-8')
+        for writer in list(self.clients):
+            try:
+                writer.write(data)
+                await writer.drain()
+            except (ConnectionError, OSError):
+                self.clients.discard(writer)
+                writer.close()
+
+    async def close(self):
+        for writer in self.clients:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def replay(frames, sinks, rate=STREAM_RATE, max_events=None, interval=BATCH_INTERVAL):
+    """Phát các bảng event tới sinks với tốc độ rate event/giây; trả về số event đã phát."""
+    loop = asyncio.get_running_loop()
+    per_batch = max(1, int(rate * interval))
+    sent = 0
+    next_tick = loop.time()
+    for frame in frames:
+        for start in range(0, len(frame), per_batch):
+            if max_events is not None and sent >= max_events:
+                return sent
+            batch = frame.iloc[start:start + per_batch].copy()
+            if max_events is not None:
+                batch = batch.iloc[:max_events - sent]
+            # Giờ phát, rải đều trong nhịp
+            now = time.time()
+            batch['event_timestamp'] = ((now + np.arange(len(batch)) * interval / per_batch) * 1_000_000).astype(np.int64)
+            payload = batch.to_json(orient='records', lines=True)
+            if not payload.endswith('\n'):
+                payload += '\n'
+            for sink in sinks:
+                await sink.send(payload)
+            sent += len(batch)
+            next_tick += interval
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+    return sent
+
+
+async def run_stream_async(data_dir, num_users, seed, rate=STREAM_RATE, port=None, host='127.0.0.1',
+                           max_events=None):
+    """Phát vào log data_dir/stream/events.ndjson, hoặc socket host:port nếu có port."""
+    sink = await SocketSink(host, port).start() if port else LogSink(os.path.join(data_dir, STREAM_DIR, STREAM_LOG))
+    try:
+        return await replay(stream_frames(num_users, seed), [sink], rate, max_events)
+    finally:
+        await sink.close()
+
+
+def run_stream(data_dir, num_users, seed, rate=STREAM_RATE, port=None, max_events=None):
+    target = f"tcp://127.0.0.1:{port}" if port else os.path.join(data_dir, STREAM_DIR, STREAM_LOG)
+    print(f"1. Đang phát event liên tục ({rate:,} events/s) tới {target} (Ctrl+C để dừng)...")
+    started = time.perf_counter()
+    try:
+        sent = asyncio.run(run_stream_async(data_dir, num_users, seed, rate, port, max_events=max_events))
+    except KeyboardInterrupt:
+        sent = None
+    elapsed = time.perf_counter() - started
+    if sent is not None:
+        print(f"-> {sent:,} events trong {elapsed:.2f}s ({sent / max(elapsed, 1e-9):,.0f} events/s)")
@@ -0,0 +1,174 @@
+"""
+Streaming writers cho NDJSON và CSV.
+
+Event đi qua generator pipeline theo từng chunk và được ghi ngay ra file
+(có buffer, tùy chọn nén gzip/zstd), nên bộ nhớ đỉnh chỉ phụ thuộc kích
+thước chunk chứ không phụ thuộc tổng số event.
+"""
+from contextlib import ExitStack
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+BUFFER_SIZE = 1 << 20  # 1 MB
+NDJSON_CHUNK_LINES = 50_000
+
+# Thứ tự & kiểu cột cố định cho các file CSV
+FLAT_EVENT_SCHEMA = pa.schema([
+    ('event_date', pa.string()),
+    ('event_timestamp', pa.int64()),
+    ('event_name', pa.string()),
+    ('user_id', pa.string()),
+    ('country', pa.string()),
+    ('os', pa.string()),
+    ('level_id', pa.int16()),
+    ('status', pa.string()),
+    ('weapon_used', pa.string()),
+    ('gold_earned', pa.int16()),
+    ('price', pa.float64()),
+    ('product_id', pa.string()),
+])
+USER_ACQUISITION_SCHEMA = pa.schema([
+    ('user_id', pa.string()),
+    ('install_date', pa.date32()),
+    ('source', pa.string()),
+    ('campaign_id', pa.string()),
+    ('cpi', pa.float64()),
+])
+
+AD_IMPRESSION_SCHEMA = pa.schema([
+    ('user_id', pa.string()),
+    ('timestamp', pa.timestamp('s')),
+    ('placement', pa.string()),
+    ('revenue', pa.float64()),
+])
+
+# Các bảng output: tên -> (file, schema CSV; None = NDJSON)
+TABLES = {
+    'user_acquisition': ('user_acquisition.csv', USER_ACQUISITION_SCHEMA),
+    'user_events_nested': ('user_events_nested.json', None),
+    'user_events_flat': ('user_events_flat.csv', FLAT_EVENT_SCHEMA),
+    'ad_impressions': ('ad_impressions.csv', AD_IMPRESSION_SCHEMA),
+}
+# Engine legacy không mô phỏng doanh thu quảng cáo: không ghi ad_impressions.csv
+LEGACY_TABLES = ['user_acquisition', 'user_events_nested', 'user_events_flat']
+
+
+def output_path(path, compression=None):
+    """Thêm đuôi .gz / .zst theo kiểu nén."""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {compression!r} (expected one of {list(COMPRESSIONS)})")
+    return path + COMPRESSIONS[compression]
+
+
+def csv_header(schema):
+    return (','.join(schema.names) + '\n').encode('utf-8')
+
+
+def open_sink(path, compression=None):
+    """Mở output stream nhị phân có buffer, nén on-the-fly nếu cần."""
+    sink = pa.OSFile(output_path(path, compression), 'wb')
+    if compression:
+        sink = pa.CompressedOutputStream(sink, compression)
+    return pa.BufferedOutputStream(sink, BUFFER_SIZE)
+
+
+class NdjsonWriter:
+    """Ghi các dòng JSON đã format sẵn, gom theo chunk trước khi encode."""
+
+    def __init__(self, path, compression=None, chunk_lines=NDJSON_CHUNK_LINES):
+        self.path = output_path(path, compression)
+        self.chunk_lines = chunk_lines
+        self.rows = 0
+        self._sink = open_sink(path, compression)
+
+    def write_lines(self, lines):
+        """lines: iterable các chuỗi JSON (không kèm '\\n'), ví dụ generator."""
+        buffer = []
+        for line in lines:
+            buffer.append(line)
+            if len(buffer) >= self.chunk_lines:
+                self._flush(buffer)
+                buffer = []
+        if buffer:
+            self._flush(buffer)
+
+    def write_arrays(self, arrays):
+        """arrays: iterable các pa.StringArray dòng JSON đã kèm '\\n': ghi thẳng buffer dữ liệu."""
+        for lines in arrays:
+            if not len(lines):
+                continue
+            offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32)[lines.offset:lines.offset + len(lines) + 1]
+            self._sink.write(lines.buffers()[2][offsets[0]:offsets[-1]])
+            self.rows += len(lines)
+
+    def _flush(self, buffer):
+        self._sink.write(('\n'.join(buffer) + '\n').encode('utf-8'))
+        self.rows += len(buffer)
+
+    def close(self):
+        self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvWriter:
+    """Ghi DataFrame theo từng chunk với schema (thứ tự + kiểu cột) cố định.
+
+    Cột thiếu trong chunk được ghi rỗng, cột thừa bị bỏ qua; header chỉ ghi một
+    lần (header=False cho các part file của chế độ shard).
+    """
+
+    def __init__(self, path, schema, compression=None, header=True):
+        self.path = output_path(path, compression)
+        self.schema = schema
+        self.rows = 0
+        self._sink = open_sink(path, compression)
+        if header:
+            self._sink.write(csv_header(schema))
+        self._writer = pa_csv.CSVWriter(
+            self._sink, schema,
+            write_options=pa_csv.WriteOptions(include_header=False, quoting_style='none'))
+
+    def write_frame(self, df):
+        columns = []
+        for field in self.schema:
+            if field.name in df.columns:
+                col = pa.array(df[field.name], from_pandas=True)
+                columns.append(col.cast(field.type))
+            else:
+                columns.append(pa.nulls(len(df), field.type))
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        self.rows += len(df)
+
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writers(paths, compression=None, header=True):
+    """Mở writer cho từng bảng trong TABLES; paths: {table: path chưa có đuôi nén}.
+
+    Trả về (ExitStack, {table: writer}); dùng ExitStack trong `with` để đóng tất cả.
+    """
+    stack = ExitStack()
+    writers = {}
+    for table, path in paths.items():
+        schema = TABLES[table][1]
+        if schema is None:
+            writers[table] = stack.enter_context(NdjsonWriter(path, compression))
+        else:
+            writers[table] = stack.enter_context(CsvWriter(path, schema, compression, header))
+    return stack, writers
@@ -3,16 +3,13 @@
 */
 
 WITH user_revenue AS (
-    -- 1. Tính tổng doanh thu (LTV) của từng user trọn đời
+    -- 1. Tổng doanh thu IAP (LTV) trọn đời của từng user: đọc từ bảng feature theo user
+    --    (08_user_features.sql gộp tăng dần), không cộng lại toàn bộ lịch sử event
     SELECT
         user_id,
-        SUM(revenue) as total_ltv
+        iap_revenue as total_ltv
     FROM
-        `zombie-protocol-analytics.analytics_zombie_protocol.master_events`
-    WHERE
-        event_name = 'iap_purchase'
-    GROUP BY
-        1
+        `zombie-protocol-analytics.analytics_zombie_protocol.user_features`
 ),
 
 marketing_costs AS (
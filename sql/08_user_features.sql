@@ -0,0 +1,51 @@
+/* Query 08: User Features (Incremental Per-User Table)
+   Logic: MERGE only the event_date partitions newer than the latest folded day into user_features.
+   Schedule before the marts that read it (07_UA_ROAS).
+*/
+
+CREATE TABLE IF NOT EXISTS `zombie-protocol-analytics.analytics_zombie_protocol.user_features` (
+    user_id STRING,
+    iap_revenue FLOAT64,
+    purchases INT64,
+    max_level INT64,
+    first_active DATE,
+    last_active DATE,
+    active_days INT64
+);
+
+MERGE INTO `zombie-protocol-analytics.analytics_zombie_protocol.user_features` AS f
+USING (
+    -- 1. Tổng hợp theo user các ngày chưa gộp
+    SELECT
+        user_id,
+        SUM(CASE WHEN event_name = 'iap_purchase' THEN COALESCE(revenue, 0) ELSE 0 END) as iap_revenue,
+        COUNTIF(event_name = 'iap_purchase') as purchases,
+        COALESCE(MAX(level_id), 0) as max_level,
+        MIN(event_date) as first_active,
+        MAX(event_date) as last_active,
+        COUNT(DISTINCT event_date) as active_days
+    FROM
+        `zombie-protocol-analytics.analytics_zombie_protocol.master_events`
+    WHERE
+        event_date > (
+            SELECT COALESCE(MAX(last_active), DATE '1970-01-01')
+            FROM `zombie-protocol-analytics.analytics_zombie_protocol.user_features`
+        )
+    GROUP BY
+        1
+) AS n
+ON f.user_id = n.user_id
+
+-- 2. User đã có: cộng dồn (các ngày mới không trùng ngày đã gộp)
+WHEN MATCHED THEN UPDATE SET
+    iap_revenue = f.iap_revenue + n.iap_revenue,
+    purchases = f.purchases + n.purchases,
+    max_level = GREATEST(f.max_level, n.max_level),
+    last_active = n.last_active,
+    active_days = f.active_days + n.active_days
+
+-- 3. User mới
+WHEN NOT MATCHED THEN INSERT
+    (user_id, iap_revenue, purchases, max_level, first_active, last_active, active_days)
+VALUES
+    (n.user_id, n.iap_revenue, n.purchases, n.max_level, n.first_active, n.last_active, n.active_days);
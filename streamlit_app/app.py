@@ -4,6 +4,24 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from analytics.sources import find_data_dir
+from analytics.backends import BACKEND_ENV, DATASET_ENV, open_backend
+from analytics.cube import cube_key, LAPSED_DAYS
+from analytics.sessions import INACTIVITY_GAP
+from analytics.economy import BIN_RATIO
+from analytics.snapshot import SnapshotStore, refresh_interval
+from analytics.metrics import DashboardMetrics, FUNNEL_LEVELS
+from analytics.cohorts import BREAKDOWNS
+from analytics.charts import (WEBGL_POINTS, MAX_CATEGORIES, downsample, top_categories,
+                              bin_rows, coarsen_cohorts)
+from analytics.realtime import RealtimeFeed, LogTail, stream_log_path
+from analytics.profiling import PROFILER, PROFILE_ENV, span, profiled
 
 # ==========================================
 # 1. PAGE CONFIG & LIGHT THEME
@@ -83,41 +101,33 @@ st.markdown("""
 # ==========================================
 # 2. DATA PROCESSING ENGINE
 # ==========================================
-@st.cache_data
+# Dashboard chỉ đọc rollup cube (analytics/cube.py), không quét event thô:
+# filter tier / khoảng ngày và GROUP BY được đẩy xuống backend (cube trong bộ
+# nhớ, file Parquet hoặc BigQuery, chọn bằng ZOMBIE_BACKEND), chỉ kết quả đã
+# tổng hợp về tới app. Chỉ số từng tab được memo theo bộ lọc
+# (analytics/metrics.py). Mọi session dùng chung một snapshot chỉ đọc
+# (analytics/snapshot.py): thread nền dựng lại engine khi dữ liệu nguồn đổi
+# rồi thay snapshot, session không phải chờ reload.
+@profiled('dashboard.load_and_process_data')
 def load_and_process_data():
-    base_paths = ["data", "../data", "./"]
-    data_path = None
-    for p in base_paths:
-        if os.path.exists(os.path.join(p, "user_acquisition.csv")):
-            data_path = p
-            break
-            
-    if not data_path: return None, None, None, None
-
-    # Load Raw Data
-    df_ua = pd.read_csv(os.path.join(data_path, "user_acquisition.csv"))
-    df_ev = pd.read_csv(os.path.join(data_path, "user_events_flat.csv"))
-    df_iap = pd.read_csv(os.path.join(data_path, "iap_transactions.csv"))
-    df_ads = pd.read_csv(os.path.join(data_path, "ad_impressions.csv"))
-
-    # Convert Datetime
-    df_ua['install_date'] = pd.to_datetime(df_ua['install_date'])
-    df_ev['event_date'] = pd.to_datetime(df_ev['event_date'])
-    df_iap['timestamp'] = pd.to_datetime(df_iap['timestamp'])
-    df_ads['timestamp'] = pd.to_datetime(df_ads['timestamp'])
-
-    # --- Pre-calculate Complex Metrics ---
-    iap_rev = df_iap.groupby('user_id')['price'].sum().rename('iap_rev')
-    ads_rev = df_ads.groupby('user_id')['revenue'].sum().rename('ads_rev')
-    
-    df_master = df_ua.set_index('user_id').join([iap_rev, ads_rev]).fillna(0)
-    df_master['total_revenue'] = df_master['iap_rev'] + df_master['ads_rev']
-    
-    return df_ua, df_ev, df_iap, df_ads, df_master
+    backend = open_backend(os.environ.get(BACKEND_ENV, 'local'), find_data_dir(), os.environ.get(DATASET_ENV))
+    if backend is None: return None
+    return DashboardMetrics(backend)
+
+def source_version():
+    data_dir = find_data_dir()
+    return None if data_dir is None else (data_dir, cube_key(data_dir))
+
+@st.cache_resource
+def load_snapshot_store():
+    return SnapshotStore(load_and_process_data, source_version, refresh_interval()).start()
 
-df_ua, df_ev, df_iap, df_ads, df_master = load_and_process_data()
+# Đọc snapshot một lần: cả lượt rerun dùng cùng một phiên bản dữ liệu
+store = load_snapshot_store()
+snapshot = store.snapshot
+metrics = snapshot.value
 
-if df_ua is None:
+if metrics is None:
     st.error("⚠️ Data not found. Run generate_data.py first.")
     st.stop()
 
@@ -126,48 +136,63 @@ if df_ua is None:
 # ==========================================
 st.sidebar.title("🛠️ Filter Panel")
 
-tiers = df_ua['tier'].unique()
+tiers = metrics.tiers
 selected_tiers = st.sidebar.multiselect("Market Tier", tiers, default=tiers)
 
-df_master_filtered = df_master[df_master['tier'].isin(selected_tiers)]
-valid_users = df_master_filtered.index.tolist()
-
-df_ev_filtered = df_ev[df_ev['user_id'].isin(valid_users)]
-df_iap_filtered = df_iap[df_iap['user_id'].isin(valid_users)]
-df_ads_filtered = df_ads[df_ads['user_id'].isin(valid_users)]
+period_start, period_end = metrics.reporting_period()
+date_range = st.sidebar.date_input("Date Range", value=(period_start, period_end),
+                                   min_value=period_start, max_value=period_end)
+# Đang chọn dở (mới có ngày đầu) -> toàn bộ khoảng
+date_range = tuple(date_range) if isinstance(date_range, (tuple, list)) and len(date_range) == 2 else None
+st.sidebar.caption(f"Backend: `{metrics.backend.name}`. Date range applies to daily, cohort, "
+                   "pack / placement and retention charts.")
+refresh_note = f"auto-refresh every {store.interval:g}s" if store.interval > 0 else "auto-refresh off"
+st.sidebar.caption(f"Data snapshot #{snapshot.generation} loaded "
+                   f"{pd.Timestamp(snapshot.loaded_at, unit='s', tz='UTC'):%Y-%m-%d %H:%M:%S} UTC ({refresh_note}).")
+if store.error is not None:
+    st.sidebar.warning(f"Background refresh failed, serving the previous snapshot: {store.error}")
 
 # ==========================================
 # 4. DASHBOARD TABS
 # ==========================================
+# Dữ liệu vẽ được thu gọn trước khi gửi xuống trình duyệt (analytics/charts.py):
+# chuỗi thời gian rút bằng LTTB, hạng mục / nhóm thừa gộp vào "Other", cột và
+# cohort liền nhau được gộp; trace nhiều điểm vẽ bằng WebGL.
+def scatter_trace(x, y, **kwargs):
+    trace = go.Scattergl if len(x) > WEBGL_POINTS else go.Scatter
+    return trace(x=x, y=y, **kwargs)
+
+def render_mode(n_points):
+    return 'webgl' if n_points > WEBGL_POINTS else 'svg'
+
 st.title("🧟 Zombie Protocol Analytics")
-st.caption(f"Reporting Period: {df_ua['install_date'].min().date()} to {df_ua['install_date'].max().date()}")
+st.caption(f"Reporting Period: {period_start} to {period_end}")
 
-tab_health, tab_ingame, tab_monetization = st.tabs([
+tab_health, tab_ingame, tab_monetization, tab_retention, tab_live = st.tabs([
     "📈 Game Health & Engagement", 
     "🎮 In-Game Analysis (Core Loop)", 
-    "💰 Monetization & LTV"
+    "💰 Monetization & LTV",
+    "🔁 Retention",
+    "⚡ Live Ops"
 ])
 
 # ---------------------------------------------------------------------
 # TAB 1: GAME HEALTH
 # ---------------------------------------------------------------------
-with tab_health:
+with tab_health, span('dashboard.tab.health'):
     st.markdown("### 1. Key Performance Indicators (KPIs)")
     
     c1, c2, c3, c4, c5 = st.columns(5)
     
-    dau_series = df_ev_filtered.groupby('event_date')['user_id'].nunique()
-    avg_dau = int(dau_series.mean())
-    total_rev = df_master_filtered['total_revenue'].sum()
-    total_users = len(df_master_filtered)
-    arpu = total_rev / total_users if total_users > 0 else 0
-    avg_session_duration = df_ev_filtered['duration'].mean() / 60
+    health = metrics.health(selected_tiers, date_range)
+    dau_series = downsample(health['dau_series'])
+    avg_session = health['avg_session_min']
     
-    with c1: st.metric("Avg DAU", f"{avg_dau:,}")
-    with c2: st.metric("Total Revenue", f"${total_rev:,.0f}")
-    with c3: st.metric("ARPU (All Time)", f"${arpu:.2f}")
-    with c4: st.metric("Avg Session", f"{avg_session_duration:.1f} min")
-    with c5: st.metric("Ads Views/User", f"{(len(df_ads_filtered)/total_users):.1f}")
+    with c1: st.metric("Avg DAU", f"{health['avg_dau']:,}")
+    with c2: st.metric("Total Revenue", f"${health['total_rev']:,.0f}")
+    with c3: st.metric("ARPU (All Time)", f"${health['arpu']:.2f}")
+    with c4: st.metric("Avg Session", f"{avg_session:.1f} min" if avg_session is not None else "n/a")
+    with c5: st.metric("Ads Views/User", f"{health['ads_per_user']:.1f}")
     
     st.markdown("---")
     
@@ -175,39 +200,72 @@ with tab_health:
     
     with c_chart1:
         st.subheader("Daily Active Users (DAU) Trend")
-        fig_dau = px.line(dau_series, x=dau_series.index, y=dau_series.values, 
-                          markers=True, line_shape='spline', template='plotly_white') # Light Template
+        mode = render_mode(len(dau_series))
+        fig_dau = px.line(dau_series.reset_index(), x='date', y='dau', render_mode=mode,
+                          markers=mode == 'svg', line_shape='spline' if mode == 'svg' else 'linear',
+                          template='plotly_white') # Light Template
         fig_dau.update_traces(line_color='#2563EB', line_width=3)
         fig_dau.update_layout(xaxis_title="Date", yaxis_title="Active Users", height=350)
-        st.plotly_chart(fig_dau, use_container_width=True)
+        st.plotly_chart(fig_dau, width='stretch')
         
     with c_chart2:
         st.subheader("User Distribution by Tier")
-        tier_counts = df_master_filtered['tier'].value_counts()
+        tier_counts = top_categories(health['tier_counts'])
         fig_pie = px.pie(values=tier_counts.values, names=tier_counts.index, hole=0.6,
                          color_discrete_sequence=px.colors.sequential.RdBu, template='plotly_white')
         fig_pie.update_layout(height=350)
-        st.plotly_chart(fig_pie, use_container_width=True)
+        st.plotly_chart(fig_pie, width='stretch')
+
+    st.subheader("📊 DAU / WAU / MAU & Stickiness")
+    engagement = metrics.engagement(selected_tiers, date_range)
+    fig_eng = go.Figure()
+    for col, color in [('dau', '#2563EB'), ('wau', '#10B981'), ('mau', '#F59E0B')]:
+        points = downsample(engagement[col])
+        fig_eng.add_trace(scatter_trace(points.index, points, mode='lines',
+                                        name=col.upper(), line=dict(color=color, width=2)))
+    points = downsample(engagement['stickiness'])
+    fig_eng.add_trace(scatter_trace(points.index, points, mode='lines',
+                                    name='Stickiness (DAU/MAU)', yaxis='y2',
+                                    line=dict(color='#EF4444', dash='dot', width=2)))
+    fig_eng.update_layout(
+        xaxis_title="Date", yaxis_title="Active Users (HLL estimate)",
+        yaxis2=dict(title="Stickiness", overlaying='y', side='right', tickformat='.0%', rangemode='tozero'),
+        hovermode="x unified", height=400, template='plotly_white'
+    )
+    st.plotly_chart(fig_eng, width='stretch')
+
+    st.subheader("⏱️ Sessions")
+    s1, s2, s3, s4 = st.columns(4)
+    fmt = lambda value, pattern: pattern.format(value) if value is not None else "n/a"
+    with s1: st.metric("Avg Session Length", fmt(avg_session, "{:.1f} min"))
+    with s2: st.metric("Sessions / DAU", fmt(health['sessions_per_dau'], "{:.2f}"))
+    with s3: st.metric("Levels / Session", fmt(health['levels_per_session'], "{:.2f}"))
+    with s4: st.metric("IAP Revenue / Session", fmt(health['revenue_per_session'], "${:.3f}"))
+    session_series = downsample(health['session_series'])
+    if len(session_series):
+        fig_sess = go.Figure(scatter_trace(session_series.index, session_series, mode='lines',
+                                           name='Avg Session', line=dict(color='#8B5CF6', width=2)))
+        fig_sess.update_layout(xaxis_title="Session Start Date", yaxis_title="Minutes",
+                               height=300, template='plotly_white')
+        st.plotly_chart(fig_sess, width='stretch')
+    st.caption("Sessions are rebuilt from the event stream: a new session starts at `session_start` "
+               f"or after {INACTIVITY_GAP // 60} minutes without events.")
 
 # ---------------------------------------------------------------------
 # TAB 2: IN-GAME ANALYSIS
 # ---------------------------------------------------------------------
-with tab_ingame:
+with tab_ingame, span('dashboard.tab.ingame'):
     st.markdown("### 2. Player Journey & Core Loop Analysis")
     
+    max_level = st.slider("Max Level", min_value=1, max_value=max(metrics.max_level, 2),
+                          value=min(FUNNEL_LEVELS, max(metrics.max_level, 1)))
+    ingame = metrics.ingame(selected_tiers, max_level)
+    
     col_funnel, col_stat = st.columns([3, 1])
     
     with col_funnel:
         st.subheader("📍 Level Progression Funnel")
-        user_max_level = df_ev_filtered.groupby('user_id')['level_id'].max()
-        
-        level_range = range(1, 21)
-        funnel_data = []
-        for lvl in level_range:
-            count = user_max_level[user_max_level >= lvl].count()
-            funnel_data.append({'level': f"Lvl {lvl}", 'users': count})
-            
-        df_funnel = pd.DataFrame(funnel_data)
+        df_funnel = ingame['funnel']
         
         fig_funnel = go.Figure(go.Funnel(
             y=df_funnel['level'],
@@ -216,83 +274,101 @@ with tab_ingame:
             marker={"color": "#636EFA"}
         ))
         fig_funnel.update_layout(height=500, title="User Survival Rate by Level", template='plotly_white')
-        st.plotly_chart(fig_funnel, use_container_width=True)
+        st.plotly_chart(fig_funnel, width='stretch')
 
     with col_stat:
         st.subheader("☠️ Top Churn Levels")
-        churn_levels = user_max_level.value_counts().sort_index().head(10)
+        churn_levels = ingame['churn_levels']
         st.dataframe(churn_levels.rename("Churned Users"), height=400)
 
     st.subheader("⚖️ Difficulty Balance (Win vs. Fail Rate)")
-    level_outcomes = df_ev_filtered.groupby(['level_id', 'event_name']).size().unstack(fill_value=0).head(20)
+    level_outcomes = bin_rows(ingame['level_outcomes'])
     
     fig_bar = go.Figure()
-    fig_bar.add_trace(go.Bar(x=level_outcomes.index, y=level_outcomes['level_complete'], name='Win', marker_color='#10B981'))
-    fig_bar.add_trace(go.Bar(x=level_outcomes.index, y=level_outcomes['level_fail'], name='Fail', marker_color='#EF4444'))
+    fig_bar.add_trace(go.Bar(x=level_outcomes.index, y=level_outcomes['wins'], name='Win', marker_color='#10B981'))
+    fig_bar.add_trace(go.Bar(x=level_outcomes.index, y=level_outcomes['fails'], name='Fail', marker_color='#EF4444'))
     
     fig_bar.update_layout(barmode='stack', title="Win/Fail Ratio per Level", height=400, template='plotly_white')
-    st.plotly_chart(fig_bar, use_container_width=True)
+    st.plotly_chart(fig_bar, width='stretch')
+
+    st.subheader("🪙 Gold Economy")
+    economy = metrics.economy(selected_tiers, date_range)
+    latest = economy['latest']
+    ratio = economy['source_sink_ratio']
+    g1, g2, g3, g4, g5 = st.columns(5)
+    with g1: st.metric("Gold Earned", f"{economy['gold_source']:,.0f}")
+    with g2: st.metric("Gold Spent", f"{economy['gold_sink']:,.0f}")
+    with g3: st.metric("Source / Sink Ratio", f"{ratio:.2f}" if ratio is not None else "n/a (no sinks)")
+    with g4: st.metric("Median Balance", f"{latest['median']:,.0f}" if latest is not None else "n/a")
+    with g5: st.metric("P99 Balance", f"{latest['p99']:,.0f}" if latest is not None else "n/a")
+
+    col_wallet_day, col_wallet_level = st.columns(2)
+    quantile_colors = [('median', '#2563EB'), ('p90', '#F59E0B'), ('p99', '#EF4444')]
+    with col_wallet_day:
+        fig_wallet = go.Figure()
+        for col, color in quantile_colors:
+            points = downsample(economy['daily'][col].dropna())
+            fig_wallet.add_trace(scatter_trace(points.index, points, mode='lines',
+                                               name=col, line=dict(color=color, width=2)))
+        fig_wallet.update_layout(title="End-of-Day Gold Balance", xaxis_title="Date", yaxis_title="Gold",
+                                 hovermode="x unified", height=350, template='plotly_white')
+        st.plotly_chart(fig_wallet, width='stretch')
+    with col_wallet_level:
+        by_level = economy['levels'].loc[lambda df: df.index <= max_level]
+        fig_wallet_level = go.Figure()
+        for col, color in quantile_colors:
+            points = by_level[col].dropna()
+            fig_wallet_level.add_trace(scatter_trace(points.index, points, mode='lines',
+                                                     name=col, line=dict(color=color, width=2)))
+        fig_wallet_level.update_layout(title="Gold Balance at First Completion", xaxis_title="Level",
+                                       yaxis_title="Gold", hovermode="x unified", height=350,
+                                       template='plotly_white')
+        st.plotly_chart(fig_wallet_level, width='stretch')
+    st.caption(f"Balances replay every player's gold ledger (level rewards + rewarded ads − spend). "
+               f"Percentiles come from log-scale histograms and read at most {BIN_RATIO - 1:.0%} high; "
+               f"Median / P99 Balance are for the last active day in range.")
 
 # ---------------------------------------------------------------------
 # TAB 3: MONETIZATION & LTV
 # ---------------------------------------------------------------------
-with tab_monetization:
+with tab_monetization, span('dashboard.tab.monetization'):
     st.markdown("### 3. ROI & Economy Analysis")
     
     m1, m2, m3, m4 = st.columns(4)
     
-    paying_users = df_master_filtered[df_master_filtered['iap_rev'] > 0]
-    arppu = paying_users['iap_rev'].mean()
-    avg_cpi = df_master_filtered['cpi'].mean()
+    money = metrics.monetization(selected_tiers, date_range)
     
-    with m1: st.metric("Paying Users", f"{len(paying_users)} ({len(paying_users)/len(df_master_filtered):.1%})")
-    with m2: st.metric("ARPPU", f"${arppu:.2f}")
-    with m3: st.metric("Avg CPI", f"${avg_cpi:.2f}")
-    with m4: st.metric("Ads Revenue %", f"{(df_master_filtered['ads_rev'].sum()/total_rev):.1%}")
+    with m1: st.metric("Paying Users", f"{money['paying_users']} ({money['paying_share']:.1%})")
+    with m2: st.metric("ARPPU", f"${money['arppu']:.2f}")
+    with m3: st.metric("Avg CPI", f"${money['avg_cpi']:.2f}")
+    with m4: st.metric("Ads Revenue %", f"{money['ads_share']:.1%}")
 
     st.markdown("---")
 
     st.subheader("💸 LTV vs. CPI (ROAS Analysis)")
-    
-    # Calculate Data for LTV
-    iap_daily = df_iap_filtered.merge(df_master[['install_date', 'tier']], left_on='user_id', right_index=True)
-    iap_daily['day_diff'] = (iap_daily['timestamp'] - iap_daily['install_date']).dt.days
-    
-    ads_daily = df_ads_filtered.merge(df_master[['install_date', 'tier']], left_on='user_id', right_index=True)
-    ads_daily['day_diff'] = (ads_daily['timestamp'] - ads_daily['install_date']).dt.days
-    
-    iap_agg = iap_daily.groupby(['tier', 'day_diff'])['price'].sum().reset_index().rename(columns={'price': 'rev'})
-    ads_agg = ads_daily.groupby(['tier', 'day_diff'])['revenue'].sum().reset_index().rename(columns={'revenue': 'rev'})
-    total_rev_daily = pd.concat([iap_agg, ads_agg]).groupby(['tier', 'day_diff'])['rev'].sum().reset_index()
+    breakdown = st.selectbox("Breakdown", BREAKDOWNS, index=0)
     
     fig_ltv = go.Figure()
     colors = {'Tier 1': '#EF4444', 'Tier 2': '#F59E0B', 'Tier 3': '#10B981'} # Red, Amber, Green
+    palette = px.colors.qualitative.Plotly
     
-    for tier in selected_tiers:
-        tier_data = total_rev_daily[total_rev_daily['tier'] == tier].sort_values('day_diff')
-        n_users = len(df_master[df_master['tier'] == tier])
+    ltv_curves = metrics.ltv_curves(selected_tiers, breakdown, date_range, max_groups=MAX_CATEGORIES)
+    for i, (group, (group_data, group_cpi)) in enumerate(ltv_curves.items()):
+        max_day = int(group_data['day_diff'].max())
+        color = colors.get(group, palette[i % len(palette)])
+        
+        fig_ltv.add_trace(scatter_trace(
+            group_data['day_diff'], group_data['ltv'],
+            mode='lines+markers', name=f'LTV - {group}',
+            line=dict(color=color, width=3)
+        ))
         
-        if n_users > 0:
-            max_day = 30
-            days_range = pd.DataFrame({'day_diff': range(max_day + 1)})
-            tier_data = days_range.merge(tier_data, on='day_diff', how='left').fillna(0)
-            
-            tier_data['cumulative_rev'] = tier_data['rev'].cumsum()
-            tier_data['ltv'] = tier_data['cumulative_rev'] / n_users
-            tier_cpi = df_master[df_master['tier'] == tier]['cpi'].mean()
-            
-            fig_ltv.add_trace(go.Scatter(
-                x=tier_data['day_diff'], y=tier_data['ltv'],
-                mode='lines+markers', name=f'LTV - {tier}',
-                line=dict(color=colors.get(tier, 'gray'), width=3)
-            ))
-            
-            fig_ltv.add_trace(go.Scatter(
-                x=[0, max_day], y=[tier_cpi, tier_cpi],
-                mode='lines', name=f'CPI - {tier}',
-                line=dict(color=colors.get(tier, 'gray'), dash='dot', width=1),
-                showlegend=False
-            ))
+        fig_ltv.add_trace(go.Scatter(
+            x=[0, max_day], y=[group_cpi, group_cpi],
+            mode='lines', name=f'CPI - {group}',
+            line=dict(color=color, dash='dot', width=1),
+            showlegend=False
+        ))
 
     fig_ltv.update_layout(
         title="Cumulative LTV vs. CPI (Day 0 to Day 30)",
@@ -302,19 +378,123 @@ with tab_monetization:
         height=500,
         template='plotly_white' # Light Template
     )
-    st.plotly_chart(fig_ltv, use_container_width=True)
+    st.plotly_chart(fig_ltv, width='stretch')
 
     c_pack, c_ads = st.columns(2)
     with c_pack:
         st.subheader("📦 Revenue by Pack")
-        pack_rev = df_iap_filtered.groupby('pack')['price'].sum().sort_values(ascending=False)
-        fig_pack = px.bar(pack_rev, x=pack_rev.values, y=pack_rev.index, orientation='h', 
-                          color=pack_rev.values, color_continuous_scale='Blues', template='plotly_white')
-        st.plotly_chart(fig_pack, use_container_width=True)
+        pack_rev = top_categories(money['pack_rev'])
+        fig_pack = px.bar(pack_rev.reset_index(), x='revenue', y='pack', orientation='h', 
+                          color='revenue', color_continuous_scale='Blues', template='plotly_white')
+        st.plotly_chart(fig_pack, width='stretch')
         
     with c_ads:
         st.subheader("📺 Ads Performance")
-        ads_place = df_ads_filtered.groupby('placement')['revenue'].sum()
+        ads_place = top_categories(money['ads_place'])
         fig_ads = px.pie(values=ads_place.values, names=ads_place.index, hole=0.4, 
                          title="Ads Revenue Share", template='plotly_white')
-        st.plotly_chart(fig_ads, use_container_width=True)
+        st.plotly_chart(fig_ads, width='stretch')
+
+# ---------------------------------------------------------------------
+# TAB 4: RETENTION
+# ---------------------------------------------------------------------
+with tab_retention, span('dashboard.tab.retention'):
+    st.markdown("### 4. Cohort Retention")
+
+    max_day = st.slider("Max Day", 7, 60, 30, key="retention_max_day")
+    retention = metrics.retention(selected_tiers, max_day, date_range)
+
+    r1, r2, r3 = st.columns(3)
+    for col, (day, rate) in zip((r1, r2, r3), retention['kpi'].items()):
+        with col: st.metric(f"D{day} Retention", "n/a" if rate is None else f"{rate:.1%}")
+
+    cohort_users, rates, cohort_size = coarsen_cohorts(retention['users'])
+    fig_ret = go.Figure(go.Heatmap(
+        z=rates.to_numpy(), x=[f"D{d}" for d in rates.columns],
+        y=[d.strftime('%Y-%m-%d') for d in rates.index],
+        customdata=cohort_users.to_numpy(),
+        colorscale='Greens', zmin=0, zmax=1,
+        hovertemplate="Cohort %{y}<br>%{x}: %{z:.1%} (%{customdata:,.0f} users)<extra></extra>"
+    ))
+    fig_ret.update_layout(
+        title="Retention by Cohort (first active day)",
+        xaxis_title="Days Since First Active",
+        yaxis=dict(title="Cohort", autorange='reversed'),
+        height=600,
+        template='plotly_white'
+    )
+    if cohort_size > 1:
+        st.caption(f"Each row groups {cohort_size} consecutive daily cohorts (labelled by the first).")
+    st.plotly_chart(fig_ret, width='stretch')
+
+    st.subheader("🧍 Player Activity (Lifetime)")
+    st.caption("Per-user totals over all data; not affected by the date range.")
+    activity = metrics.activity(selected_tiers)
+    a1, a2, a3, a4 = st.columns(4)
+    with a1: st.metric("Avg Active Days", f"{activity['avg_active_days']:.1f}")
+    with a2: st.metric("Sessions / User", f"{activity['sessions_per_user']:.1f}")
+    with a3: st.metric("Avg Max Level", f"{activity['avg_max_level']:.1f}")
+    with a4: st.metric(f"Lapsed ({LAPSED_DAYS}d+ inactive)", f"{activity['lapsed_share']:.1%}")
+
+    active_days = bin_rows(activity['active_days'].to_frame('users'))
+    fig_days = go.Figure(go.Bar(x=active_days.index.astype(str), y=active_days['users'], marker_color='#2563EB'))
+    fig_days.update_layout(title="Users by Active Days", xaxis_title="Active Days", yaxis_title="Users",
+                           height=350, template='plotly_white')
+    st.plotly_chart(fig_days, width='stretch')
+
+# ---------------------------------------------------------------------
+# TAB 5: LIVE OPS (REALTIME)
+# ---------------------------------------------------------------------
+# Luồng event của `generate_data.py --stream`: mỗi lần refresh chỉ đọc các
+# dòng mới của log và cộng vào cửa sổ thời gian (analytics/realtime.py).
+@st.cache_resource
+def load_realtime_feed():
+    return RealtimeFeed(LogTail(stream_log_path(find_data_dir() or "data")))
+
+@st.fragment(run_every=2)
+def live_panel(selected_tiers):
+    feed = load_realtime_feed()
+    with span('dashboard.realtime_refresh'):
+        feed.refresh()
+    if not feed.windows.events_seen:
+        st.info("No live stream yet. Start one with `python data_generator/generate_data.py --stream --data-dir data`.")
+        return
+
+    snap = feed.windows.snapshot(selected_tiers)
+    l1, l2, l3, l4 = st.columns(4)
+    with l1: st.metric("Live CCU (60s)", f"{snap['ccu']:,}")
+    with l2: st.metric("Events / sec", f"{snap['events_per_sec']:,.0f}")
+    with l3: st.metric("Revenue / min", f"${snap['revenue_per_min']:,.2f}")
+    with l4: st.metric("Level Fail Rate (5 min)", "n/a" if snap['fail_rate'] is None else f"{snap['fail_rate']:.1%}")
+
+    series = feed.windows.series(selected_tiers).reset_index()
+    c_rate, c_rev = st.columns(2)
+    with c_rate:
+        fig_rate = px.line(series, x='time', y='events_per_sec', template='plotly_white')
+        fig_rate.update_traces(line_color='#2563EB', line_width=2)
+        fig_rate.update_layout(title="Events / sec (10s windows)", xaxis_title="Time (UTC)", height=320)
+        st.plotly_chart(fig_rate, width='stretch')
+    with c_rev:
+        fig_rev = px.bar(series, x='time', y='revenue', template='plotly_white')
+        fig_rev.update_traces(marker_color='#10B981')
+        fig_rev.update_layout(title="Revenue per 10s window", xaxis_title="Time (UTC)", height=320)
+        st.plotly_chart(fig_rev, width='stretch')
+
+with tab_live:
+    st.markdown("### 5. Live Ops Monitor")
+    live_panel(selected_tiers)
+
+# ---------------------------------------------------------------------
+# PERFORMANCE PANEL (ZOMBIE_PROFILE)
+# ---------------------------------------------------------------------
+# Span của các lần chạy trong process này (analytics/profiling.py); đặt cuối
+# script để gồm cả thời gian dựng các tab của lần rerun hiện tại.
+if PROFILER.enabled:
+    with st.sidebar.expander("⏱️ Performance", expanded=False):
+        st.caption(f"Profiling mode: `{PROFILER.mode}` ({PROFILE_ENV})")
+        st.dataframe(PROFILER.summary().round(2), width='stretch')
+        st.download_button("Export JSON", PROFILER.to_json(), file_name="profile.json", mime="application/json")
+        st.download_button("Export Chrome trace", PROFILER.to_chrome_trace(), file_name="trace.json",
+                           mime="application/json")
+        if st.button("Clear spans"):
+            PROFILER.clear()
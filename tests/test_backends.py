@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from analytics.backends import DATE_COLUMNS, NON_ADDITIVE, ArrowBackend, CubeBackend, LocalBackend, open_backend
+from analytics.cube import CUBE_KEYS, get_cubes
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp('data')
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'data_generator', 'generate_data.py'),
+                    '--users', '300', '--seed', '7', '--data-dir', str(path)],
+                   check=True, capture_output=True)
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def backends(data_dir):
+    pytest.importorskip('google.cloud.bigquery')
+    local = LocalBackend(get_cubes(data_dir))  # Đồng thời lưu data/cubes cho backend arrow
+    return [local, ArrowBackend.from_data_dir(data_dir), open_backend('fake', data_dir)]
+
+
+def _normalized(frame):
+    frame = frame.copy()
+    frame.index = frame.index.map(str) if frame.index.nlevels == 1 else \
+        pd.MultiIndex.from_frame(frame.index.to_frame().astype(str))
+    return frame.sort_index().astype(float)
+
+
+@pytest.mark.parametrize('cube_name', [name for name in CUBE_KEYS if name != 'engagement'])
+def test_rollups_agree(backends, cube_name):
+    local = backends[0]
+    tier = local.distinct('users', 'tier')[0]
+    period = None
+    if cube_name in DATE_COLUMNS:
+        dates = local.query(cube_name, [DATE_COLUMNS[cube_name]]).index
+        period = (dates.min(), dates.min() + pd.Timedelta(days=10)) if len(dates) else None
+    by = [key for key in CUBE_KEYS[cube_name] if key not in NON_ADDITIVE][:2]
+    expected = _normalized(local.query(cube_name, by, {'tier': [tier]}, period)) if by else None
+    totals = local.query(cube_name, (), {'tier': [tier]}, period).astype(float)
+    for backend in backends[1:]:
+        if by:
+            frame = _normalized(backend.query(cube_name, by, {'tier': [tier]}, period))
+            pd.testing.assert_frame_equal(frame, expected, check_dtype=False, check_names=False, obj=backend.name)
+        pd.testing.assert_series_equal(backend.query(cube_name, (), {'tier': [tier]}, period).astype(float),
+                                       totals, check_names=False, obj=backend.name)
+
+
+def test_distinct_agree(backends):
+    expected = backends[0].distinct('users', 'tier')
+    for backend in backends[1:]:
+        assert backend.distinct('users', 'tier') == expected
+
+
+def test_engagement_cells_agree(backends):
+    tier = backends[0].distinct('users', 'tier')[0]
+
+    def sketches(backend):
+        cells = backend.cells('engagement', ['date', 'source', 'country', 'os', 'registers'], {'tier': [tier]})
+        keys = zip(pd.to_datetime(cells['date']), *(cells[dim].astype(str) for dim in ('source', 'country', 'os')))
+        return dict(zip(keys, map(bytes, cells['registers'])))
+    expected = sketches(backends[0])
+    assert expected
+    for backend in backends[1:]:
+        assert sketches(backend) == expected, backend.name
+
+
+def test_backend_base_is_abstract():
+    with pytest.raises(TypeError):
+        CubeBackend()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from analytics.economy import BIN_RATIO, GoldLedger, balance_bins, group_quantiles, histogram_quantiles
+
+NAN = np.nan
+# (user, thời gian, ngày, nguồn, tiêu, level_id, qua level); input xen kẽ hai user
+ENTRIES = [
+    ('b', 10, 1, 20, 0, NAN, False),
+    ('a', 5, 1, 100, 0, 1, True),
+    ('a', 20, 1, 20, 0, NAN, False),
+    ('b', 30, 2, 500, 0, 5, True),
+    ('a', 40, 2, 50, 0, 2, True),
+    ('b', 50, 1, 0, 600, NAN, False),  # event_date theo ngày bắt đầu session
+    ('a', 60, 2, 0, 70, NAN, False),
+    ('a', 70, 2, 0, 0, NAN, False),  # không có dòng tiền -> bị bỏ
+    ('a', 80, 2, 10, 0, 2, True),  # qua lại level 2
+]
+
+
+@pytest.fixture
+def ledger():
+    users, timestamps, _, source, sink, levels, complete = map(np.array, zip(*ENTRIES))
+    return GoldLedger.from_flows(users, timestamps, source, sink, levels.astype(float), complete)
+
+
+def _by_entry(ledger, positions, values):
+    users = np.array([entry[0] for entry in ENTRIES])[ledger.row[positions]]
+    return dict(zip(zip(users, ledger.timestamp[positions]), values))
+
+
+def test_balances_and_levels_per_user(ledger):
+    assert len(ledger) == len(ENTRIES) - 1
+    everything = np.arange(len(ledger))
+    # Số dư reset ở đầu mỗi user
+    assert _by_entry(ledger, everything, ledger.balance) == {
+        ('a', 5): 100, ('a', 20): 120, ('a', 40): 170, ('a', 60): 100, ('a', 80): 110,
+        ('b', 10): 20, ('b', 30): 520, ('b', 50): -80}
+    # Level đang chơi của b không kế thừa level đã qua của a
+    assert _by_entry(ledger, everything, ledger.level) == {
+        ('a', 5): 1, ('a', 20): 2, ('a', 40): 2, ('a', 60): 3, ('a', 80): 2,
+        ('b', 10): 1, ('b', 30): 5, ('b', 50): 6}
+
+
+def test_day_ends_and_level_firsts(ledger):
+    days = np.array([entry[2] for entry in ENTRIES])[ledger.row]
+    ends = ledger.day_ends(days)
+    assert sorted(_by_entry(ledger, ends, zip(days[ends], ledger.balance[ends])).items()) == [
+        (('a', 20), (1, 120)), (('a', 80), (2, 110)), (('b', 30), (2, 520)), (('b', 50), (1, -80))]
+    firsts = ledger.level_firsts()
+    assert sorted(_by_entry(ledger, firsts, zip(ledger.level[firsts], ledger.balance[firsts])).items()) == [
+        (('a', 5), (1, 100)), (('a', 40), (2, 170)), (('b', 30), (5, 520))]
+
+
+def test_histogram_quantiles_within_bin_ratio():
+    rng = np.random.default_rng(3)
+    groups = rng.integers(0, 20, 5_000)
+    balance = np.ceil(rng.lognormal(6, 2, len(groups)))  # Số dư nguyên > 0 như sổ cái
+    exact = group_quantiles(groups, balance)
+    cells, counts = np.unique(np.stack([groups, balance_bins(balance)]), axis=1, return_counts=True)
+    approx = histogram_quantiles(cells[0], cells[1], counts)
+    for name in exact:
+        assert np.all(approx[name] >= exact[name]), name
+        assert np.all(approx[name] <= exact[name] * BIN_RATIO), name
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics.engagement import EngagementSketches, exact_table, precision_for_error, sketch_cells
+from analytics.sources import read_sources
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS = ['dau', 'wau', 'mau']
+
+
+@pytest.fixture(scope='module')
+def sessions(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('engagement'))
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'data_generator', 'generate_data.py'),
+                    '--users', '2000', '--seed', '5', '--data-dir', path],
+                   check=True, capture_output=True)
+    ua, events, _, _ = read_sources(path)
+    # Giống sql/04_engagement_kpi.sql: active = có session_start
+    sessions = events[events['event_name'].astype(str) == 'session_start']
+    tier = sessions['user_id'].map(ua.set_index('user_id')['tier'])
+    return sessions.assign(tier=pd.factorize(tier, sort=True)[0])
+
+
+@pytest.mark.parametrize('error', [0.1, 0.05])
+def test_sketch_table_within_three_sigma(sessions, error):
+    cells = sketch_cells(sessions['event_date'], sessions['user_id'], np.zeros(len(sessions)), error)
+    table = EngagementSketches.from_cells(cells).table()
+    exact = exact_table(sessions['event_date'], sessions['user_id'])
+    assert exact['mau'].max() > 2.5 * (1 << precision_for_error(error))  # Có ô ngoài vùng linear counting
+    sigma = 1.04 / np.sqrt(1 << precision_for_error(error))
+    relative = (table[METRICS] / exact[METRICS] - 1).abs()
+    assert (relative <= 3 * sigma).all().all(), relative.max().to_dict()
+
+
+def test_merged_tier_sketches_equal_union_sketch(sessions):
+    by_tier = sketch_cells(sessions['event_date'], sessions['user_id'], sessions['tier'])
+    assert by_tier['group'].nunique() > 1
+    union = sketch_cells(sessions['event_date'], sessions['user_id'], np.zeros(len(sessions)))
+    merged, expected = EngagementSketches.from_cells(by_tier), EngagementSketches.from_cells(union)
+    np.testing.assert_array_equal(merged.dates, expected.dates)
+    np.testing.assert_array_equal(merged.registers, expected.registers)
+    # Gộp theo cửa sổ ngày cũng không phụ thuộc cách chia segment
+    assert merged.unique_users() == expected.unique_users()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from analytics.features import build_features, update_features
+from analytics.sources import AD_COLUMNS, IAP_COLUMNS, UA_COLUMNS, read_sources
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENERATOR = os.path.join(ROOT_DIR, 'data_generator', 'generate_data.py')
+
+
+def _generate(*args):
+    subprocess.run([sys.executable, GENERATOR, *args], check=True, capture_output=True)
+
+
+@pytest.fixture(scope='module')
+def base_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('features'))
+    _generate('--users', '300', '--seed', '11', '--checkpoint', '--data-dir', path)
+    return path
+
+
+@pytest.fixture
+def data_dir(base_dir, tmp_path):
+    path = str(tmp_path / 'data')
+    shutil.copytree(base_dir, path)
+    return path
+
+
+def _assert_full_build(features, data_dir):
+    expected = build_features(*read_sources(data_dir))
+    pd.testing.assert_frame_equal(features.reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_append_days_fold_matches_full_build(data_dir):
+    _, new, full = update_features(data_dir)
+    assert full and new
+    for _ in range(2):
+        _generate('--append-days', '1', '--new-users-per-day', '20', '--data-dir', data_dir)
+        features, new, full = update_features(data_dir)
+        assert not full
+        assert new and all(path.startswith('increments') for path in new)
+    _assert_full_build(features, data_dir)
+
+
+def test_rewritten_file_triggers_rebuild(data_dir):
+    update_features(data_dir)
+    _generate('--append-days', '1', '--data-dir', data_dir)
+    update_features(data_dir)
+    path = os.path.join(data_dir, 'user_events_flat.csv')
+    with open(path, 'rb') as file:
+        lines = file.readlines()
+    with open(path, 'wb') as file:
+        file.writelines(lines[:len(lines) // 2])
+    features, new, full = update_features(data_dir)
+    assert full
+    _assert_full_build(features, data_dir)
+
+
+def test_overlapping_date_triggers_rebuild(data_dir):
+    _generate('--append-days', '1', '--data-dir', data_dir)
+    update_features(data_dir)
+    # Một partition khác chứa lại ngày đã gộp
+    day = sorted(os.listdir(os.path.join(data_dir, 'increments')))[0]
+    shutil.copytree(os.path.join(data_dir, 'increments', day), os.path.join(data_dir, 'increments', day + '_copy'))
+    features, new, full = update_features(data_dir)
+    assert full
+    _assert_full_build(features, data_dir)
+
+
+def test_session_spanning_batches_is_counted_once():
+    ua = pd.DataFrame([['u1', '2025-11-01', 'Organic', 'Organic', 'Vietnam', 'Tier 3', 'Android', 0.0]],
+                      columns=UA_COLUMNS)
+    events = pd.DataFrame({
+        'user_id': 'u1',
+        'event_date': pd.to_datetime(['2025-11-01', '2025-11-01', '2025-11-02', '2025-11-02']),
+        'event_timestamp': pd.to_datetime(['2025-11-01 23:50', '2025-11-01 23:55', '2025-11-02 00:10',
+                                           '2025-11-02 10:00']).astype('int64') // 1000,
+        'event_name': ['session_start', 'level_start', 'level_start', 'session_start'],
+        'level_id': [None, 1, 2, None], 'gold_earned': None, 'price': None,
+    })
+    iap, ads = pd.DataFrame(columns=IAP_COLUMNS), pd.DataFrame(columns=AD_COLUMNS)
+    day1 = build_features(ua, events[:2], iap, ads)
+    folded = build_features(ua[:0], events[2:], iap, ads, previous=day1)
+    # 23:50 -> 00:10 là một session (cách 15 phút), 10:00 là session thứ hai
+    assert folded['sessions'].tolist() == [2]
+    pd.testing.assert_frame_equal(folded, build_features(ua, events, iap, ads), check_dtype=False)
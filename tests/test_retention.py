@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from analytics.retention import RetentionBitmap, retention_kpi
+
+
+def test_offsets_count_calendar_days_across_gap():
+    # Không có event ngày 02/11: lần quay lại ngày 03/11 là D2 (DATE_DIFF = 2), không phải D1
+    matrix = RetentionBitmap.from_events(['2025-11-01', '2025-11-01', '2025-11-03'], [0, 1, 0]).retention()
+    assert list(matrix.columns) == [0, 1, 2]
+    assert matrix.loc['2025-11-01'].tolist() == [2, 0, 1]
+    kpi = retention_kpi(matrix, days=(1, 2))
+    assert kpi[['cohort_size', 'd1_retention', 'd2_retention']].values.tolist() == [[2, 0, 1]]
+
+
+def test_matches_date_diff_reference():
+    rng = np.random.default_rng(7)
+    days = pd.to_datetime('2025-11-01') + pd.to_timedelta(rng.choice([0, 1, 3, 4, 8, 9], 500), unit='D')
+    users = rng.integers(0, 60, 500)
+    matrix = RetentionBitmap.from_events(days, users).retention()
+
+    events = pd.DataFrame({'user': users, 'date': days}).drop_duplicates()
+    cohort = events.groupby('user')['date'].transform('min')
+    events['n'] = (events['date'] - cohort).dt.days
+    expected = events.assign(cohort_date=cohort).groupby(['cohort_date', 'n']).size()
+    for (cohort_date, n), users_active in expected.items():
+        assert matrix.loc[cohort_date, n] == users_active
+    assert matrix.fillna(0).to_numpy().sum() == expected.sum()
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics.sessions import STREAM_COLUMNS, kind_codes, sessionize, stream_sessions
+from analytics.sources import event_batches, read_sources
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUCKETS, BATCH_ROWS, GAP = 7, 5_000, 600
+
+
+@pytest.fixture(scope='module', params=['text', 'parquet'])
+def data_dir(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp(request.param)
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'data_generator', 'generate_data.py'),
+                    '--users', '300', '--seed', '13', '--format', request.param, '--data-dir', str(path)],
+                   check=True, capture_output=True)
+    return str(path)
+
+
+def _sorted(frame):
+    return frame.sort_values(['user', 'start']).reset_index(drop=True)
+
+
+def test_spilled_buckets_match_in_memory_sessionize(data_dir, tmp_path):
+    assert sum(1 for _ in event_batches(data_dir, STREAM_COLUMNS, BATCH_ROWS)) > 1
+    frames = list(stream_sessions(data_dir, BUCKETS, GAP, BATCH_ROWS, work_dir=str(tmp_path)))
+    assert len(frames) == BUCKETS and sum(len(frame) > 0 for frame in frames) > 1
+    assert not os.listdir(tmp_path)  # File bucket tạm đã được xóa
+    streamed = _sorted(pd.concat(frames, ignore_index=True))
+
+    events = read_sources(data_dir)[1]
+    users = pd.util.hash_array(events['user_id'].astype(object).to_numpy(), categorize=False)
+    expected = _sorted(sessionize(users, events['event_timestamp'].to_numpy(dtype=np.int64),
+                                  kind_codes(events['event_name']), events['price'].to_numpy(dtype=float), GAP))
+
+    assert len(streamed) == len(expected)
+    for column in ('user', 'start', 'events', 'levels', 'ads'):
+        np.testing.assert_array_equal(streamed[column].to_numpy(), expected[column].to_numpy(), err_msg=column)
+    for column in ('duration_s', 'revenue'):
+        np.testing.assert_allclose(streamed[column].to_numpy(), expected[column].to_numpy(), err_msg=column)